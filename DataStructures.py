@@ -4,11 +4,19 @@ from dateutil.relativedelta import relativedelta
 from dataclasses import dataclass, field
 from pathlib import Path
 import pandas as pd
-import yfinance as yf
+import json
 import time
 from datetime import date
 DATA_ROOT = Path("data/market")
 
+# Price index modes:
+#   "calendar": every calendar day, forward-filled over weekends/holidays (legacy)
+#   "business": only days the exchange actually traded (no filled rows)
+INDEX_MODES = ("calendar", "business")
+
+# OHLCV store: exchange trading days only (volume cannot be forward-filled)
+OHLCV_DTYPES = {"Open": "float32", "High": "float32", "Low": "float32", "Close": "float32", "Volume": "int64"}
+
 class TimePeriod(Enum):
     WEEK = timedelta(weeks=1)
     MONTH = relativedelta(months=1)
@@ -22,18 +30,88 @@ class TimePeriod(Enum):
             end = start + self.value
             return (end - start).days
             
+# Intraday bars: one exchange session of the European cash markets in TICKERS
+# (09:00-17:30 local), 252 sessions a year.
+SESSION_MINUTES = 510
+SESSIONS_PER_YEAR = 252
+
+
+class BarFrequency(Enum):
+    MIN1 = "1m"
+    MIN5 = "5m"
+    MIN15 = "15m"
+    MIN30 = "30m"
+    HOUR1 = "1h"
+    DAY1 = "1d"
+
+    @property
+    def minutes(self) -> int | None:
+        return None if self is BarFrequency.DAY1 else {"m": 1, "h": 60}[self.value[-1]] * int(self.value[:-1])
+
+    def bars_per_day(self, session_minutes: int = SESSION_MINUTES) -> int:
+        return 1 if self is BarFrequency.DAY1 else -(-session_minutes // self.minutes)
+
+    def periods_per_year(self, session_minutes: int = SESSION_MINUTES) -> float:
+        """Annualisation factor (Sharpe * sqrt of it)."""
+        return float(SESSIONS_PER_YEAR * self.bars_per_day(session_minutes))
+
+    def bars(self, days: float, session_minutes: int = SESSION_MINUTES) -> int:
+        """Window length in bars for a span given in trading days (e.g. z over 30 days)."""
+        return max(1, int(round(days * self.bars_per_day(session_minutes))))
+
 # May also be useful:
 # today = date.today()
 # next_week = today + TimePeriod.WEEK.value
 # next_month = today + TimePeriod.MONTH.value
 
 
+# Fixed-date closures shared by the universe's exchanges (Euronext, XETRA, LSE, Borsa
+# Italiana): not trading days even where the data alone cannot tell (the first row)
+FIXED_HOLIDAYS = ((1, 1), (12, 25), (12, 26))
+# bump when derive_trading_days changes: business-day copies derived by an older rule are redone
+CALENDAR_VERSION = 2
+
+
+def _new_close(c: pd.DataFrame) -> pd.Series:
+    # rows on which at least one column printed a close different from the previous row
+    return (c.ne(c.shift(1)) & c.notna()).any(axis=1)
+
+
+def derive_trading_days(closes: pd.DataFrame | pd.Series, universe: pd.DataFrame | None = None) -> pd.DatetimeIndex:
+    """
+    Trading days implied by calendar-day, forward-filled closes: weekdays outside
+    FIXED_HOLIDAYS on which at least one column printed a new close. Passing all tickers
+    of one exchange gives that exchange's calendar (a filled holiday repeats the previous
+    close everywhere). A single column keeps every such weekday with a close: one stock
+    closing unchanged is a real session, not evidence of a holiday. Unless `universe`
+    (the closes of the other exchanges) is given: then a repeated close is dropped on
+    days none of them printed either (Good Friday, Easter Monday, 1 May when it is a UK
+    bank holiday); a holiday of its own exchange while the others traded stays a bar.
+    """
+    c = closes.to_frame() if isinstance(closes, pd.Series) else closes
+    c = c.sort_index()
+    month_day = c.index.month * 100 + c.index.day
+    open_day = (c.index.dayofweek < 5) & ~month_day.isin([m * 100 + d for m, d in FIXED_HOLIDAYS])
+    if c.shape[1] > 1:
+        printed = _new_close(c)
+    else:
+        printed = c.notna().any(axis=1)
+        if universe is not None:
+            elsewhere = _new_close(universe.sort_index()).reindex(c.index, fill_value=False)
+            printed &= _new_close(c) | elsewhere
+    return c.index[printed & open_day]
+
 
 @dataclass
 class Enterprise:
     ticker: str
     currency: str | None = None
     meta: dict = field(default_factory=dict)
+    index_mode: str = "calendar"    # see INDEX_MODES
+
+    def __post_init__(self):
+        if self.index_mode not in INDEX_MODES:
+            raise ValueError(f"index_mode must be one of {INDEX_MODES}, got {self.index_mode!r}")
 
     @property
     def price_store(self) -> Path:
@@ -43,6 +121,84 @@ class Enterprise:
     def cache_file(self) -> Path:
         return self.price_store / "close.parquet"
 
+    @property
+    def ohlcv_file(self) -> Path:
+        return self.price_store / "ohlcv.parquet"
+
+    @property
+    def business_file(self) -> Path:
+        # business-day copy of a legacy calendar-day cache (derived, git-ignored); the
+        # calendar cache itself is never rewritten
+        return DATA_ROOT / "cache" / "business" / f"ticker={self.ticker}" / "close.parquet"
+
+    @property
+    def coverage_file(self) -> Path:
+        # requested range covered by the cache + its index mode (a business-day cache
+        # does not start/end exactly on the requested dates)
+        return self.price_store / "coverage.json"
+
+    def _read_coverage(self, cache: pd.DataFrame, dataset: str = "close") -> dict:
+        cov = json.loads(self.coverage_file.read_text()) if self.coverage_file.exists() else {}
+        if dataset != "close":
+            cov = cov.get(dataset, {})
+        if "start" in cov:
+            return {"start": pd.Timestamp(cov["start"]), "end": pd.Timestamp(cov["end"]),
+                    "index_mode": cov.get("index_mode", "calendar")}
+        # no record: coverage = the cache's own index (legacy close caches are calendar-day)
+        return {"start": cache.index.min(), "end": cache.index.max(),
+                "index_mode": "calendar" if dataset == "close" else "business"}
+
+    def _write_coverage(self, start: pd.Timestamp, end: pd.Timestamp, index_mode: str, dataset: str = "close") -> None:
+        # close coverage at the top level (legacy layout), other datasets under their own key
+        cov = json.loads(self.coverage_file.read_text()) if self.coverage_file.exists() else {}
+        entry = {"start": start.strftime("%Y-%m-%d"), "end": end.strftime("%Y-%m-%d"), "index_mode": index_mode}
+        if dataset == "close":
+            cov.update(entry)
+        else:
+            cov[dataset] = entry
+        self.coverage_file.write_text(json.dumps(cov))
+
+    def _read_cache(self) -> pd.DataFrame:
+        cache = pd.read_parquet(self.cache_file)
+        cache.index = pd.to_datetime(cache.index).tz_localize(None)
+        cache.index.name = "Date"
+        cache = cache.sort_index()
+        if "Close" not in cache.columns:
+            cache.columns = ["Close"]  # safety if column name lost
+        return cache
+
+    def _cache_signature(self) -> dict:
+        st = self.cache_file.stat()
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "calendar": CALENDAR_VERSION}
+
+    def business_copy_current(self) -> bool:
+        """True if business_file was derived from the calendar cache as it is now."""
+        sig = self.business_file.with_name("source.json")
+        return (self.business_file.exists() and sig.exists()
+                and json.loads(sig.read_text()) == self._cache_signature())
+
+    def migrate_cache(self, trading_days: pd.DatetimeIndex | None = None) -> bool:
+        """
+        Derive the business-day copy (business_file) of a calendar-day cache, keeping the
+        rows in `trading_days` (e.g. the exchange calendar from derive_trading_days over
+        all its tickers) or, if None, derive_trading_days of this ticker alone.
+        The calendar cache is left untouched. Returns False if there was nothing to do
+        (no cache, already a business-day cache, or business_file is current).
+        """
+        if not self.cache_file.exists():
+            return False
+        cache = self._read_cache()
+        cov = self._read_coverage(cache)
+        if cov["index_mode"] == "business" or cache.empty:
+            return False
+        if trading_days is None and self.business_copy_current():
+            return False
+        days = derive_trading_days(cache["Close"]) if trading_days is None else trading_days
+        self.business_file.parent.mkdir(parents=True, exist_ok=True)
+        cache.loc[cache.index.isin(days)].to_parquet(self.business_file)
+        self.business_file.with_name("source.json").write_text(json.dumps(self._cache_signature()))
+        return True
+
     @property
     def meta_path(self) -> Path:
         return DATA_ROOT / "meta" / f"{self.ticker}.json"
@@ -59,6 +215,7 @@ class Enterprise:
 
         # If none of the scenarios above happen we want to do an API call
         # yfinance can be flaky/slow; simple retry
+        import yfinance as yf  # deferred: only needed on a cache miss
         last_err = None
         for _ in range(3):
             try:
@@ -84,10 +241,12 @@ class Enterprise:
         pd.DataFrame([self.meta]).to_json(self.meta_path, orient="records", indent=2)
         return self.meta
 
-    def _download_close(self, start: str, end: str) -> pd.DataFrame:
+    def _download_close(self, start: str, end: str, index_mode: str | None = None) -> pd.DataFrame:
+        index_mode = self.index_mode if index_mode is None else index_mode
         AUTO_ADJUST = True # include split/dividendt-adjusted prices
         end_plus = (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
         # Simple retry for transient failures
+        import yfinance as yf  # deferred: only needed on a cache miss
         last_err = None
         for _ in range(3):
             try:
@@ -111,6 +270,8 @@ class Enterprise:
 
         if df.empty:
             # Return an empty DataFrame with full index so caller can seed with last close
+            if index_mode == "business":
+                return pd.DataFrame(index=pd.DatetimeIndex([], name="Date"), columns=["Close"], dtype=float)
             return pd.DataFrame(index=full_idx, columns=["Close"])
 
         df = df[["Close"]].copy()
@@ -119,6 +280,9 @@ class Enterprise:
         df.index.name = "Date"
         df["Close"] = pd.to_numeric(df["Close"], errors="coerce")
         df = df.sort_index()
+        if index_mode == "business":
+            # exchange trading days only, exactly as printed
+            return df.dropna()
 
         # Reindex to all days in range, forward-fill within this segment
         df = df.reindex(full_idx).ffill()
@@ -126,33 +290,101 @@ class Enterprise:
         return df
 
 
+    def _download_ohlcv(self, start: str, end: str) -> pd.DataFrame:
+        end_plus = (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        import yfinance as yf  # deferred: only needed on a cache miss
+        last_err = None
+        for _ in range(3):
+            try:
+                df = yf.download(self.ticker, start=start, end=end_plus, progress=False,
+                                 auto_adjust=True, threads=True)
+                break
+            except Exception as e:
+                last_err = e
+                time.sleep(0.6)
+        else:
+            raise RuntimeError(f"Download failed for {self.ticker}: {last_err}")
+
+        if isinstance(df.columns, pd.MultiIndex):  # (field, ticker) columns
+            df.columns = df.columns.get_level_values(0)
+        df = df.reindex(columns=list(OHLCV_DTYPES))
+        df.index = pd.to_datetime(df.index).tz_localize(None)
+        df.index.name = "Date"
+        df = df.apply(pd.to_numeric, errors="coerce").dropna(subset=["Close"]).sort_index()
+        df["Volume"] = df["Volume"].fillna(0)
+        return df.astype(OHLCV_DTYPES)
+
+    def fetch_ohlcv(self, start="2020-01-01", end="2025-01-01", force=False) -> pd.DataFrame:
+        """
+        Daily Open/High/Low/Close (float32) and Volume (int64) on exchange trading days,
+        cached as ohlcv.parquet next to close.parquet and extended by missing segments only.
+        """
+        start_ts, end_ts = pd.Timestamp(start), pd.Timestamp(end)
+        self.price_store.mkdir(parents=True, exist_ok=True)
+        cache = pd.read_parquet(self.ohlcv_file) if self.ohlcv_file.exists() and not force else None
+
+        segments = [(start_ts, end_ts)]
+        if cache is not None and not cache.empty:
+            cov = self._read_coverage(cache, dataset="ohlcv")
+            have_start, have_end = cov["start"], cov["end"]
+            segments = []
+            if start_ts < have_start:
+                segments.append((start_ts, min(end_ts, have_start - pd.Timedelta(days=1))))
+            if end_ts > have_end:
+                segments.append((max(start_ts, have_end + pd.Timedelta(days=1)), end_ts))
+            start_ts, end_ts = min(start_ts, have_start), max(end_ts, have_end)
+
+        if segments:
+            parts = [cache] if cache is not None else []
+            for seg_start, seg_end in segments:
+                if seg_start <= seg_end:
+                    parts.append(self._download_ohlcv(seg_start.strftime("%Y-%m-%d"), seg_end.strftime("%Y-%m-%d")))
+            cache = pd.concat([p for p in parts if not p.empty]) if any(not p.empty for p in parts) else None
+            if cache is None:
+                raise ValueError(f"No OHLCV data available for {self.ticker} in {start}..{end}")
+            cache = cache[~cache.index.duplicated(keep="last")].sort_index().astype(OHLCV_DTYPES)
+            cache.to_parquet(self.ohlcv_file)
+            self._write_coverage(start_ts, end_ts, "business", dataset="ohlcv")
+
+        out = cache.loc[pd.Timestamp(start):pd.Timestamp(end)]
+        if out.empty:
+            raise ValueError(f"No OHLCV data available for {self.ticker} in requested window {start}..{end}")
+        return out
+
     def fetch_close_prices(self, start="2020-01-01", end="2025-01-01", force=False) -> pd.Series:
         start_ts, end_ts = pd.Timestamp(start), pd.Timestamp(end)
         self.price_store.mkdir(parents=True, exist_ok=True)
 
         if self.cache_file.exists() and not force:
-            cache = pd.read_parquet(self.cache_file)
-            cache.index = pd.to_datetime(cache.index).tz_localize(None)
-            cache.index.name = "Date"
-            cache = cache.sort_index()
-            if "Close" not in cache.columns:
-                cache.columns = ["Close"]  # safety if column name lost
+            cache = self._read_cache()
+            if self.index_mode == "business" and self._read_coverage(cache)["index_mode"] == "calendar":
+                # legacy calendar-day cache: refresh it as calendar days, read the trading
+                # days from its derived business-day copy
+                closes = Enterprise(self.ticker, self.currency, self.meta).fetch_close_prices(start, end)
+                self.migrate_cache()  # no-op while the copy is current
+                days = pd.read_parquet(self.business_file).index
+                return closes.loc[closes.index.isin(days)]
         else:
             cache = pd.DataFrame(columns=["Close"])
             cache.index.name = "Date"
 
         # Determine if download is required
         need_download = force or cache.empty
+        # a business-day cache stays business-day (calendar reads fill it on the way out)
+        store_mode = self.index_mode
         if not cache.empty and not force:
-            have_start, have_end = cache.index.min(), cache.index.max()
+            cov = self._read_coverage(cache)
+            have_start, have_end = cov["start"], cov["end"]
             need_download = not (start_ts >= have_start and end_ts <= have_end)
+            if cov["index_mode"] == "business":
+                store_mode = "business"
 
         if need_download:
             segments = []
             if cache.empty or force:
                 segments.append((start_ts, end_ts))
+                have_start, have_end = start_ts, end_ts
             else:
-                have_start, have_end = cache.index.min(), cache.index.max()
                 if start_ts < have_start:
                     segments.append((start_ts, min(end_ts, have_start - pd.Timedelta(days=1))))
                 if end_ts > have_end:
@@ -162,7 +394,9 @@ class Enterprise:
 
             for seg_start, seg_end in segments:
                 if seg_start <= seg_end:
-                    df_new = self._download_close(seg_start.strftime("%Y-%m-%d"), seg_end.strftime("%Y-%m-%d"))
+                    df_new = self._download_close(seg_start.strftime("%Y-%m-%d"), seg_end.strftime("%Y-%m-%d"), store_mode)
+                    if df_new.empty:
+                        continue
 
                     # If first row has NaN and we know the last cached close, seed it
                     if pd.isna(df_new["Close"].iloc[0]) and last_close is not None:
@@ -177,6 +411,11 @@ class Enterprise:
 
             cache = cache[~cache.index.duplicated(keep="last")].sort_index()
             cache.to_parquet(self.cache_file)  # requires pyarrow or fastparquet
+            self._write_coverage(min(have_start, start_ts), max(have_end, end_ts), store_mode)
+
+        if self.index_mode == "calendar" and store_mode == "business":
+            # business-day cache read in calendar mode: fill back to calendar days
+            cache = cache.reindex(pd.date_range(cache.index.min(), cache.index.max(), freq="D")).ffill()
 
         out = cache.loc[start_ts:end_ts, "Close"]
         if out.empty:
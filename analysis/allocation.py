@@ -0,0 +1,245 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable
+import numpy as np
+import pandas as pd
+from models import metrics
+
+# Capital allocation across pairs traded at the same time, from their pnl streams
+# (bars x pairs, e.g. pair_pnl() or ResultsStore.series(run_ids, "pnl")):
+#
+#   covariance   Ledoit-Wolf shrinkage of the sample covariance toward m * I (m = mean
+#                variance); the optimal intensity comes from the same running sums
+#   windows      RollingMoments keeps sum x, sum x x', sum |x|^2 x and sum |x|^4; moving
+#                the window adds / drops the bars in between (a sum of rank-one terms,
+#                one matmul per block) instead of recomputing from scratch at every
+#                rebalance, so a rebalance costs O(block * pairs^2) + one weight solve
+#   weights      risk parity (equal risk contributions, Newton on Spinu's convex form)
+#                or long-only minimum variance, summing to 1; "equal" for comparison
+#
+# Pairs sharing a leg (ASML/RI, ASML/BESI, BESI/IFX) have correlated pnl, so both
+# schemes size them down together instead of giving each 1/N. Weights are set on the
+# close of a rebalance bar and held from the next bar; pairs with no pnl in the window
+# (never traded) get weight 0.
+
+METHODS = ("risk_parity", "min_variance", "equal")
+
+
+class RollingMoments:
+    """Running sums of the rows of a (bars x p) matrix, updated by blocks of rows."""
+
+    def __init__(self, p: int):
+        self.n = 0
+        self.s1 = np.zeros(p)           # sum x
+        self.s2 = np.zeros((p, p))      # sum x x'
+        self.s3 = np.zeros(p)           # sum |x|^2 x
+        self.s4 = 0.0                   # sum |x|^4
+
+    def _update(self, X, sign: int) -> None:
+        X = np.asarray(X, dtype=float).reshape(-1, self.s1.size)
+        if not len(X):
+            return
+        q = np.einsum("ij,ij->i", X, X)
+        self.n += sign * len(X)
+        self.s1 += sign * X.sum(axis=0)
+        self.s2 += sign * (X.T @ X)
+        self.s3 += sign * (q @ X)
+        self.s4 += sign * float(q @ q)
+
+    def add(self, X) -> None:
+        self._update(X, 1)
+
+    def drop(self, X) -> None:
+        self._update(X, -1)
+
+    def covariance(self) -> np.ndarray:
+        """Sample covariance (ddof=0)."""
+        mu = self.s1 / self.n
+        return self.s2 / self.n - np.outer(mu, mu)
+
+    def ledoit_wolf(self) -> tuple[np.ndarray, float]:
+        """
+        Ledoit-Wolf (2004) shrunk covariance delta * m * I + (1 - delta) * S and delta.
+        The dispersion term sum_k |x_k - mu|^4 is expanded in the running sums, so the
+        result equals the estimator computed from the window's rows.
+        """
+        n, mu = self.n, self.s1 / self.n
+        S = self.s2 / n - np.outer(mu, mu)
+        p = S.shape[0]
+        m = np.trace(S) / p
+        s_norm2 = float(np.sum(S * S))
+        d2 = s_norm2 - p * m * m                      # ||S - m I||_F^2
+        c = float(mu @ mu)
+        q2 = (self.s4 + 4.0 * float(mu @ self.s2 @ mu) + n * c * c - 4.0 * float(mu @ self.s3)
+              + 2.0 * c * np.trace(self.s2) - 4.0 * c * float(mu @ self.s1))
+        b2 = min(max((q2 / n - s_norm2) / n, 0.0), d2)
+        delta = b2 / d2 if d2 > 0 else 1.0
+        shrunk = (1.0 - delta) * S
+        shrunk[np.diag_indices(p)] += delta * m
+        return shrunk, float(delta)
+
+
+def risk_parity_weights(cov: np.ndarray, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+    """
+    Equal-risk-contribution weights: w_i (cov w)_i equal for all i. Newton's method on
+    min 1/2 y'cov y - sum log(y_i) / p (Spinu 2013), w = y / sum(y).
+    """
+    cov = np.asarray(cov, dtype=float)
+    p = cov.shape[0]
+    b = np.full(p, 1.0 / p)
+
+    def f(v):
+        return 0.5 * v @ cov @ v - b @ np.log(v)
+
+    y = 1.0 / np.sqrt(np.diag(cov))
+    y *= np.sqrt(1.0 / (y @ cov @ y))
+    for _ in range(max_iter):
+        grad = cov @ y - b / y
+        if np.max(np.abs(grad * y)) < tol:
+            break
+        step = np.linalg.solve(cov + np.diag(b / (y * y)), grad)
+        t, fy = 1.0, f(y)
+        while np.any(y - t * step <= 0) or f(y - t * step) > fy:
+            t *= 0.5
+            if t < 1e-12:
+                break
+        y = y - t * step
+    return y / y.sum()
+
+
+def min_variance_weights(cov: np.ndarray, long_only: bool = True) -> np.ndarray:
+    """
+    Minimum-variance weights summing to 1. long_only: pairs with a negative weight
+    (shorting a pair strategy) are removed and the rest re-solved until none is left.
+    """
+    cov = np.asarray(cov, dtype=float)
+    keep = np.arange(cov.shape[0])
+    while True:
+        w = np.linalg.solve(cov[np.ix_(keep, keep)], np.ones(keep.size))
+        w /= w.sum()
+        if not long_only or (w >= 0).all():
+            break
+        keep = keep[w > 0]
+    out = np.zeros(cov.shape[0])
+    out[keep] = w
+    return out
+
+
+def risk_contributions(weights, cov) -> np.ndarray:
+    """Share of portfolio variance per pair: w_i (cov w)_i / w'cov w."""
+    w = np.asarray(weights, dtype=float)
+    rc = w * (np.asarray(cov) @ w)
+    return rc / rc.sum()
+
+
+def _solve(cov: np.ndarray, method: str, live: np.ndarray) -> np.ndarray:
+    # weights on the pairs with pnl variance in the window (live), 0 elsewhere
+    w = np.zeros(cov.shape[0])
+    if not live.any():
+        return w
+    sub = cov[np.ix_(live, live)]
+    if method == "risk_parity":
+        w[live] = risk_parity_weights(sub)
+    elif method == "min_variance":
+        w[live] = min_variance_weights(sub)
+    else:
+        w[live] = 1.0 / live.sum()
+    return w
+
+
+def rolling_weights(
+    pnl: pd.DataFrame,
+    method: str = "risk_parity",
+    window: int = 126,
+    rebalance_every: int = 21,
+    shrink: bool = True,
+) -> pd.DataFrame:
+    """
+    Weights (bars x pairs) decided on the close of every rebalance bar from the last
+    `window` bars of pnl (first one once a full window is available), forward-filled
+    between rebalances; NaN before the first. attrs: "shrinkage" (delta per rebalance),
+    "last_rebalance" (date and covariance used).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    X = pnl.to_numpy(dtype=float, na_value=np.nan)
+    X = np.where(np.isfinite(X), X, 0.0)          # not traded yet -> no pnl
+    n, p = X.shape
+    if n < window:
+        raise ValueError(f"need at least window={window} bars, got {n}")
+    mom = RollingMoments(p)
+    lo = hi = 0                                   # rows [lo, hi) are in mom
+    out = np.full((n, p), np.nan)
+    deltas = {}
+    for t in range(window - 1, n, max(int(rebalance_every), 1)):
+        new_lo, new_hi = t + 1 - window, t + 1
+        if new_lo >= hi:                          # no overlap with the previous window
+            mom = RollingMoments(p)
+            mom.add(X[new_lo:new_hi])
+        else:
+            mom.add(X[hi:new_hi])
+            mom.drop(X[lo:new_lo])
+        lo, hi = new_lo, new_hi
+        var = np.diag(mom.covariance())
+        live = var > 1e-12 * max(var.max(), 0.0)      # dropped-out pairs leave rounding residue
+        if shrink:
+            cov, deltas[pnl.index[t]] = mom.ledoit_wolf()
+        else:
+            cov = mom.covariance()
+        out[t] = _solve(cov, method, live)
+        last = (t, cov)
+    weights = pd.DataFrame(out, index=pnl.index, columns=pnl.columns).ffill()
+    weights.attrs["shrinkage"] = pd.Series(deltas, dtype=float, name="delta")
+    weights.attrs["last_rebalance"] = {"date": pnl.index[last[0]], "cov": last[1]}
+    return weights
+
+
+def allocate(
+    pnl: pd.DataFrame,
+    method: str = "risk_parity",
+    window: int = 126,
+    rebalance_every: int = 21,
+    shrink: bool = True,
+    periods_per_year: float = metrics.TRADING_DAYS,
+) -> Dict[str, Any]:
+    """
+    Portfolio of pair pnl streams under rolling weights (held from the bar after each
+    rebalance). Returns weights, portfolio pnl / equity, summary stats and the risk
+    contributions at the last rebalance.
+    """
+    weights = rolling_weights(pnl, method=method, window=window, rebalance_every=rebalance_every, shrink=shrink)
+    held = weights.shift(1)
+    live = held.notna().any(axis=1)
+    port = (held * pnl.fillna(0.0)).sum(axis=1)[live]
+    summary = metrics.performance_summary(port.to_numpy(), np.ones(len(port)), periods_per_year=periods_per_year)
+
+    last = weights.attrs["last_rebalance"]
+    w_last = weights.loc[last["date"]].to_numpy()
+    return {
+        "weights": weights,
+        "pnl": port,
+        "equity": (1.0 + port).cumprod(),
+        "stats": {k: float(v[0]) for k, v in summary.items()
+                  if k in ("sharpe_annual", "annual_return", "vol_return", "max_drawdown", "total_return")},
+        "risk_contributions": pd.Series(risk_contributions(w_last, last["cov"]) if w_last.any() else w_last,
+                                        index=pnl.columns, name=last["date"]),
+    }
+
+
+def pair_pnl(
+    prices: pd.DataFrame,
+    pairs: Iterable[tuple[str, str]],
+    stop_loss_pct: float | None = None,
+    take_profit_pct: float | None = None,
+    max_bars_in_trade: int | None = None,
+    **strategy_kwargs,
+) -> pd.DataFrame:
+    """(bars x pairs) net pnl of PairsZScoreOnlyStrategy on each pair, columns 'A/B'."""
+    from strategies.zscore_only import PairsZScoreOnlyStrategy  # deferred: only needed here
+    cols = {}
+    for a, b in pairs:
+        res = PairsZScoreOnlyStrategy(a, b, **strategy_kwargs).execute(
+            prices, stop_loss_pct=stop_loss_pct, take_profit_pct=take_profit_pct,
+            max_bars_in_trade=max_bars_in_trade, fields=("pnl",),
+        )
+        cols[f"{a}/{b}"] = res["pnl"]
+    return pd.DataFrame(cols).sort_index()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from models.stats import half_life
+from analysis.clustering import meta_groups
+
+# Basket (triplet) selection. Instead of scoring all C(n,3) triplets, start from the
+# pairs that passed the cointegration gate in PairAnalyzer.rank_pairs and add one third
+# leg from the same group (sector by default, or cluster_universe labels). Candidates are
+# Johansen-tested in chunks, optionally in worker processes that receive the price matrix once.
+
+_PRICES: pd.DataFrame | None = None   # worker-side copy of the (log) price matrix
+
+
+def sector_groups(tickers) -> dict[str, str]:
+    """{ticker: sector} from the cached meta files (tickers without meta get their own group)."""
+    return meta_groups(tickers, "sector")
+
+
+def _init_worker(prices: pd.DataFrame) -> None:
+    global _PRICES
+    _PRICES = prices
+
+
+class BasketAnalyzer:
+    def __init__(self, use_logs: bool = True, det_order: int = 0, k_ar_diff: int = 1,
+                 min_obs: int = 90, processes: int | None = 1, chunk_size: int = 32):
+        self.use_logs = use_logs
+        self.det_order = det_order
+        self.k_ar_diff = k_ar_diff
+        self.min_obs = min_obs
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    def candidates(self, ranked_pairs: pd.DataFrame, tickers: list[str],
+                   groups: dict[str, str] | None = None) -> list[tuple[str, str, str]]:
+        """
+        Triplets (a, b, c): (a, b) a cointegrated pair from rank_pairs, c in the group of a or b.
+        Each triplet appears once, with the legs of its first (best-ranked) source pair leading.
+        """
+        groups = groups if groups is not None else sector_groups(tickers)
+        ok = ranked_pairs[ranked_pairs["cointegration_ok"].fillna(False).astype(bool)]
+        seen, out = set(), []
+        for pair in ok["pair"]:
+            a, b = pair.split("/", 1)
+            for c in tickers:
+                if c in (a, b) or groups.get(c) not in (groups.get(a), groups.get(b)):
+                    continue
+                key = frozenset((a, b, c))
+                if key not in seen:
+                    seen.add(key)
+                    out.append((a, b, c))
+        return out
+
+    def analyze_basket(self, prices: pd.DataFrame, legs: tuple[str, ...]) -> dict:
+        from strategies.basket_zscore import johansen_weights
+        df = prices[list(legs)].dropna()
+        row = {"basket": "/".join(legs), "n_obs": int(len(df)), "trace_stat": np.nan,
+               "trace_crit_95": np.nan, "weights": None, "half_life": np.nan,
+               "johansen_ok": False, "hl_ok": False, "score": 0}
+        if len(df) < self.min_obs:
+            return row
+        try:
+            jo = johansen_weights(df.to_numpy(), self.det_order, self.k_ar_diff)
+        except np.linalg.LinAlgError:
+            return row
+        hl = half_life(df @ jo["weights"])
+        johansen_ok = jo["trace_stat"] > jo["trace_crit_95"]
+        hl_ok = (3 <= hl <= 20) if np.isfinite(hl) else False
+        row.update({
+            "trace_stat": jo["trace_stat"], "trace_crit_95": jo["trace_crit_95"],
+            "weights": [float(w) for w in jo["weights"]],
+            "half_life": float(hl) if np.isfinite(hl) else np.inf,
+            "johansen_ok": bool(johansen_ok), "hl_ok": bool(hl_ok),
+            "score": int(johansen_ok) + int(hl_ok),
+        })
+        return row
+
+    def _chunk(self, legs_list: list[tuple[str, ...]]) -> list[dict]:
+        return [self.analyze_basket(_PRICES, legs) for legs in legs_list]
+
+    def rank_baskets(self, prices: pd.DataFrame, ranked_pairs: pd.DataFrame, tickers: list[str],
+                     groups: dict[str, str] | None = None) -> pd.DataFrame:
+        """
+        Johansen-test the candidate triplets on `prices` (train window).
+        Sorted by score, then by how far the trace statistic clears its 95% critical value.
+        """
+        cands = self.candidates(ranked_pairs, tickers, groups)
+        data = np.log(prices) if self.use_logs else prices
+        chunks = [cands[i:i + self.chunk_size] for i in range(0, len(cands), self.chunk_size)]
+        if self.processes == 1 or len(chunks) <= 1:
+            _init_worker(data)
+            parts = [self._chunk(c) for c in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                     initargs=(data,)) as pool:
+                parts = list(pool.map(self._chunk, chunks))
+        rows = [r for p in parts for r in p]
+        cols = ["basket", "n_obs", "trace_stat", "trace_crit_95", "weights", "half_life",
+                "johansen_ok", "hl_ok", "score"]
+        df = pd.DataFrame(rows, columns=cols)
+        df["trace_margin"] = df["trace_stat"] / df["trace_crit_95"]
+        return df.sort_values(by=["score", "trace_margin", "half_life"],
+                              ascending=[False, False, True]).reset_index(drop=True)
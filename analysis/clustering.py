@@ -0,0 +1,106 @@
+from __future__ import annotations
+import itertools
+import numpy as np
+import pandas as pd
+
+# Universe clustering to cut pair combinatorics: rank_pairs only sees pairs whose legs
+# fall in the same cluster. Correlations of training-window log returns are computed in
+# one masked matrix product (pairwise-complete overlap), turned into the distance
+# d = sqrt(2 (1 - rho)) and clustered hierarchically, optionally inside meta groups
+# (sector / industry) so that clusters never straddle them.
+
+
+def meta_groups(tickers, key: str = "sector") -> dict[str, str]:
+    """{ticker: meta[key]} from the cached meta files (tickers without it get their own group)."""
+    from DataStructures import Enterprise
+    groups = {}
+    for t in tickers:
+        e = Enterprise(t)
+        value = e.fetch_meta(force=False).get(key) if e.meta_path.exists() else None
+        groups[t] = value or f"__{t}"
+    return groups
+
+
+def correlation_distance(prices: pd.DataFrame, use_logs: bool = True, min_overlap: int = 60) -> pd.DataFrame:
+    """
+    Correlation distance between all columns of `prices` from their (log) returns.
+    NaNs are handled pairwise: each correlation uses the bars where both legs printed.
+    Pairs with fewer than min_overlap common bars get the maximum distance (2).
+    """
+    p = np.log(prices) if use_logs else prices
+    r = p.diff().iloc[1:].to_numpy(dtype=float)
+    m = np.isfinite(r).astype(float)
+    x = np.where(m > 0, r, 0.0)
+
+    # pairwise-complete sums for every (i, j) in a handful of matrix products
+    n = m.T @ m
+    sx = x.T @ m                    # sum of x_i over bars where j is valid
+    sxx = (x * x).T @ m
+    sxy = x.T @ x
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        rho = cov / np.sqrt(var_i * var_i.T)
+    rho = np.where(n >= min_overlap, np.clip(rho, -1.0, 1.0), -1.0)
+    np.fill_diagonal(rho, 1.0)
+    d = np.sqrt(np.maximum(2.0 * (1.0 - rho), 0.0))
+    return pd.DataFrame(d, index=prices.columns, columns=prices.columns)
+
+
+def _cluster_block(dist: pd.DataFrame, max_dist: float, method: str) -> np.ndarray:
+    if len(dist) == 1:
+        return np.array([1])
+    from scipy.cluster.hierarchy import fcluster, linkage  # deferred: heavy import
+    from scipy.spatial.distance import squareform
+    z = linkage(squareform(dist.to_numpy(), checks=False), method=method)
+    return fcluster(z, t=max_dist, criterion="distance")
+
+
+def cluster_universe(
+    prices: pd.DataFrame,
+    tickers: list[str] | None = None,
+    max_dist: float = 1.0,
+    method: str = "average",
+    seed_by: str | None = None,
+    groups: dict[str, str] | None = None,
+    use_logs: bool = True,
+) -> dict[str, str]:
+    """
+    {ticker: cluster label}. max_dist is the linkage cut on d = sqrt(2(1-rho)):
+    1.0 <=> average correlation ~0.5 with 'average' linkage.
+    seed_by="sector"/"industry" (or an explicit `groups` mapping) clusters inside each
+    group separately.
+    """
+    tickers = list(tickers) if tickers is not None else list(prices.columns)
+    dist = correlation_distance(prices[tickers], use_logs=use_logs)
+    if groups is None:
+        groups = meta_groups(tickers, seed_by) if seed_by else {t: "all" for t in tickers}
+
+    labels = {}
+    for g in dict.fromkeys(groups[t] for t in tickers):
+        members = [t for t in tickers if groups[t] == g]
+        ids = _cluster_block(dist.loc[members, members], max_dist, method)
+        labels.update({t: f"{g}:{i}" for t, i in zip(members, ids)})
+    return labels
+
+
+def candidate_pairs(tickers: list[str], labels: dict[str, str]) -> list[tuple[str, str]]:
+    """Within-cluster pairs, in the same (a, b) order as itertools.combinations(tickers, 2)."""
+    return [(a, b) for a, b in itertools.combinations(tickers, 2) if labels[a] == labels[b]]
+
+
+def pruning_report(tickers: list[str], pairs: list[tuple[str, str]],
+                   ranked_full: pd.DataFrame | None = None, top_n: int = 10) -> dict:
+    """
+    Candidates kept vs. eliminated, and (given a full rank_pairs output) how many of the
+    previously top_n ranked pairs survive the clustering.
+    """
+    total = len(tickers) * (len(tickers) - 1) // 2
+    report = {"tickers": len(tickers), "all_pairs": total, "candidates": len(pairs),
+              "eliminated": total - len(pairs), "eliminated_%": 100.0 * (total - len(pairs)) / max(total, 1)}
+    if ranked_full is not None:
+        keep = {f"{a}/{b}" for a, b in pairs}
+        top = ranked_full["pair"].head(top_n)
+        report.update({"top_n": int(len(top)), "top_kept": int(top.isin(keep).sum()),
+                       "top_lost": [p for p in top if p not in keep]})
+    return report
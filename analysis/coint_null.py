@@ -0,0 +1,140 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+
+# Empirical null distribution of the Engle-Granger cointegration statistic.
+#
+# The statistic is the ADF t-stat (no constant, fixed `lags` augmentation) on the
+# residuals of the cointegrating regression y ~ 1 (+ t) + x. It is computed for many
+# series at once (columns of an (n_obs x k) matrix) with batched normal equations, both
+# for the observed pairs and for simulated independent random walks, so observed and
+# null statistics are defined identically. Null draws are cached on disk per
+# (n_obs bucket, trend, lags, n_sims) and reused across pairs and runs.
+
+NULL_CACHE = Path("data/market/cache/coint_null")
+
+
+def _batched_ols_tstat(X: np.ndarray, y: np.ndarray, col: int = 0) -> np.ndarray:
+    """t-stat of coefficient `col` for k independent regressions: X (k, m, p), y (k, m)."""
+    XtX = np.einsum("kmp,kmq->kpq", X, X)
+    Xty = np.einsum("kmp,km->kp", X, y)
+    inv = np.linalg.inv(XtX)
+    beta = np.einsum("kpq,kq->kp", inv, Xty)
+    resid = y - np.einsum("kmp,kp->km", X, beta)
+    dof = X.shape[1] - X.shape[2]
+    s2 = np.einsum("km,km->k", resid, resid) / dof
+    return beta[:, col] / np.sqrt(s2 * inv[:, col, col])
+
+
+def eg_statistic(y: np.ndarray, x: np.ndarray, trend: str = "c", lags: int = 1) -> np.ndarray:
+    """
+    Engle-Granger statistic for each column pair of y, x (n_obs x k, no NaNs).
+    More negative = stronger evidence of cointegration.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    if y.ndim == 1:
+        y, x = y[:, None], x[:, None]
+    n, k = y.shape
+
+    # 1) cointegrating regression y = a (+ b t) + beta x + e, per column
+    regs = [np.ones((k, n)), x.T]
+    if trend == "ct":
+        regs.insert(1, np.broadcast_to(np.arange(n, dtype=float), (k, n)))
+    elif trend != "c":
+        raise ValueError("trend must be 'c' or 'ct'")
+    X = np.stack(regs, axis=2)                          # (k, n, p)
+    XtX = np.einsum("knp,knq->kpq", X, X)
+    Xty = np.einsum("knp,kn->kp", X, y.T)
+    coef = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+    e = y.T - np.einsum("knp,kp->kn", X, coef)        # (k, n)
+
+    # 2) ADF on residuals: de_t = rho e_{t-1} + sum_j phi_j de_{t-j}, no constant
+    de = np.diff(e, axis=1)
+    m = de.shape[1] - lags
+    cols = [e[:, lags:-1]] + [de[:, lags - j:lags - j + m] for j in range(1, lags + 1)]
+    Z = np.stack(cols, axis=2)                          # (k, m, 1 + lags)
+    return _batched_ols_tstat(Z, de[:, lags:], col=0)
+
+
+def _simulate_chunk(args) -> np.ndarray:
+    n_obs, size, trend, lags, seed = args
+    rng = np.random.default_rng(seed)
+    y = np.cumsum(rng.standard_normal((n_obs, size)), axis=0)
+    x = np.cumsum(rng.standard_normal((n_obs, size)), axis=0)
+    return eg_statistic(y, x, trend=trend, lags=lags)
+
+
+def simulate_null(
+    n_obs: int,
+    trend: str = "c",
+    lags: int = 1,
+    n_sims: int = 20000,
+    chunk_size: int = 2000,
+    processes: int | None = 1,
+    seed: int = 0,
+) -> np.ndarray:
+    """Sorted EG statistics of n_sims independent random-walk pairs of length n_obs."""
+    sizes = [chunk_size] * (n_sims // chunk_size) + ([n_sims % chunk_size] if n_sims % chunk_size else [])
+    seeds = np.random.SeedSequence([seed, n_obs]).spawn(len(sizes))
+    jobs = [(n_obs, s, trend, lags, ss) for s, ss in zip(sizes, seeds)]
+    if processes == 1 or len(jobs) == 1:
+        parts = [_simulate_chunk(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parts = list(pool.map(_simulate_chunk, jobs))
+    return np.sort(np.concatenate(parts))
+
+
+def bucket_n_obs(n_obs: int, bucket: int = 25) -> int:
+    # the null moves very little with n, so nearby lengths share one simulation
+    return max(bucket, int(round(n_obs / bucket)) * bucket)
+
+
+def null_distribution(
+    n_obs: int,
+    trend: str = "c",
+    lags: int = 1,
+    n_sims: int = 20000,
+    bucket: int = 25,
+    cache_dir: str | Path | None = NULL_CACHE,
+    processes: int | None = 1,
+) -> np.ndarray:
+    """Cached (sorted) null draws for series of about n_obs bars."""
+    n = bucket_n_obs(n_obs, bucket)
+    path = None
+    if cache_dir is not None:
+        path = Path(cache_dir) / f"eg_n{n}_{trend}_lag{lags}_s{n_sims}.npy"
+        if path.exists():
+            return np.load(path)
+    null = simulate_null(n, trend=trend, lags=lags, n_sims=n_sims, processes=processes)
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, null)
+    return null
+
+
+def empirical_pvalues(stats: np.ndarray, null_sorted: np.ndarray) -> np.ndarray:
+    """Left-tail p-values P(null <= stat), with the +1 correction."""
+    stats = np.asarray(stats, dtype=float)
+    below = np.searchsorted(null_sorted, stats, side="right")
+    p = (1.0 + below) / (1.0 + len(null_sorted))
+    return np.where(np.isfinite(stats), p, np.nan)
+
+
+def benjamini_hochberg(pvals: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg q-values (NaNs are left out of the count and stay NaN)."""
+    p = np.asarray(pvals, dtype=float)
+    q = np.full_like(p, np.nan)
+    ok = np.isfinite(p)
+    m = int(ok.sum())
+    if m == 0:
+        return q
+    order = np.argsort(p[ok])
+    ranked = p[ok][order] * m / np.arange(1, m + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    out = np.empty(m)
+    out[order] = np.minimum(ranked, 1.0)
+    q[ok] = out
+    return q
@@ -0,0 +1,262 @@
+from __future__ import annotations
+from typing import Dict, Iterable, Mapping
+import numpy as np
+import pandas as pd
+from models.hedge import rolling_hedge_zscore
+
+# Mean-reversion features of many spreads at once, from a (bars x pairs) matrix processed
+# in column chunks (every feature is a masked sum over the bars, vectorized over the pairs):
+#
+#   adf_stat         ADF t-stat of rho in ds_t = (a +) rho s_{t-1} + sum phi_j ds_{t-j};
+#                    for OLS pair spreads (pair_features) it is the Engle-Granger statistic
+#                    of analysis.coint_null (no constant, same lags)
+#   hurst            slope of log std(s_{t+tau} - s_t) on log tau over hurst_lags
+#                    (< 0.5 mean-reverting, 0.5 random walk)
+#   variance_ratio   Lo-MacKinlay VR(q) with overlapping q-differences, and its
+#                    homoskedastic z (vr_z); < 1 mean-reverting
+#   OU fit           AR(1) s_t = c + phi s_{t-1} + e: ou_kappa = -log(phi) per bar, ou_mu,
+#                    ou_sigma_eq = sd(e) / sqrt(1 - phi^2); half_life as models.stats.half_life
+#   zero_cross_rate  sign changes of the demeaned spread per bar
+#
+# Each column's valid bars are stacked to the top first (like dropna per pair), so interior
+# gaps are skipped the same way the per-pair code skips them. composite_score() turns the
+# features into one continuous score for PairAnalyzer.rank_pairs(score_mode="composite").
+
+HURST_LAGS = tuple(range(2, 21))
+COMPOSITE_WEIGHTS = {           # sign: +1 higher is better, -1 lower is better
+    "adf_stat": -1.0,
+    "hurst": -1.0,
+    "variance_ratio": -1.0,
+    "zero_cross_rate": 1.0,
+    "half_life_gap": -1.0,
+    "beta_cv": -1.0,
+}
+
+
+def _compact(*arrays: np.ndarray) -> tuple[list[np.ndarray], np.ndarray]:
+    """Rows where every array is finite moved to the top of each column (order kept), NaN below."""
+    ok = np.logical_and.reduce([np.isfinite(a) for a in arrays])
+    order = np.argsort(~ok, axis=0, kind="stable")
+    keep = np.take_along_axis(ok, order, axis=0)
+    out = [np.where(keep, np.take_along_axis(a, order, axis=0), np.nan) for a in arrays]
+    return out, ok.sum(axis=0)
+
+
+def _masked_ols(Z: np.ndarray, y: np.ndarray, w: np.ndarray) -> tuple[np.ndarray, ...]:
+    """k regressions with 0/1 row weights: Z (k, m, p), y (k, m), w (k, m) -> coef, se, s2."""
+    p = Z.shape[2]
+    Zw = Z * w[..., None]
+    XtX = np.einsum("kmp,kmq->kpq", Zw, Z)
+    Xty = np.einsum("kmp,km->kp", Zw, y)
+    dof = w.sum(axis=1) - p
+    dead = dof < 1
+    XtX[dead] = np.eye(p)                       # too few rows: solved on identity, NaN'd below
+    inv = np.linalg.inv(XtX)
+    coef = np.einsum("kpq,kq->kp", inv, Xty)
+    resid = (y - np.einsum("kmp,kp->km", Z, coef)) * w
+    with np.errstate(invalid="ignore", divide="ignore"):
+        s2 = np.einsum("km,km->k", resid, resid) / dof
+    se = np.sqrt(s2[:, None] * np.diagonal(inv, axis1=1, axis2=2))
+    coef[dead], se[dead], s2[dead] = np.nan, np.nan, np.nan
+    return coef, se, s2
+
+
+def _at(S: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    return np.take_along_axis(S, np.clip(rows, 0, S.shape[0] - 1)[None, :], axis=0)[0]
+
+
+def _spread_block(
+    S: np.ndarray,
+    n: np.ndarray,
+    hurst_lags: Iterable[int] = HURST_LAGS,
+    vr_lag: int = 10,
+    adf_lags: int = 1,
+    adf_trend: str = "c",
+) -> Dict[str, np.ndarray]:
+    """Features of compacted spreads S (m x k, column j valid in rows < n[j])."""
+    m, k = S.shape
+    rows = np.arange(m)[:, None]
+    Sz = np.nan_to_num(S)
+    ds = np.diff(Sz, axis=0)                            # ds[r] = s[r+1] - s[r], valid for r < n-1
+    nf = n.astype(float)
+
+    # ADF: regress ds[r] on s[r] (+ 1) and ds[r-1..r-L], rows r = L..n-2
+    L = int(adf_lags)
+    regs = [Sz[L:m - 1]] + [ds[L - i:m - 1 - i] for i in range(1, L + 1)]
+    if adf_trend == "c":
+        regs.append(np.ones_like(regs[0]))
+    elif adf_trend != "n":
+        raise ValueError("adf_trend must be 'c' or 'n'")
+    Z = np.stack(regs, axis=2).transpose(1, 0, 2)       # (k, m-1-L, p)
+    w = (rows[L:m - 1] < n - 1).T.astype(float)
+    coef, se, _ = _masked_ols(Z, ds[L:].T, w)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        adf = coef[:, 0] / se[:, 0]
+
+    # OU / AR(1): ds[r] = a + rho s[r], rows r = 0..n-2; phi = 1 + rho
+    Z = np.stack([Sz[:m - 1], np.ones((m - 1, k))], axis=2).transpose(1, 0, 2)
+    coef, _, s2 = _masked_ols(Z, ds.T, (rows[:m - 1] < n - 1).T.astype(float))
+    rho, a = coef[:, 0], coef[:, 1]
+    phi = 1.0 + rho
+    with np.errstate(invalid="ignore", divide="ignore"):
+        half = np.where(rho < 0, -np.log(2) / rho, np.where(np.isfinite(rho), np.inf, np.nan))
+        stationary = (phi > 0) & (phi < 1)
+        kappa = np.where(stationary, -np.log(phi), np.nan)
+        mu = np.where(stationary, -a / rho, np.nan)
+        sigma_eq = np.where(stationary, np.sqrt(s2 / (1.0 - phi * phi)), np.nan)
+
+    # Hurst: std of tau-differences (ddof=0) against tau, log-log slope per column
+    taus = np.array([t for t in hurst_lags if t < m], dtype=int)
+    log_sd = np.full((taus.size, k), np.nan)
+    for i, tau in enumerate(taus):
+        d = Sz[tau:] - Sz[:-tau]
+        valid = rows[:m - tau] < n - tau
+        cnt = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, d, 0.0).sum(axis=0) / cnt
+            var = np.where(valid, (d - mean) ** 2, 0.0).sum(axis=0) / cnt
+            log_sd[i] = np.where(cnt >= 2, 0.5 * np.log(var), np.nan)
+    lt = np.log(taus)[:, None] - np.log(taus).mean()
+    with np.errstate(invalid="ignore"):
+        hurst = (lt * (log_sd - log_sd.mean(axis=0))).sum(axis=0) / (lt * lt).sum()
+
+    # variance ratio VR(q), Lo-MacKinlay (1988) with bias-corrected variances
+    q = int(vr_lag)
+    N = nf - 1.0                                        # one-bar differences
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drift = (_at(Sz, n - 1) - Sz[0]) / N
+        var_a = np.where(rows[:m - 1] < n - 1, (ds - drift) ** 2, 0.0).sum(axis=0) / (N - 1.0)
+        if q < m:
+            dq = Sz[q:] - Sz[:-q]
+            mq = q * (N - q + 1.0) * (1.0 - q / N)
+            var_c = np.where(rows[:m - q] < n - q, (dq - q * drift) ** 2, 0.0).sum(axis=0) / mq
+        else:
+            var_c = np.full(k, np.nan)
+        vr = np.where(N > q, var_c / var_a, np.nan)
+        vr_z = (vr - 1.0) / np.sqrt(2.0 * (2 * q - 1) * (q - 1) / (3.0 * q * N))
+
+    # zero crossings of the demeaned spread
+    valid = rows < n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = Sz - np.where(valid, Sz, 0.0).sum(axis=0) / nf
+        cross = ((d[1:] * d[:-1]) < 0) & valid[1:]
+        zcr = cross.sum(axis=0) / N
+
+    return {
+        "adf_stat": adf, "hurst": hurst, "variance_ratio": vr, "vr_z": vr_z,
+        "ou_kappa": kappa, "ou_mu": mu, "ou_sigma_eq": sigma_eq, "half_life": half,
+        "zero_cross_rate": zcr,
+    }
+
+
+def spread_features(
+    spreads: pd.DataFrame,
+    hurst_lags: Iterable[int] = HURST_LAGS,
+    vr_lag: int = 10,
+    adf_lags: int = 1,
+    adf_trend: str = "c",
+    min_obs: int = 60,
+    chunk: int = 256,
+) -> pd.DataFrame:
+    """
+    Mean-reversion features (one row per column of `spreads`), computed `chunk` columns
+    at a time. Columns with fewer than min_obs valid bars get NaN features.
+    """
+    hurst_lags = tuple(hurst_lags)
+    A = spreads.to_numpy(dtype=float, na_value=np.nan)
+    parts = []
+    for lo in range(0, A.shape[1], max(int(chunk), 1)):
+        (S,), n = _compact(A[:, lo:lo + chunk])
+        block = _spread_block(S, n, hurst_lags, vr_lag, adf_lags, adf_trend)
+        short = n < min_obs
+        block = {name: np.where(short, np.nan, v) for name, v in block.items()}
+        parts.append(pd.DataFrame({"n_obs": n, **block}))
+    out = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["n_obs"])
+    out.index = spreads.columns
+    return out
+
+
+def pair_features(
+    prices: pd.DataFrame,
+    pairs: Iterable[tuple[str, str]],
+    use_logs: bool = True,
+    beta_window: int = 60,
+    min_obs: int = 90,
+    chunk: int = 256,
+    **feature_kw,
+) -> pd.DataFrame:
+    """
+    Static OLS hedge (y = alpha + beta x on the bars where both legs trade), rolling beta
+    CV (as models.stats.rolling_beta_cv) and spread_features of the residual spread for
+    every pair, `chunk` pairs at a time. adf_stat defaults to the Engle-Granger form
+    (adf_trend="n"). One row per pair, columns 'pair', 'n_obs', 'alpha', 'beta', ...
+    """
+    pairs = list(pairs)
+    feature_kw.setdefault("adf_trend", "n")
+    feature_kw["hurst_lags"] = tuple(feature_kw.get("hurst_lags", HURST_LAGS))
+    col = {t: i for i, t in enumerate(prices.columns)}
+    P = prices.to_numpy(dtype=float, na_value=np.nan)
+    if use_logs:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            P = np.log(P)
+    parts = []
+    for lo in range(0, len(pairs), max(int(chunk), 1)):
+        block = pairs[lo:lo + chunk]
+        (Y, X), n = _compact(P[:, [col[a] for a, _ in block]], P[:, [col[b] for _, b in block]])
+        rows = np.arange(Y.shape[0])[:, None]
+        valid = rows < n
+        nf = np.maximum(n, 1).astype(float)
+        Yz, Xz = np.nan_to_num(Y), np.nan_to_num(X)
+
+        # static OLS, two-pass (centered) sums
+        my, mx = Yz.sum(axis=0) / nf, Xz.sum(axis=0) / nf
+        xc, yc = np.where(valid, Xz - mx, 0.0), np.where(valid, Yz - my, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            beta = (xc * yc).sum(axis=0) / (xc * xc).sum(axis=0)
+        alpha = my - beta * mx
+        S = Y - (alpha + beta * X)
+
+        # rolling beta CV over the windows ending at bars window-1 .. n-2 (rolling_beta_cv)
+        b = rolling_hedge_zscore(Y, X, beta_window=beta_window, z_window=2)["beta"]
+        used = (rows >= beta_window - 1) & (rows <= n - 2) & np.isfinite(b)
+        cnt = used.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bm = np.where(used, b, 0.0).sum(axis=0) / cnt
+            bsd = np.sqrt(np.where(used, (b - bm) ** 2, 0.0).sum(axis=0) / (cnt - 1))
+            beta_cv = np.where((n >= beta_window + 10) & (bm != 0) & (cnt >= 2), bsd / np.abs(bm), np.nan)
+
+        feats = _spread_block(S, n, **feature_kw)
+        short = n < min_obs
+        frame = {"pair": [f"{a}/{b_}" for a, b_ in block], "n_obs": n,
+                 "alpha": alpha, "beta": beta, "beta_cv": beta_cv, **feats}
+        parts.append(pd.DataFrame({k: (np.where(short, np.nan, v) if k not in ("pair", "n_obs") else v)
+                                   for k, v in frame.items()}))
+    if not parts:
+        return pd.DataFrame(columns=["pair", "n_obs"])
+    return pd.concat(parts, ignore_index=True)
+
+
+def composite_score(
+    features: pd.DataFrame,
+    weights: Mapping[str, float] | None = None,
+    half_life_band: tuple[float, float] = (3.0, 20.0),
+) -> pd.Series:
+    """
+    Continuous mean-reversion score in [0, 1]: weighted mean of cross-sectional percentile
+    ranks of the features in `weights` (sign = direction, columns absent from `features`
+    are skipped). half_life_gap is the log distance of half_life outside half_life_band.
+    NaN where a used feature is missing (e.g. too few bars).
+    """
+    weights = dict(COMPOSITE_WEIGHTS if weights is None else weights)
+    f = features.copy()
+    if "half_life_gap" in weights and "half_life" in f:
+        lo, hi = half_life_band
+        hl = f["half_life"].astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            f["half_life_gap"] = np.maximum(np.log(lo / hl), 0.0) + np.maximum(np.log(hl / hi), 0.0)
+    used = {k: float(v) for k, v in weights.items() if k in f and v != 0}
+    if not used:
+        raise ValueError(f"none of the weighted features {sorted(weights)} are in the frame")
+    total = sum(abs(v) for v in used.values())
+    ranks = [abs(v) * f[k].astype(float).rank(pct=True, ascending=v > 0) for k, v in used.items()]
+    return (sum(ranks) / total).rename("composite")
@@ -0,0 +1,404 @@
+from __future__ import annotations
+import itertools
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Incremental pair ranking. Per pair the ranker keeps sufficient statistics of the
+# training sample, so a new bar updates every pair in O(pairs):
+#   - sums of x, y, x^2, xy, y^2                 -> static OLS alpha / beta
+#   - sums and cross-products of (dy, dx, y_lag, x_lag) over consecutive bars
+#                                                -> half-life and the Engle-Granger
+#                                                   (Dickey-Fuller, no lags) statistic
+#   - sums over the last beta_window bars        -> the current rolling beta
+#   - running sum / sum of squares of rolling betas -> beta_cv
+# Prices are stored once, in one ring buffer per ticker (a bars x tickers array); pairs
+# keep bar numbers into it (oldest bar of the rolling window / sample) instead of copies
+# of their series. With max_obs set the buffer holds the last max_obs bars and the
+# sample slides with it: the oldest bar's contributions (sums, lag product, the beta of
+# the first window) are subtracted when it leaves. Without max_obs the sample, and the
+# buffer, expand.
+#
+# All quantities match PairAnalyzer.analyze_pair / models.stats on the same (log) prices;
+# cointegration uses the lag-0 EG statistic against the simulated null of
+# analysis.coint_null, because the lag-selected MacKinnon test is not decomposable into
+# running sums. verify() recomputes from the buffer and resyncs on drift.
+
+
+class IncrementalRanker:
+    def __init__(
+        self,
+        tickers: list[str],
+        pairs: list[tuple[str, str]] | None = None,
+        beta_window: int = 60,
+        max_obs: int | None = None,
+        use_logs: bool = True,
+        verify_every: int | None = None,
+        verify_pairs: int | None = None,
+        null_sims: int = 20000,
+    ):
+        """
+        pairs: candidate pairs (default all combinations of tickers).
+        max_obs: sliding sample of the last max_obs bars (each pair uses its joint bars
+        among them; None = expanding).
+        verify_every / verify_pairs: every verify_every updates, re-check verify_pairs pairs
+        (rotating through the universe; None = all) against a full recompute.
+        """
+        self.tickers = list(tickers)
+        self.pairs = [tuple(p) for p in pairs] if pairs is not None else list(itertools.combinations(self.tickers, 2))
+        if max_obs is not None and max_obs < beta_window + 10:
+            raise ValueError("max_obs must be at least beta_window + 10")
+        self.beta_window = int(beta_window)
+        self.max_obs = max_obs
+        self.use_logs = use_logs
+        self.verify_every = verify_every
+        self.verify_pairs = verify_pairs
+        self.null_sims = null_sims
+        pos = {t: i for i, t in enumerate(self.tickers)}
+        self._ia = np.array([pos[a] for a, _ in self.pairs], dtype=np.int64)
+        self._ib = np.array([pos[b] for _, b in self.pairs], dtype=np.int64)
+        self.reset()
+
+    # ---- state
+    def reset(self, capacity: int = 256) -> None:
+        P = len(self.pairs)
+        self.state = {
+            "n": np.zeros(P, np.int64),            # joint observations in the sample
+            "sums": np.zeros((P, 5)),              # sx, sy, sxx, sxy, syy
+            "m": np.zeros(P, np.int64),            # consecutive-bar pairs in the sample
+            "S1": np.zeros((P, 4)),                # sum of v = (dy, dx, y_lag, x_lag)
+            "S2": np.zeros((P, 4, 4)),             # sum of v v'
+            "last": np.full((P, 2), np.nan),       # last joint (y, x)
+            "whead": np.full(P, -1, np.int64),     # bar number of the oldest joint bar in the rolling window
+            "wn": np.zeros(P, np.int64),
+            "wsums": np.zeros((P, 4)),             # sx, sy, sxx, sxy over the window
+            "bstats": np.zeros((P, 3)),            # count, sum, sum of squares of betas
+            "pend": np.full(P, np.nan),            # beta of the newest window, counted on the next bar
+        }
+        if self.max_obs is not None:
+            self.state.update({
+                "head": np.full(P, -1, np.int64),  # bar number of the oldest joint bar in the sample
+                "tn": np.zeros(P, np.int64),       # first min(n, beta_window) joint bars of the sample
+                "tsums": np.zeros((P, 4)),         # (the window whose beta leaves with the oldest bar)
+                "tend": np.full(P, -1, np.int64),  # bar number of the joint bar after them
+            })
+        cap = self.max_obs or capacity
+        self._buf = np.full((cap, len(self.tickers)), np.nan)   # (log) prices, ring over bar numbers
+        self._ts = np.empty(cap, dtype=object)
+        self.n_bars = 0
+        self.n_updates = 0
+        self.last_verification: dict | None = None
+
+    @property
+    def history(self) -> pd.DataFrame:
+        """(Log) prices of the sample: the last max_obs bars (every bar when expanding)."""
+        n = min(self.n_bars, len(self._buf))
+        slots = np.arange(self.n_bars - n, self.n_bars) % len(self._buf)
+        return pd.DataFrame(self._buf[slots], index=pd.Index(list(self._ts[slots])), columns=self.tickers)
+
+    # ---- feeding bars
+    def fit(self, prices: pd.DataFrame) -> "IncrementalRanker":
+        """Reset and replay a price history bar by bar (one pass, O(bars x pairs))."""
+        self.reset(capacity=max(len(prices), 1))
+        data = prices[self.tickers].astype(float)
+        data = np.log(data) if self.use_logs else data
+        for ts, row in zip(data.index, data.to_numpy()):
+            self._ingest(row, ts)
+        return self
+
+    def update(self, bar) -> None:
+        """
+        Add one bar: a Series indexed by ticker (its name is used as the timestamp) or a
+        {ticker: price} dict. Missing tickers are NaN. Runs verify() every verify_every bars.
+        """
+        bar = pd.Series(bar, dtype=float)
+        row = bar.reindex(self.tickers).to_numpy(dtype=float)
+        if self.use_logs:
+            row = np.log(row)
+        self._ingest(row, bar.name if bar.name is not None else self.n_bars)
+        self.n_updates += 1
+        if self.verify_every and self.n_updates % self.verify_every == 0:
+            k = self.verify_pairs or len(self.pairs)
+            start = (self.n_updates // self.verify_every - 1) * k % len(self.pairs)
+            self.verify(pairs=[self.pairs[(start + i) % len(self.pairs)] for i in range(min(k, len(self.pairs)))])
+
+    def _bar(self, r: np.ndarray, g: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # (y, x) of pairs r at bar numbers g
+        rows = self._buf[g % len(self._buf)]
+        return rows[np.arange(r.size), self._ia[r]], rows[np.arange(r.size), self._ib[r]]
+
+    def _next_joint(self, r: np.ndarray, start: np.ndarray, stop: int) -> np.ndarray:
+        # first bar number in [start, stop) where both legs of pairs r have a price, -1 if none
+        out = np.full(r.size, -1, np.int64)
+        g = np.asarray(start, dtype=np.int64).copy()
+        todo = np.flatnonzero(g < stop)
+        while todo.size:
+            y, x = self._bar(r[todo], g[todo])
+            hit = np.isfinite(y) & np.isfinite(x)
+            out[todo[hit]] = g[todo[hit]]
+            todo = todo[~hit]
+            g[todo] += 1
+            todo = todo[g[todo] < stop]
+        return out
+
+    @staticmethod
+    def _window_beta(sums: np.ndarray, w) -> np.ndarray:
+        sx, sy, sxx, sxy = sums.T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (w * sxy - sx * sy) / (w * sxx - sx * sx)
+
+    def _drop_oldest(self, g0: int, g: int) -> None:
+        # bar g0 leaves the sliding sample (bars g0+1 .. g-1 stay, bar g is not in yet)
+        st, w = self.state, self.beta_window
+        r = np.flatnonzero(st["head"] == g0)
+        if r.size == 0:
+            return
+        y0, x0 = self._bar(r, np.full(r.size, g0))
+        n = st["n"][r]
+        st["sums"][r] -= np.column_stack([x0, y0, x0 * x0, x0 * y0, y0 * y0])
+
+        # lag product with the next joint bar, which becomes the oldest
+        nxt = self._next_joint(r, np.full(r.size, g0 + 1), g)
+        two = n >= 2
+        y1, x1 = self._bar(r[two], nxt[two])
+        v = np.column_stack([y1 - y0[two], x1 - x0[two], y0[two], x0[two]])
+        st["S1"][r[two]] -= v
+        st["S2"][r[two]] -= v[:, :, None] * v[:, None, :]
+        st["m"][r[two]] -= 1
+        st["head"][r] = nxt
+        st["last"][r[~two]] = np.nan
+
+        # the first window's beta was counted once a bar followed it (n > w); with n == w
+        # it is the pending one
+        counted = n > w
+        rc = r[counted]
+        b = self._window_beta(st["tsums"][rc], w)
+        ok = np.isfinite(b)
+        st["bstats"][rc[ok]] -= np.column_stack([np.ones(ok.sum()), b[ok], b[ok] ** 2])
+        st["pend"][r[n == w]] = np.nan
+        # slide the first window: drop the oldest bar, take in the bar after it
+        st["tsums"][r] -= np.column_stack([x0, y0, x0 * x0, x0 * y0])
+        te = st["tend"][rc]
+        ty, tx = self._bar(rc, te)
+        st["tsums"][rc] += np.column_stack([tx, ty, tx * tx, tx * ty])
+        st["tend"][rc] = self._next_joint(rc, te + 1, g)
+        st["tn"][r[~counted]] -= 1
+
+        # a window longer than the sample loses its oldest bar as well
+        short = st["wn"][r] > n - 1
+        rs = r[short]
+        wy, wx = self._bar(rs, st["whead"][rs])
+        st["wsums"][rs] -= np.column_stack([wx, wy, wx * wx, wx * wy])
+        st["wn"][rs] -= 1
+        st["whead"][rs] = self._next_joint(rs, st["whead"][rs] + 1, g)
+        st["n"][r] -= 1
+
+    def _ingest(self, row: np.ndarray, ts=None) -> None:
+        st, w, M = self.state, self.beta_window, self.max_obs
+        g = self.n_bars
+        if M is None and g == len(self._buf):   # expanding: grow the buffer
+            self._buf = np.concatenate([self._buf, np.full_like(self._buf, np.nan)])
+            self._ts = np.concatenate([self._ts, np.empty(len(self._ts), dtype=object)])
+        if M is not None and g >= M:
+            self._drop_oldest(g - M, g)          # before its slot is overwritten
+        self._buf[g % len(self._buf)] = row
+        self._ts[g % len(self._buf)] = ts
+        self.n_bars = g + 1
+
+        y_all, x_all = row[self._ia], row[self._ib]
+        rows = np.flatnonzero(np.isfinite(y_all) & np.isfinite(x_all))
+        if rows.size == 0:
+            return
+        y, x = y_all[rows], x_all[rows]
+
+        # 1) the window completed on the previous joint bar now counts (rolling_beta_cv
+        #    uses windows [i - w, i) for i < len, i.e. not the window ending at the last bar)
+        pend = st["pend"][rows]
+        has = np.isfinite(pend)
+        st["bstats"][rows[has]] += np.column_stack([np.ones(has.sum()), pend[has], pend[has] ** 2])
+        st["pend"][rows] = np.nan
+
+        # 2) lag products with the previous joint bar
+        ly, lx = st["last"][rows, 0], st["last"][rows, 1]
+        lag = np.isfinite(ly)
+        r = rows[lag]
+        v = np.column_stack([y[lag] - ly[lag], x[lag] - lx[lag], ly[lag], lx[lag]])
+        st["S1"][r] += v
+        st["S2"][r] += v[:, :, None] * v[:, None, :]
+        st["m"][r] += 1
+
+        # 3) full-sample sums (and, sliding, the sample's first window)
+        xy = np.column_stack([x, y, x * x, x * y])
+        if M is not None:
+            st["head"][rows[st["n"][rows] == 0]] = g
+            fill = st["tn"][rows] < w
+            st["tsums"][rows[fill]] += xy[fill]
+            st["tn"][rows[fill]] += 1
+            st["tend"][rows[~fill & (st["tend"][rows] < 0)]] = g
+        st["sums"][rows] += np.column_stack([x, y, x * x, x * y, y * y])
+        st["n"][rows] += 1
+
+        # 4) rolling-beta window
+        full = st["wn"][rows] == w
+        r = rows[full]
+        oy, ox = self._bar(r, st["whead"][r])
+        st["wsums"][r] -= np.column_stack([ox, oy, ox * ox, ox * oy])
+        st["whead"][r] = self._next_joint(r, st["whead"][r] + 1, g + 1)
+        st["whead"][rows[st["wn"][rows] == 0]] = g
+        st["wsums"][rows] += xy
+        st["wn"][rows] = np.minimum(st["wn"][rows] + 1, w)
+        r = rows[st["wn"][rows] == w]
+        st["pend"][r] = self._window_beta(st["wsums"][r], w)
+
+        st["last"][rows] = np.column_stack([y, x])
+
+    # ---- statistics
+    def pair_stats(self) -> pd.DataFrame:
+        """alpha, beta, half_life, beta_cv and the lag-0 EG statistic of every pair (unsorted)."""
+        st = self.state
+        n = st["n"].astype(float)
+        sx, sy, sxx, sxy, syy = st["sums"].T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            beta = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+            alpha = (sy - beta * sx) / n
+
+            # spread s = y - alpha - beta x: ds = a.v, s_lag = b.v - alpha
+            m = st["m"].astype(float)
+            a = np.zeros((len(n), 4)); a[:, 0], a[:, 1] = 1.0, -beta
+            b = np.zeros((len(n), 4)); b[:, 2], b[:, 3] = 1.0, -beta
+            S1, S2 = st["S1"], st["S2"]
+            aS2a = np.einsum("pi,pij,pj->p", a, S2, a)
+            aS2b = np.einsum("pi,pij,pj->p", a, S2, b)
+            bS2b = np.einsum("pi,pij,pj->p", b, S2, b)
+            aS1, bS1 = (a * S1).sum(1), (b * S1).sum(1)
+
+            # half-life: slope of ds on (1, s_lag) -> centred moments
+            cov = aS2b / m - (aS1 / m) * (bS1 / m)
+            var = bS2b / m - (bS1 / m) ** 2
+            theta = cov / var
+            hl = np.where(theta < 0, -np.log(2) / theta, np.inf)
+            hl = np.where(n >= 60, hl, np.nan)
+
+            # Dickey-Fuller on the residuals, no constant: ds = rho * s_lag
+            see = bS2b - 2 * alpha * bS1 + m * alpha ** 2      # sum s_lag^2
+            sde = aS2b - alpha * aS1                            # sum ds * s_lag
+            rho = sde / see
+            rss = aS2a - rho * sde
+            eg_stat = rho / np.sqrt(rss / (m - 1) / see)
+
+            bn, bs, bq = st["bstats"].T
+            mean_b = bs / bn
+            sd_b = np.sqrt(np.maximum(bq - bs * bs / bn, 0.0) / (bn - 1))
+            beta_cv = np.where((n >= self.beta_window + 10) & (mean_b != 0), sd_b / np.abs(mean_b), np.nan)
+
+        short = n < 90
+        return pd.DataFrame({
+            "pair": [f"{p}/{q}" for p, q in self.pairs],
+            "n_obs": st["n"],
+            "alpha": np.where(short, np.nan, alpha),
+            "beta": np.where(short, np.nan, beta),
+            "beta_cv": np.where(short, np.nan, beta_cv),
+            "half_life": np.where(short, np.nan, hl),
+            "eg_stat": np.where(short, np.nan, eg_stat),
+        })
+
+    def rank(self, fdr_alpha: float = 0.05) -> pd.DataFrame:
+        """
+        Current ranking, same gates and order as PairAnalyzer.rank_pairs(pvalue_mode="empirical"):
+        cointegration_ok is the Benjamini-Hochberg q-value across all pairs below fdr_alpha,
+        ties in score sort by q-value.
+        """
+        from analysis.coint_null import null_distribution, empirical_pvalues, bucket_n_obs, benjamini_hochberg
+        df = self.pair_stats()
+        p = np.full(len(df), np.nan)
+        ok = df["eg_stat"].notna().to_numpy()
+        buckets = pd.Series(df["n_obs"].to_numpy()[ok]).map(bucket_n_obs).to_numpy()
+        for nb in np.unique(buckets):
+            idx = np.flatnonzero(ok)[buckets == nb]
+            null = null_distribution(int(nb), lags=0, n_sims=self.null_sims)
+            p[idx] = empirical_pvalues(df["eg_stat"].to_numpy()[idx], null)
+        df["p_value"] = p
+        df["q_value"] = benjamini_hochberg(p)
+        df["cointegration_ok"] = (df["q_value"] < fdr_alpha).fillna(False)
+        df["beta_stable"] = df["beta_cv"] < 0.2
+        df["hl_ok"] = (df["half_life"] >= 3) & (df["half_life"] <= 20)
+        df["score"] = df[["cointegration_ok", "beta_stable", "hl_ok"]].sum(axis=1).astype(int)
+        return df.sort_values(by=["score", "q_value", "half_life"], ascending=[False, True, True]).reset_index(drop=True)
+
+    # ---- verification
+    def _sample_frame(self, a: str, b: str) -> pd.DataFrame:
+        return self.history[[a, b]].dropna()
+
+    def verify(self, pairs: list[tuple[str, str]] | None = None, rtol: float = 1e-6, resync: bool = True) -> dict:
+        """
+        Recompute the statistics of `pairs` (default all) from the price buffer with the
+        batch code (OLSHedge, half_life, rolling_beta_cv, eg_statistic) and compare.
+        On a mismatch beyond rtol the state is rebuilt from the buffer.
+        """
+        from analysis.pair_analysis import PairAnalyzer
+        from analysis.coint_null import eg_statistic
+        from models.stats import half_life, rolling_beta_cv
+
+        pairs = self.pairs if pairs is None else [tuple(p) for p in pairs]
+        cur = self.pair_stats().set_index("pair")
+        hedge = PairAnalyzer().hedge
+        worst = {"alpha": 0.0, "beta": 0.0, "half_life": 0.0, "beta_cv": 0.0, "eg_stat": 0.0}
+        for a, b in pairs:
+            df = self._sample_frame(a, b)
+            if len(df) < 90:
+                continue
+            y, x = df[a], df[b]
+            alpha, beta, _ = hedge.fit(y, x)
+            ref = {
+                "alpha": alpha, "beta": beta,
+                "half_life": half_life(hedge.spread(y, x, alpha, beta)),
+                "beta_cv": rolling_beta_cv(y, x, window=self.beta_window),
+                "eg_stat": float(eg_statistic(y.to_numpy(), x.to_numpy(), lags=0)[0]),
+            }
+            row = cur.loc[f"{a}/{b}"]
+            for k, v in ref.items():
+                if np.isfinite(v) and np.isfinite(row[k]):
+                    worst[k] = max(worst[k], abs(row[k] - v) / max(abs(v), 1e-12))
+                elif not (np.isinf(v) and np.isinf(row[k])) and not (np.isnan(v) and np.isnan(row[k])):
+                    worst[k] = np.inf
+        ok = all(v <= rtol for v in worst.values())
+        self.last_verification = {"bars": int(self.n_bars), "pairs": len(pairs), "max_rel_err": worst, "ok": ok}
+        if not ok and resync:
+            print(f"[incremental warn] drift beyond rtol={rtol}: {worst}; rebuilding from the buffer")
+            hist, n_updates = self.history, self.n_updates
+            self.fit(np.exp(hist) if self.use_logs else hist)
+            self.n_updates = n_updates
+        return self.last_verification
+
+    # ---- persistence
+    def save(self, path: str | Path) -> Path:
+        """State + price buffer in one .npz (bar index stored as int64 ns when datetime-like)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {"tickers": self.tickers, "pairs": self.pairs, "beta_window": self.beta_window,
+                "max_obs": self.max_obs, "use_logs": self.use_logs, "verify_every": self.verify_every,
+                "verify_pairs": self.verify_pairs, "null_sims": self.null_sims, "n_updates": self.n_updates,
+                "n_bars": self.n_bars}
+        hist = self.history
+        idx = pd.DatetimeIndex(hist.index).asi8 if len(hist) else np.zeros(0, np.int64)
+        np.savez(path, meta=np.array(json.dumps(meta)), history=hist.to_numpy(dtype=float),
+                 history_index=idx, **{f"state_{k}": v for k, v in self.state.items()})
+        return path if path.suffix == ".npz" else path.with_name(path.name + ".npz")
+
+    @classmethod
+    def load(cls, path: str | Path) -> "IncrementalRanker":
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+            obj = cls(meta["tickers"], [tuple(p) for p in meta["pairs"]], beta_window=meta["beta_window"],
+                      max_obs=meta["max_obs"], use_logs=meta["use_logs"], verify_every=meta["verify_every"],
+                      verify_pairs=meta["verify_pairs"], null_sims=meta["null_sims"])
+            obj.reset(capacity=max(meta["n_bars"], 1))
+            obj.state = {k[len("state_"):]: z[k] for k in z.files if k.startswith("state_")}
+            # back into the ring at the slots of their bar numbers
+            hist, n = z["history"], meta["n_bars"]
+            slots = np.arange(n - len(hist), n) % len(obj._buf)
+            obj._buf[slots] = hist
+            obj._ts[slots] = list(pd.to_datetime(z["history_index"]))
+            obj.n_bars, obj.n_updates = n, meta["n_updates"]
+        return obj
@@ -1,26 +1,54 @@
 import numpy as np
 import pandas as pd
 import itertools
-from statsmodels.tsa.stattools import coint
 from models.hedge import OLSHedge
 from models.stats import half_life, rolling_beta_cv
 
 class PairAnalyzer:
-    def __init__(self, use_logs: bool = True, beta_window: int = 60):
+    def __init__(self, use_logs: bool = True, beta_window: int = 60,
+                 pvalue_mode: str = "asymptotic", fdr_alpha: float = 0.05,
+                 null_sims: int = 20000, null_lags: int = 1, processes: int | None = 1,
+                 score_mode: str = "gates"):
+        """
+        pvalue_mode="asymptotic": MacKinnon p-values from statsmodels' coint (p < 0.05 gate).
+        pvalue_mode="empirical":  Engle-Granger statistic against a simulated random-walk
+                                  null of matched length (cached on disk, see
+                                  analysis.coint_null); the gate is the Benjamini-Hochberg
+                                  q-value across all ranked pairs (q < fdr_alpha).
+        score_mode="gates":     sort by the three-gate integer score (then p/q, half-life).
+        score_mode="composite": all pairs in one batched pass (analysis.features); sort by
+                                the continuous composite of ADF, Hurst, variance ratio,
+                                zero crossings, half-life and beta CV. The gates are kept as
+                                columns; p-values come from the fixed-lag EG statistic.
+        """
+        if pvalue_mode not in ("asymptotic", "empirical"):
+            raise ValueError("pvalue_mode must be 'asymptotic' or 'empirical'")
+        if score_mode not in ("gates", "composite"):
+            raise ValueError("score_mode must be 'gates' or 'composite'")
         self.use_logs = use_logs
         self.beta_window = beta_window
+        self.pvalue_mode = pvalue_mode
+        self.fdr_alpha = fdr_alpha
+        self.null_sims = null_sims
+        self.null_lags = null_lags
+        self.processes = processes
+        self.score_mode = score_mode
         self.hedge = OLSHedge()
 
-    def analyze_pair(self, prices: pd.DataFrame, a: str, b: str) -> dict:
+    def _pair_frame(self, prices: pd.DataFrame, a: str, b: str) -> pd.DataFrame:
         A, B = prices[a].copy(), prices[b].copy()
         if self.use_logs:
             A, B = np.log(A), np.log(B)
-        df = pd.concat([A, B], axis=1).dropna()
+        return pd.concat([A, B], axis=1).dropna()
+
+    def analyze_pair(self, prices: pd.DataFrame, a: str, b: str) -> dict:
+        df = self._pair_frame(prices, a, b)
         if len(df) < 90:
             return {"pair": f"{a}/{b}", "n_obs": len(df), "p_value": np.nan,
                     "alpha": np.nan, "beta": np.nan, "beta_cv": np.nan,
                     "half_life": np.nan, "score": 0}
 
+        from statsmodels.tsa.stattools import coint  # deferred: heavy import
         _, pval, _ = coint(df.iloc[:,0], df.iloc[:,1])
         alpha, beta, _ = self.hedge.fit(df.iloc[:,0], df.iloc[:,1])
         if np.isnan(beta):
@@ -44,7 +72,69 @@ class PairAnalyzer:
                 "cointegration_ok": cointegration_ok, "beta_stable": beta_stable,
                 "hl_ok": hl_ok, "score": int(score)}
 
-    def rank_pairs(self, prices: pd.DataFrame, tickers: list[str]) -> pd.DataFrame:
-        rows = [self.analyze_pair(prices, a, b) for a,b in itertools.combinations(tickers, 2)]
+    def _empirical_pvalues(self, prices: pd.DataFrame, pairs: list[tuple[str, str]]) -> pd.DataFrame:
+        """EG statistic, empirical p-value and BH q-value per pair (batched per series length)."""
+        from analysis.coint_null import eg_statistic, null_distribution, empirical_pvalues, benjamini_hochberg
+
+        frames = [self._pair_frame(prices, a, b) for a, b in pairs]
+        stat = np.full(len(pairs), np.nan)
+        pval = np.full(len(pairs), np.nan)
+        by_len: dict[int, list[int]] = {}
+        for i, df in enumerate(frames):
+            if len(df) >= 90:
+                by_len.setdefault(len(df), []).append(i)
+        for n, idx in by_len.items():
+            y = np.column_stack([frames[i].iloc[:, 0].to_numpy() for i in idx])
+            x = np.column_stack([frames[i].iloc[:, 1].to_numpy() for i in idx])
+            stat[idx] = eg_statistic(y, x, lags=self.null_lags)
+            null = null_distribution(n, lags=self.null_lags, n_sims=self.null_sims, processes=self.processes)
+            pval[idx] = empirical_pvalues(stat[idx], null)
+        return pd.DataFrame({"eg_stat": stat, "p_value_emp": pval, "q_value": benjamini_hochberg(pval)})
+
+    def rank_pairs(self, prices: pd.DataFrame, tickers: list[str],
+                   pairs: list[tuple[str, str]] | None = None) -> pd.DataFrame:
+        """
+        Score and sort pairs. `pairs` restricts the candidates (e.g. within-cluster pairs from
+        analysis.clustering.candidate_pairs); default: all combinations of `tickers`.
+        """
+        pairs = list(itertools.combinations(tickers, 2)) if pairs is None else list(pairs)
+        if self.score_mode == "composite":
+            return self._rank_composite(prices, pairs)
+        rows = [self.analyze_pair(prices, a, b) for a,b in pairs]
         df = pd.DataFrame(rows)
-        return df.sort_values(by=["score","p_value","half_life"], ascending=[False, True, True]).reset_index(drop=True)
\ No newline at end of file
+        sort_p = "p_value"
+        if self.pvalue_mode == "empirical":
+            df = pd.concat([df, self._empirical_pvalues(prices, pairs)], axis=1)
+            df["cointegration_ok"] = (df["q_value"] < self.fdr_alpha).fillna(False)
+            df["score"] = (df["cointegration_ok"].astype(int) + df["beta_stable"].fillna(False).astype(int)
+                           + df["hl_ok"].fillna(False).astype(int))
+            sort_p = "q_value"
+        return df.sort_values(by=["score",sort_p,"half_life"], ascending=[False, True, True]).reset_index(drop=True)
+
+    def _rank_composite(self, prices: pd.DataFrame, pairs: list[tuple[str, str]]) -> pd.DataFrame:
+        """rank_pairs(score_mode="composite"): features, gates and p-values without a per-pair fit."""
+        from analysis.features import pair_features, composite_score
+
+        df = pair_features(prices, pairs, use_logs=self.use_logs, beta_window=self.beta_window,
+                           adf_lags=self.null_lags)
+        stat = df["adf_stat"].to_numpy()
+        if self.pvalue_mode == "empirical":
+            from analysis.coint_null import null_distribution, empirical_pvalues, benjamini_hochberg
+            pval = np.full(len(df), np.nan)
+            ok = np.isfinite(stat)
+            for n in np.unique(df["n_obs"].to_numpy()[ok]):
+                idx = np.flatnonzero(ok & (df["n_obs"].to_numpy() == n))
+                null = null_distribution(int(n), lags=self.null_lags, n_sims=self.null_sims, processes=self.processes)
+                pval[idx] = empirical_pvalues(stat[idx], null)
+            df["p_value_emp"], df["q_value"] = pval, benjamini_hochberg(pval)
+            df["cointegration_ok"] = (df["q_value"] < self.fdr_alpha).fillna(False)
+        else:
+            from statsmodels.tsa.adfvalues import mackinnonp  # deferred: heavy import
+            df["p_value"] = [float(mackinnonp(v, regression="c", N=2)) if np.isfinite(v) else np.nan for v in stat]
+            df["cointegration_ok"] = (df["p_value"] < 0.05).fillna(False)
+        df["beta_stable"] = (df["beta_cv"] < 0.2).fillna(False)
+        df["hl_ok"] = df["half_life"].between(3, 20).fillna(False)
+        df["score"] = df[["cointegration_ok", "beta_stable", "hl_ok"]].astype(int).sum(axis=1)
+        df["composite"] = composite_score(df)
+        return df.sort_values(by=["composite", "score"], ascending=[False, False],
+                              na_position="last").reset_index(drop=True)
@@ -0,0 +1,195 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+from typing import Any, Dict
+import numpy as np
+import pandas as pd
+from models import metrics
+
+# Resampling-based significance checks for a backtest: block bootstrap of the pnl
+# path, sign randomisation of pnl / trade returns, and the deflated Sharpe ratio for
+# the number of grid trials. Resamples are generated as (bars x samples) matrices and
+# scored with models.metrics in one call per chunk; chunks bound memory and can run
+# in worker processes.
+
+_N = NormalDist()
+
+
+def _as_array(x) -> np.ndarray:
+    a = np.asarray(x.to_numpy() if isinstance(x, (pd.Series, pd.DataFrame)) else x, dtype=float)
+    return a[np.isfinite(a)]
+
+
+def block_bootstrap_idx(n: int, n_samples: int, block_len: int, rng: np.random.Generator) -> np.ndarray:
+    """(n x n_samples) indices of a circular block bootstrap: random blocks of block_len bars."""
+    n_blocks = -(-n // block_len)
+    starts = rng.integers(0, n, size=(n_samples, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block_len)) % n
+    return idx.reshape(n_samples, -1)[:, :n].T
+
+
+def _bootstrap_chunk(args) -> Dict[str, np.ndarray]:
+    pnl, n_samples, block_len, seed, periods_per_year = args
+    rng = np.random.default_rng(seed)
+    sample = pnl[block_bootstrap_idx(len(pnl), n_samples, block_len, rng)]
+    _, sharpe_ann = metrics.sharpe(sample, periods_per_year)
+    mdd, _ = metrics.max_drawdown(metrics.equity_curve(sample))
+    return {"sharpe_annual": sharpe_ann, "max_drawdown": mdd,
+            "total_return": np.prod(1.0 + sample, axis=0) - 1.0}
+
+
+def _sign_chunk(args) -> np.ndarray:
+    x, n_samples, seed = args
+    rng = np.random.default_rng(seed)
+    signs = rng.integers(0, 2, size=(len(x), n_samples), dtype=np.int8) * 2 - 1
+    flipped = x[:, None] * signs
+    return flipped.mean(axis=0) / (flipped.std(axis=0) + 1e-12)
+
+
+def _run_chunks(fn, jobs: list, processes: int | None):
+    if processes == 1 or len(jobs) == 1:
+        return [fn(j) for j in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(fn, jobs))
+
+
+def _chunk_sizes(n_samples: int, chunk_size: int) -> list[int]:
+    sizes = [chunk_size] * (n_samples // chunk_size)
+    if n_samples % chunk_size:
+        sizes.append(n_samples % chunk_size)
+    return sizes
+
+
+def bootstrap_metrics(
+    pnl,
+    n_samples: int = 5000,
+    block_len: int | None = None,
+    chunk_size: int = 1000,
+    processes: int | None = 1,
+    seed: int = 0,
+    periods_per_year: float = metrics.TRADING_DAYS,
+) -> Dict[str, np.ndarray]:
+    """
+    Block-bootstrap distribution of annual Sharpe, max drawdown and total return of a
+    pnl path. block_len defaults to ~n^(1/3) bars, which keeps short-range
+    autocorrelation (e.g. multi-day trades) inside blocks.
+    """
+    x = _as_array(pnl)
+    if len(x) < 2:
+        raise ValueError("Need at least 2 pnl observations to bootstrap.")
+    block_len = block_len or max(1, int(round(len(x) ** (1 / 3))))
+    sizes = _chunk_sizes(n_samples, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(x, size, block_len, s, periods_per_year) for size, s in zip(sizes, seeds)]
+    parts = _run_chunks(_bootstrap_chunk, jobs, processes)
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def sign_randomisation_pvalue(
+    returns,
+    n_samples: int = 5000,
+    chunk_size: int = 1000,
+    processes: int | None = 1,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """
+    One-sided p-value of mean/std of `returns` (daily pnl or closed-trade returns)
+    against random long/short signs: under the null, the strategy's direction carries
+    no information, so every sign pattern is equally likely.
+    """
+    x = _as_array(returns)
+    if len(x) < 2:
+        return {"observed": float("nan"), "p_value": float("nan")}
+    observed = float(x.mean() / (x.std() + 1e-12))
+    sizes = _chunk_sizes(n_samples, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    null = np.concatenate(_run_chunks(_sign_chunk, [(x, n, s) for n, s in zip(sizes, seeds)], processes))
+    return {"observed": observed, "p_value": float((1 + np.sum(null >= observed)) / (1 + len(null)))}
+
+
+def deflated_sharpe(
+    sharpe: float,
+    n_obs: int,
+    n_trials: int,
+    trial_sharpe_std: float,
+    skew: float = 0.0,
+    kurtosis: float = 3.0,
+) -> Dict[str, float]:
+    """
+    Deflated Sharpe ratio (Bailey & Lopez de Prado): probability that the true per-bar
+    Sharpe exceeds the best Sharpe expected from `n_trials` skill-less trials whose
+    Sharpes have std `trial_sharpe_std`, given skew/kurtosis of the returns.
+    All Sharpes are per bar (not annualised).
+    """
+    gamma = 0.5772156649015329  # Euler-Mascheroni
+    if n_trials > 1:
+        sr0 = trial_sharpe_std * ((1 - gamma) * _N.inv_cdf(1 - 1 / n_trials)
+                                  + gamma * _N.inv_cdf(1 - 1 / (n_trials * np.e)))
+    else:
+        sr0 = 0.0
+    denom = np.sqrt(max(1 - skew * sharpe + (kurtosis - 1) / 4 * sharpe ** 2, 1e-12))
+    dsr = _N.cdf((sharpe - sr0) * np.sqrt(max(n_obs - 1, 1)) / denom)
+    return {"expected_max_sharpe": float(sr0), "deflated_sharpe": float(dsr)}
+
+
+def _interval(x: np.ndarray, level: float) -> tuple[float, float]:
+    lo, hi = np.nanquantile(x, [(1 - level) / 2, (1 + level) / 2])
+    return float(lo), float(hi)
+
+
+def robustness_report(
+    pnl,
+    trade_returns=None,
+    sweep: pd.DataFrame | None = None,
+    n_samples: int = 5000,
+    block_len: int | None = None,
+    level: float = 0.95,
+    chunk_size: int = 1000,
+    processes: int | None = 1,
+    seed: int = 0,
+    periods_per_year: float = metrics.TRADING_DAYS,
+) -> Dict[str, Any]:
+    """
+    Robustness summary of one backtest.
+
+    pnl / trade_returns: res["pnl"] / res["trade_returns"] of PairsZScoreOnlyStrategy.execute.
+    sweep: grid_search_pairs_params output the run was picked from; its per-bar
+    'sharpe' column sets the trial count and dispersion for the deflated Sharpe
+    (one trial per scored path and lag: combos sharing a position path count once, in
+    the count and in the Sharpe dispersion).
+    """
+    x = _as_array(pnl)
+    boot = bootstrap_metrics(x, n_samples=n_samples, block_len=block_len, chunk_size=chunk_size,
+                             processes=processes, seed=seed, periods_per_year=periods_per_year)
+    sr_bar, sr_ann = metrics.sharpe(x, periods_per_year)
+    mdd, _ = metrics.max_drawdown(metrics.equity_curve(x))
+
+    report: Dict[str, Any] = {
+        "n_obs": int(len(x)),
+        "sharpe_annual": float(sr_ann[0]),
+        "sharpe_annual_ci": _interval(boot["sharpe_annual"], level),
+        "prob_sharpe_le_0": float(np.mean(boot["sharpe_annual"] <= 0)),
+        "max_drawdown_%": float(mdd[0]) * 100.0,
+        "max_drawdown_%_ci": tuple(v * 100.0 for v in _interval(boot["max_drawdown"], level)),
+        "total_return_%_ci": tuple(v * 100.0 for v in _interval(boot["total_return"], level)),
+        "pnl_sign_test": sign_randomisation_pvalue(x, n_samples, chunk_size, processes, seed + 1),
+    }
+    if trade_returns is not None:
+        report["trade_sign_test"] = sign_randomisation_pvalue(trade_returns, n_samples, chunk_size, processes, seed + 2)
+
+    if sweep is not None and "sharpe" in sweep.columns:
+        # rows sharing a scored (lag, path) evaluation repeat its metrics: keep one of each
+        same = [c for c in ("execution_lag", "sharpe", "total_return_%", "max_drawdown_%",
+                            "number_of_position_changes") if c in sweep.columns]
+        trials = sweep.drop_duplicates(subset=same)["sharpe"].to_numpy(dtype=float)
+        ev = sweep.attrs.get("evaluations", {})
+        n_trials = ev.get("scored", ev.get("unique_paths", len(trials)))
+        centred = x - x.mean()
+        sd = x.std() + 1e-12
+        skew = float(np.mean(centred ** 3) / sd ** 3)
+        kurt = float(np.mean(centred ** 4) / sd ** 4)
+        report["deflated_sharpe"] = {
+            "n_trials": int(n_trials),
+            **deflated_sharpe(float(sr_bar[0]), len(x), int(n_trials), float(np.nanstd(trials)), skew, kurt),
+        }
+    return report
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable, Iterator, List
+import pandas as pd
+from DataStructures import BarFrequency, Enterprise, OHLCV_DTYPES
+
+# Intraday bar store, one Parquet file per ticker, frequency and month:
+#
+#   prices/ticker=<T>/bars_<freq>/<YYYY-MM>.parquet    ts (UTC, naive) | Open High Low Close | Volume
+#
+# Month files keep every read and write bounded: appending bars only rewrites the months
+# they fall in, and iter_bars streams a universe through time one month at a time (split
+# further into chunk_rows pieces), so a backtest never holds the whole history.
+# BarFrequency.DAY1 streams the daily close store (close.parquet) by calendar year.
+
+ROW_GROUP_ROWS = 50_000
+
+
+def bars_dir(ticker: str, freq: BarFrequency) -> Path:
+    return Enterprise(ticker).price_store / f"bars_{freq.value}"
+
+
+def _month(ts: pd.Timestamp) -> str:
+    return ts.strftime("%Y-%m")
+
+
+def partitions(ticker: str, freq: BarFrequency, start=None, end=None) -> List[Path]:
+    """Month files of a ticker overlapping [start, end], in time order."""
+    files = sorted(bars_dir(ticker, freq).glob("*.parquet"))
+    lo = None if start is None else _month(pd.Timestamp(start))
+    hi = None if end is None else _month(pd.Timestamp(end))
+    return [f for f in files if (lo is None or f.stem >= lo) and (hi is None or f.stem <= hi)]
+
+
+def write_bars(ticker: str, freq: BarFrequency, bars: pd.DataFrame) -> List[Path]:
+    """Merge bars (DatetimeIndex, OHLCV columns) into the month files; newer rows win."""
+    if bars.empty:
+        return []
+    bars = bars.reindex(columns=list(OHLCV_DTYPES))
+    bars.index = pd.DatetimeIndex(bars.index, name="ts")
+    if bars.index.tz is not None:
+        bars.index = bars.index.tz_convert("UTC").tz_localize(None)
+    out_dir = bars_dir(ticker, freq)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for month, part in bars.groupby(bars.index.strftime("%Y-%m")):
+        path = out_dir / f"{month}.parquet"
+        if path.exists():
+            part = pd.concat([pd.read_parquet(path), part])
+        part = part[~part.index.duplicated(keep="last")].sort_index()
+        part["Volume"] = part["Volume"].fillna(0)
+        part.astype(OHLCV_DTYPES).to_parquet(path, row_group_size=ROW_GROUP_ROWS)
+        written.append(path)
+    return written
+
+
+def download_bars(ticker: str, freq: BarFrequency, start: str, end: str) -> pd.DataFrame:
+    """Intraday OHLCV from yfinance (limited history: ~7 days of 1m, ~60 days of 5m-30m)."""
+    if freq is BarFrequency.DAY1:
+        raise ValueError("daily bars live in the close / OHLCV store (Enterprise.fetch_ohlcv)")
+    import yfinance as yf  # deferred: only needed on a download
+    end_plus = (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+    df = yf.download(ticker, start=start, end=end_plus, interval=freq.value, progress=False, auto_adjust=True)
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df = df.apply(pd.to_numeric, errors="coerce").dropna(subset=["Close"])
+    return df.reindex(columns=list(OHLCV_DTYPES))
+
+
+def fetch_bars(ticker: str, freq: BarFrequency, start: str, end: str) -> int:
+    """Download [start, end] and merge it into the store; returns the number of bars received."""
+    df = download_bars(ticker, freq, start, end)
+    write_bars(ticker, freq, df)
+    return len(df)
+
+
+def _read_part(path: Path, field: str, start, end) -> pd.Series:
+    filters = []
+    if start is not None:
+        filters.append(("ts", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("ts", "<=", pd.Timestamp(end)))
+    return pd.read_parquet(path, columns=[field], filters=filters or None)[field]
+
+
+def _daily_chunks(tickers: List[str], start, end) -> Iterator[pd.DataFrame]:
+    closes = {}
+    for t in tickers:
+        s = Enterprise(t)._read_cache()["Close"]
+        closes[t] = s.loc[pd.Timestamp(start) if start else None:pd.Timestamp(end) if end else None]
+    frame = pd.concat(closes, axis=1).sort_index()
+    for _, chunk in frame.groupby(frame.index.year):
+        yield chunk
+
+
+def iter_bars(
+    tickers: Iterable[str],
+    freq: BarFrequency,
+    start=None,
+    end=None,
+    field: str = "Close",
+    chunk_rows: int | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream (bars x tickers) frames of one field through time: one month per step (outer
+    join of the tickers' timestamps, NaN where a ticker has no bar), optionally split into
+    pieces of at most chunk_rows rows. Memory is bounded by one month of the universe.
+    """
+    tickers = list(tickers)
+    if freq is BarFrequency.DAY1:
+        chunks = _daily_chunks(tickers, start, end)
+    else:
+        months = sorted({p.stem for t in tickers for p in partitions(t, freq, start, end)})
+
+        def _months():
+            for m in months:
+                cols = {}
+                for t in tickers:
+                    path = bars_dir(t, freq) / f"{m}.parquet"
+                    if path.exists():
+                        cols[t] = _read_part(path, field, start, end)
+                frame = pd.concat(cols, axis=1).sort_index().reindex(columns=tickers)
+                if not frame.empty:
+                    yield frame
+
+        chunks = _months()
+    for chunk in chunks:
+        if chunk_rows is None or len(chunk) <= chunk_rows:
+            yield chunk
+        else:
+            for i in range(0, len(chunk), chunk_rows):
+                yield chunk.iloc[i:i + chunk_rows]
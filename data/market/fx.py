@@ -0,0 +1,102 @@
+from __future__ import annotations
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from DataStructures import DATA_ROOT, Enterprise
+
+# Currency normalisation of a price matrix.
+#
+# FX closes are cached exactly like equity closes: the yfinance pair "GBPEUR=X" is an
+# Enterprise ticker, stored under prices/ticker=GBPEUR=X/close.parquet (business days).
+# Minor-unit quotes (GBp = pence) are mapped to their ISO currency with a scale factor.
+# Conversion multiplies the whole (bars x tickers) matrix by a factor matrix built from
+# one column per distinct currency, and is memoized in memory and on disk per
+# (universe, currencies, base, window, price fingerprint).
+
+MINOR_UNITS = {"GBp": ("GBP", 0.01), "GBX": ("GBP", 0.01), "ZAc": ("ZAR", 0.01), "ILA": ("ILS", 0.01)}
+FX_CACHE = DATA_ROOT / "fx"
+
+_MEMO: dict[str, pd.DataFrame] = {}
+
+
+def normalise_currency(code: str) -> tuple[str, float]:
+    """'GBp' -> ('GBP', 0.01); ISO codes -> (code, 1.0)."""
+    if code in MINOR_UNITS:
+        return MINOR_UNITS[code]
+    return code.upper(), 1.0
+
+
+def currencies_of(tickers) -> dict[str, str]:
+    """{ticker: quote currency} from the meta JSON (fetched once if missing)."""
+    out = {}
+    for t in tickers:
+        cur = Enterprise(t).fetch_meta(force=False).get("currency")
+        if not cur:
+            raise ValueError(f"No currency in meta for {t}")
+        out[t] = cur
+    return out
+
+
+def fx_series(ccy: str, base: str, start: str, end: str, force: bool = False) -> pd.Series:
+    """Daily close of 1 `ccy` in `base` (cached like any other ticker)."""
+    if ccy == base:
+        return pd.Series(1.0, index=pd.date_range(start, end, freq="D"), name=f"{ccy}{base}")
+    s = Enterprise(f"{ccy}{base}=X", index_mode="business").fetch_close_prices(start=start, end=end, force=force)
+    return s.rename(f"{ccy}{base}")
+
+
+def fx_matrix(index: pd.DatetimeIndex, currencies: list[str], base: str, force: bool = False) -> pd.DataFrame:
+    """(bars x distinct currencies) rates on `index`: last known close on or before each bar."""
+    start = (index.min() - pd.Timedelta(days=10)).strftime("%Y-%m-%d")   # room for the as-of fill
+    end = index.max().strftime("%Y-%m-%d")
+    cols = {}
+    for ccy in currencies:
+        s = fx_series(ccy, base, start, end, force=force).dropna()
+        cols[ccy] = s.reindex(s.index.union(index)).ffill().reindex(index)
+    return pd.DataFrame(cols, index=index)
+
+
+def _memo_key(prices: pd.DataFrame, currencies: dict[str, str], base: str) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps({"tickers": list(prices.columns), "ccy": currencies, "base": base,
+                         "start": str(prices.index.min()), "end": str(prices.index.max())}).encode())
+    h.update(pd.util.hash_pandas_object(prices, index=True).to_numpy().tobytes())
+    return h.hexdigest()[:32]
+
+
+def to_base_currency(
+    prices: pd.DataFrame,
+    base: str = "EUR",
+    currencies: dict[str, str] | None = None,
+    cache: bool = True,
+    force: bool = False,
+) -> pd.DataFrame:
+    """
+    Convert a (bars x tickers) price matrix to `base` in one broadcasted multiply.
+    currencies: {ticker: quote currency} (default: meta JSON). Results are memoized in
+    memory and under data/market/fx/converted/ per (universe, currencies, base, window,
+    price content); force=True re-downloads FX and recomputes.
+    """
+    currencies = currencies or currencies_of(prices.columns)
+    key = _memo_key(prices, currencies, base)
+    path = FX_CACHE / "converted" / f"{key}.parquet"
+    if cache and not force:
+        if key in _MEMO:
+            return _MEMO[key].copy()
+        if path.exists():
+            _MEMO[key] = pd.read_parquet(path)
+            return _MEMO[key].copy()
+
+    iso, scale = zip(*(normalise_currency(currencies[t]) for t in prices.columns))
+    distinct = list(dict.fromkeys(iso))
+    rates = fx_matrix(pd.DatetimeIndex(prices.index), distinct, base, force=force)
+    pos = np.array([distinct.index(c) for c in iso])
+    factor = rates.to_numpy()[:, pos] * np.asarray(scale)[None, :]
+    out = pd.DataFrame(prices.to_numpy(dtype=float) * factor, index=prices.index, columns=prices.columns)
+
+    if cache:
+        _MEMO[key] = out
+        path.parent.mkdir(parents=True, exist_ok=True)
+        out.to_parquet(path)
+    return out.copy()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+import hashlib
+import json
+import warnings
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable
+import numpy as np
+import pandas as pd
+
+# Data-quality scan of a (bars x tickers) close matrix, all tickers in one vectorized pass:
+#
+#   stale     runs of identical closes (forward-filled calendar days, a feed that stopped);
+#             the repeats of a run of at least stale_run repeated closes are flagged
+#   outliers  robust z of log returns, (r - median) / (1.4826 * MAD) per ticker, with the
+#             scale taken over non-zero returns so stale stretches do not shrink it
+#   spikes    an outlier immediately reversed by the next return (a single bad print), or
+#             an outlying first return (a bad leading print)
+#   jumps     |log return| >= jump_log not explained by a spike (unadjusted splits)
+#   gaps      longest NaN stretch inside a ticker's own history, in bars and calendar days
+#   coverage  share of the matrix index (and of the ticker's first..last span) with a close
+#
+# Per-bar findings are int8 bit flags (FLAGS) of the same shape as the prices; the per-ticker
+# report and the flags are cached under data/market/cache/quality/ per (thresholds, price
+# content), so re-validating an unchanged universe is a file read. mask() blanks stale
+# repeats and spikes; good_tickers() lets ranking skip tickers that fail the thresholds.
+
+QUALITY_CACHE = Path("data/market/cache/quality")
+FLAGS = {"stale": 1, "outlier": 2, "jump": 4, "spike": 8}
+
+
+def _run_lengths(mask: np.ndarray) -> np.ndarray:
+    """Length of the run of True each True cell belongs to (0 where False), per column."""
+    n, k = mask.shape
+    ids = np.cumsum(~mask, axis=0) + np.arange(k) * (n + 1)
+    lengths = np.bincount(ids.ravel(), weights=mask.ravel().astype(float), minlength=k * (n + 1))
+    return np.where(mask, lengths[ids], 0).astype(np.int64)
+
+
+@dataclass
+class PriceValidator:
+    stale_run: int = 5               # flag runs of at least this many repeated closes
+    outlier_z: float = 8.0           # robust z threshold on log returns
+    jump_log: float = 0.4            # |log return| of a split-like jump (~ +49% / -33%)
+    min_coverage: float = 0.9        # share of the ticker's span with a close
+    max_stale_share: float = 0.05    # share of the ticker's closes that may be stale repeats
+    max_outlier_share: float = 0.01
+    max_gap_days: int = 10           # calendar days between consecutive closes
+
+    # ---- scan
+    def scan(self, prices: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Per-ticker report and per-bar flags of `prices` (no cache)."""
+        P = prices.to_numpy(dtype=float, na_value=np.nan)
+        n, k = P.shape
+        valid = np.isfinite(P) & (P > 0)
+        idx = np.arange(n)[:, None]
+        first = np.where(valid.any(axis=0), np.argmax(valid, axis=0), n)
+        last = np.where(valid.any(axis=0), n - 1 - np.argmax(valid[::-1], axis=0), -1)
+        in_span = (idx >= first) & (idx <= last)
+
+        # previous valid close of each bar (ffill by index), for returns across NaN days
+        prev_i = np.maximum.accumulate(np.where(valid, idx, -1), axis=0)
+        prev_i = np.vstack([np.full((1, k), -1), prev_i[:-1]])
+        has_prev = valid & (prev_i >= 0)
+        cols = np.arange(k)[None, :]
+        prev_p = P[np.maximum(prev_i, 0), cols]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = np.where(has_prev, np.log(P) - np.log(prev_p), np.nan)
+
+        # stale: repeats of the previous valid close
+        repeat = has_prev & (r == 0.0)
+        stale = repeat & (_run_lengths(repeat) >= self.stale_run)
+
+        # robust z on returns that moved
+        moved = np.where(repeat, np.nan, r)
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)          # all-NaN columns
+            med = np.nanmedian(moved, axis=0)
+            mad = 1.4826 * np.nanmedian(np.abs(moved - med), axis=0)
+            z = (r - med) / np.where(mad > 0, mad, np.nan)
+        outlier = np.abs(np.nan_to_num(z)) > self.outlier_z
+
+        # spike: an outlier reversed by the next valid return; an outlying first return
+        # marks the first close itself (a bad leading print has nothing before it)
+        nxt = pd.DataFrame(np.where(has_prev, r, np.nan)).shift(-1).bfill().to_numpy()
+        nxt_out = pd.DataFrame(np.where(has_prev, outlier, np.nan)).shift(-1).bfill().fillna(0).to_numpy() > 0
+        spike = outlier & nxt_out & (np.sign(np.nan_to_num(nxt)) == -np.sign(np.nan_to_num(r)))
+        first_ret = has_prev & (prev_i == first)
+        lead = (first_ret & outlier).any(axis=0)
+        spike[first[lead], np.flatnonzero(lead)] = True
+
+        # jump: a large move not explained by a spike on either side of it
+        around_spike = spike | (has_prev & spike[np.maximum(prev_i, 0), cols])
+        jump = (np.abs(np.nan_to_num(r)) >= self.jump_log) & ~around_spike
+
+        # gaps inside the span: NaN runs in bars, calendar days between closes
+        hole = in_span & ~valid
+        gap_bars = _run_lengths(hole).max(axis=0) if n else np.zeros(k, dtype=int)
+        days = pd.DatetimeIndex(prices.index).values.astype("datetime64[D]").astype(np.int64)[:, None]
+        gap_days = np.where(has_prev, days - days[np.maximum(prev_i, 0), 0], 0).max(axis=0) if n else np.zeros(k)
+
+        n_obs = valid.sum(axis=0)
+        span = np.maximum(last - first + 1, 1)
+        safe = np.maximum(n_obs, 1)
+        report = pd.DataFrame({
+            "first": [prices.index[i] if i < n else pd.NaT for i in first],
+            "last": [prices.index[i] if i >= 0 else pd.NaT for i in last],
+            "n_obs": n_obs,
+            "coverage": n_obs / max(n, 1),
+            "span_coverage": n_obs / span,
+            "stale_bars": stale.sum(axis=0),
+            "max_stale_run": _run_lengths(repeat).max(axis=0) if n else 0,
+            "outliers": outlier.sum(axis=0),
+            "max_abs_z": np.nanmax(np.where(np.isfinite(z), np.abs(z), np.nan), axis=0, initial=0.0),
+            "jumps": jump.sum(axis=0),
+            "spikes": spike.sum(axis=0),
+            "max_gap_bars": gap_bars,
+            "max_gap_days": gap_days,
+        }, index=prices.columns)
+        report.index.name = "ticker"
+
+        issues = {
+            "no_data": n_obs == 0,
+            "coverage": report["span_coverage"].to_numpy() < self.min_coverage,
+            "stale": report["stale_bars"].to_numpy() / safe > self.max_stale_share,
+            "outliers": report["outliers"].to_numpy() / safe > self.max_outlier_share,
+            "jumps": report["jumps"].to_numpy() > 0,
+            "gaps": report["max_gap_days"].to_numpy() > self.max_gap_days,
+        }
+        report["issues"] = [";".join(name for name, hit in issues.items() if hit[j]) for j in range(k)]
+        report["ok"] = report["issues"] == ""
+
+        flags = (stale * FLAGS["stale"] + outlier * FLAGS["outlier"] + jump * FLAGS["jump"]
+                 + spike * FLAGS["spike"]).astype(np.int8)
+        return {"report": report, "flags": pd.DataFrame(flags, index=prices.index, columns=prices.columns)}
+
+    # ---- cached entry point
+    def _key(self, prices: pd.DataFrame) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps({"config": asdict(self), "tickers": [str(c) for c in prices.columns]}).encode())
+        h.update(pd.util.hash_pandas_object(prices, index=True).to_numpy().tobytes())
+        return h.hexdigest()[:32]
+
+    def validate(self, prices: pd.DataFrame, cache: bool = True, verbose: bool = False) -> Dict[str, pd.DataFrame]:
+        """scan() memoized on disk per (thresholds, price content)."""
+        path = QUALITY_CACHE / self._key(prices)
+        if cache and (path / "report.parquet").exists():
+            out = {"report": pd.read_parquet(path / "report.parquet"),
+                   "flags": pd.read_parquet(path / "flags.parquet")}
+        else:
+            out = self.scan(prices)
+            if cache:
+                path.mkdir(parents=True, exist_ok=True)
+                out["report"].to_parquet(path / "report.parquet")
+                out["flags"].to_parquet(path / "flags.parquet")
+        if verbose:
+            bad = out["report"].loc[~out["report"]["ok"], "issues"]
+            for t, why in bad.items():
+                print(f"[quality warn] {t}: {why}")
+        return out
+
+    @staticmethod
+    def mask(prices: pd.DataFrame, flags: pd.DataFrame, kinds: Iterable[str] = ("stale", "spike")) -> pd.DataFrame:
+        """prices with the flagged bars of `kinds` set to NaN (default: stale repeats, spikes)."""
+        bits = sum(FLAGS[k] for k in kinds)
+        bad = (flags.reindex_like(prices).fillna(0).to_numpy(dtype=np.int8) & bits) != 0
+        return prices.mask(bad)
+
+    @staticmethod
+    def good_tickers(report: pd.DataFrame, tickers: Iterable[str] | None = None) -> list[str]:
+        """Tickers (default: all in the report, in order) that passed every check."""
+        tickers = list(report.index) if tickers is None else list(tickers)
+        ok = report["ok"].reindex(tickers).fillna(False)
+        return [t for t in tickers if ok[t]]
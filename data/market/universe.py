@@ -1,10 +1,62 @@
 import pandas as pd
-from DataStructures import Enterprise
+from DataStructures import Enterprise, derive_trading_days
 
-def load_universe(tickers, start="2020-01-01", end="2025-01-01", force=False, save_meta=True):
-    series = []
+def _exchange_of(e: Enterprise) -> str:
+    # meta 'exchange' if cached locally, else the ticker suffix (".AS" -> "AS")
+    if e.meta_path.exists():
+        ex = e.fetch_meta(force=False).get("exchange")
+        if ex:
+            return str(ex)
+    return e.ticker.rsplit(".", 1)[-1] if "." in e.ticker else "UNKNOWN"
+
+def migrate_universe_caches(tickers) -> dict:
+    """
+    Derive business-day copies of legacy calendar-day price caches (Enterprise.business_file,
+    under the git-ignored data/market/cache/; the calendar caches are not modified). Each
+    exchange's calendar is derived from all of its tickers at once (a day is kept if any
+    of them printed a new close), which is more robust than one ticker's own price
+    changes; the only ticker of an exchange is checked against the rest of the universe
+    (see derive_trading_days). Tickers whose copy is current are skipped unless their
+    exchange is redone. Returns {exchange: [migrated tickers]}.
+    """
+    groups: dict[str, list[Enterprise]] = {}
+    stale = set()
     for t in tickers:
         e = Enterprise(t)
+        if not e.cache_file.exists():
+            continue
+        if e._read_coverage(e._read_cache())["index_mode"] == "business":
+            continue
+        ex = _exchange_of(e)
+        groups.setdefault(ex, []).append(e)
+        if not e.business_copy_current():
+            stale.add(ex)
+    if not stale:
+        return {}
+    closes = {ex: pd.concat([e._read_cache()["Close"].rename(e.ticker) for e in members], axis=1)
+              for ex, members in groups.items()}
+
+    migrated = {}
+    for exchange, members in groups.items():
+        if exchange not in stale:
+            continue
+        others = [c for ex, c in closes.items() if ex != exchange]
+        universe = pd.concat(others, axis=1) if len(members) == 1 and others else None
+        days = derive_trading_days(closes[exchange], universe=universe)
+        migrated[exchange] = [e.ticker for e in members if e.migrate_cache(days)]
+    return migrated
+
+def load_universe(tickers, start="2020-01-01", end="2025-01-01", force=False, save_meta=True, index_mode="calendar"):
+    """
+    Close prices for `tickers` as one DataFrame. index_mode="business" keeps exchange
+    trading days only: the index is the union of the per-exchange calendars and a
+    ticker is NaN on days its own exchange was closed.
+    """
+    if index_mode == "business":
+        migrate_universe_caches(tickers)
+    series = []
+    for t in tickers:
+        e = Enterprise(t, index_mode=index_mode)
         if save_meta:
             try: e.fetch_meta(force=False)
             except Exception as ex: print(f"[meta warn] {t}: {ex}")
@@ -15,4 +67,20 @@ def load_universe(tickers, start="2020-01-01", end="2025-01-01", force=False, sa
             print(f"[price warn] {t}: {ex}")
     if not series:
         raise RuntimeError("No ticker data loaded.")
-    return pd.concat(series, axis=1).sort_index()
\ No newline at end of file
+    return pd.concat(series, axis=1).sort_index()
+
+def load_ohlcv_panel(tickers, start="2020-01-01", end="2025-01-01", force=False) -> dict:
+    """
+    OHLCV for `tickers` as {field: DataFrame (trading days x tickers)} on the union of
+    their trading days (NaN where a ticker did not trade). Tickers that fail are skipped.
+    """
+    frames = {}
+    for t in tickers:
+        try:
+            frames[t] = Enterprise(t).fetch_ohlcv(start=start, end=end, force=force)
+        except Exception as ex:
+            print(f"[ohlcv warn] {t}: {ex}")
+    if not frames:
+        raise RuntimeError("No ticker OHLCV loaded.")
+    wide = pd.concat(frames, axis=1).sort_index()   # columns (ticker, field)
+    return {f: wide.xs(f, axis=1, level=1) for f in ("Open", "High", "Low", "Close", "Volume")}
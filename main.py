@@ -1,7 +1,12 @@
+import argparse
+import json
 from pathlib import Path
-from DataStructures import TimePeriod
+from DataStructures import TimePeriod, Enterprise
 from data.market.universe import load_universe
+from data.market.fx import to_base_currency
+from data.market.quality import PriceValidator
 from analysis.pair_analysis import PairAnalyzer
+from analysis.clustering import cluster_universe, candidate_pairs, pruning_report
 import pandas as pd
 
 from strategies.ema_rsi import EmaRsiStrategy
@@ -11,6 +16,7 @@ from utils.io import prep_prices, fetch_close_prices
 from utils.helpers import extract_pair
 from utils.report import build_trade_table, print_trade_table, grid_search_pairs_params, summarize_extreme_trades
 from utils.plotting import plot_positions_with_z
+from utils.pipeline import Pipeline, files_fingerprint
 
 # ----------------- CONFIG -----------------
 DATA_ROOT = Path("data/market"); DATA_ROOT.mkdir(parents=True, exist_ok=True)
@@ -20,33 +26,251 @@ TICKERS = ["ASML.AS","BESI.AS","IFX.DE","HSBA.L","INGA.AS","ISP.MI","ABI.BR","RI
 UNIVERSE_START = "2020-01-01"   # wide enough to cover train + test
 TEST_START     = "2023-01-01"   # cutoff (train < TEST_START, test >= TEST_START)
 TEST_END       = "2025-01-01"   # optional end bound for test
+INDEX_MODE     = "calendar"     # "calendar": legacy daily ffill (README results); "business": exchange trading days only
+BASE_CURRENCY  = None           # e.g. "EUR": convert GBp names (HSBA.L, TSCO.L) with cached FX; None = raw quotes
 
+# Stage parameters (override from the CLI with --set key=value)
+PARAMS = {
+    "beta_window": 30,          # ranking: rolling-beta stability window
+    "pvalue_mode": "asymptotic",  # ranking: "empirical" = simulated EG null + BH q-values
+    "cluster_max_dist": None,   # ranking: only within-cluster pairs (e.g. 1.0); None = all pairs
+    "cluster_audit": False,     # ranking: also rank all pairs to report how many top pairs the prune kept
+    "score_mode": "gates",      # ranking: "composite" = batched mean-reversion features, continuous score
+    "quality_mask": False,      # blank stale repeats / bad prints flagged by the quality stage
+    "ranked_pos": 0,            # which ranked pair to trade
+    "entry_z": 2.4,             # 3.0 and 0.5 not that good in case in the interview we want to compare
+    "exit_z": 0.85,
+    "tx_cost_per_leg": 0.0005,  # 5 bps per leg
+    "use_rolling_z": True,
+    "z_window": 30,
+    "stop_loss_pct": 0.05,      # cut at -5% since entry
+    "take_profit_pct": 0.45,    # take profit at +45%
+    "max_bars_in_trade": None,  # (optional) time stop
+    "execution_lag": 0,         # 0: legacy same-bar fills (README results, look-ahead); 1: earn from the next bar
+}
 
-if __name__ == "__main__":
+
+# ----------------- STAGES -----------------
+def stage_prices(tickers, start, end, index_mode, base_currency):
     # -------- 1) LOAD UNIVERSE (wide window) --------
-    raw = load_universe(TICKERS, start=UNIVERSE_START, end=TEST_END, force=False, save_meta=True)
+    raw = load_universe(tickers, start=start, end=end, force=False, save_meta=True,
+                        index_mode=index_mode)  # business mode reads derived copies of legacy caches
     prices = prep_prices(raw)
-    prices.to_csv(DATA_ROOT / f"universe_close_{UNIVERSE_START}_{TEST_END}.csv")
+    if base_currency is not None:
+        prices = to_base_currency(prices, base=base_currency)
+    # the tracked snapshot is the calendar-day universe; other modes go to the ignored cache
+    out_dir = DATA_ROOT if index_mode == "calendar" else DATA_ROOT / "cache"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    prices.to_csv(out_dir / f"universe_close_{start}_{end}{'' if index_mode == 'calendar' else '_' + index_mode}.csv")
+    return prices
+
+
+def stage_quality(prices):
+    # -------- 1b) DATA QUALITY (report cached per price content) --------
+    return PriceValidator().validate(prices, verbose=True)
 
+
+def stage_split(prices, quality, test_start, test_end, quality_mask):
     # -------- 2) TRAIN/TEST SPLIT --------
-    cutoff = pd.Timestamp(TEST_START)
-    train_prices = prices.loc[prices.index < cutoff]                  # used ONLY to rank pairs
-    test_prices  = prices.loc[(prices.index >= cutoff) & (prices.index < TEST_END)]  # used for backtest
+    if quality_mask:
+        prices = PriceValidator.mask(prices, quality["flags"])
+    cutoff = pd.Timestamp(test_start)
+    return {
+        "train": prices.loc[prices.index < cutoff],                                  # used ONLY to rank pairs
+        "test": prices.loc[(prices.index >= cutoff) & (prices.index < test_end)],    # used for backtest
+    }
+
 
+def stage_ranking(split, quality, tickers, beta_window, pvalue_mode, cluster_max_dist, cluster_audit, score_mode):
     # -------- 3) RANK ON TRAIN --------
-    analyzer = PairAnalyzer(use_logs=True, beta_window=30)
-    ranked_pairs = analyzer.rank_pairs(train_prices, TICKERS)
+    good = PriceValidator.good_tickers(quality["report"], tickers)
+    if len(good) < len(tickers):
+        print(f"[quality] ranking skips {sorted(set(tickers) - set(good))}")
+    tickers = good
+    analyzer = PairAnalyzer(use_logs=True, beta_window=beta_window, pvalue_mode=pvalue_mode,
+                            score_mode=score_mode)
+    pairs = None
+    if cluster_max_dist is not None:
+        labels = cluster_universe(split["train"], tickers, max_dist=cluster_max_dist)
+        pairs = candidate_pairs(tickers, labels)
+        # the audit ranks the full universe as well, i.e. it costs what the prune saves
+        ranked_full = analyzer.rank_pairs(split["train"], tickers) if cluster_audit else None
+        print(f"[clustering] {pruning_report(tickers, pairs, ranked_full=ranked_full)}")
+    return analyzer.rank_pairs(split["train"], tickers, pairs=pairs)
+
+
+def stage_backtest(split, ranked_pairs, ranked_pos, entry_z, exit_z, tx_cost_per_leg, use_rolling_z, z_window,
+                   stop_loss_pct, take_profit_pct, max_bars_in_trade, execution_lag):
+    # -------- 4) BACKTEST ON TEST --------
+    s1, s2 = extract_pair(ranked_pairs, ranked_pos=ranked_pos)
+    strat = PairsZScoreOnlyStrategy(
+        stock1=s1, stock2=s2,
+        entry_z=entry_z, exit_z=exit_z,
+        tx_cost_per_leg=tx_cost_per_leg,
+        use_rolling_z=use_rolling_z,
+        z_window=z_window,
+        execution_lag=execution_lag,
+    )
+    res = strat.execute(
+        data=split["test"][[s1, s2]],
+        stop_loss_pct=stop_loss_pct,
+        take_profit_pct=take_profit_pct,
+        max_bars_in_trade=max_bars_in_trade,
+    )
+    series = pd.DataFrame({
+        "positions": res["positions"], "pnl": res["pnl"], "equity": res["equity"], "z": res["z"],
+        "hedge_ratio": res["hedge_ratio"],
+    })
+    return {"series": series, "stats": res["stats"], "pair": [s1, s2]}
+
+
+def stage_trades(split, backtest, tx_cost_per_leg):
+    # -------- 5) TRADE TABLE --------
+    s1, s2 = backtest["pair"]
+    series = backtest["series"]
+    beta = series["hedge_ratio"]
+    return build_trade_table(
+        positions=series["positions"],
+        prices=split["test"][[s1, s2]],
+        z=series["z"],
+        beta=beta.iloc[0] if beta.nunique() == 1 else beta,
+        tx_cost_per_leg=tx_cost_per_leg,
+    )
+
+
+def stage_report(trades, k):
+    return summarize_extreme_trades(trades, k=k, out_dir=None)  # or set a folder path
+
+
+def build_pipeline(params: dict) -> Pipeline:
+    price_files = [Enterprise(t).cache_file for t in TICKERS]
+    bt_keys = ("ranked_pos", "entry_z", "exit_z", "tx_cost_per_leg", "use_rolling_z", "z_window",
+               "stop_loss_pct", "take_profit_pct", "max_bars_in_trade", "execution_lag")
+    return (
+        Pipeline()
+        .add("prices", stage_prices,
+             params={"tickers": TICKERS, "start": UNIVERSE_START, "end": TEST_END, "index_mode": INDEX_MODE,
+                     "base_currency": BASE_CURRENCY},
+             fingerprint=lambda: files_fingerprint(price_files))
+        .add("quality", stage_quality, inputs=["prices"])
+        .add("split", stage_split, inputs=["prices", "quality"],
+             params={"test_start": TEST_START, "test_end": TEST_END, "quality_mask": params["quality_mask"]})
+        .add("ranking", stage_ranking, inputs=["split", "quality"],
+             params={"tickers": TICKERS, **{k: params[k] for k in ("beta_window", "pvalue_mode", "cluster_max_dist",
+                                                                "cluster_audit", "score_mode")}})
+        .add("backtest", stage_backtest, inputs=["split", "ranking"], params={k: params[k] for k in bt_keys})
+        .add("trades", stage_trades, inputs=["split", "backtest"],
+             params={"tx_cost_per_leg": params["tx_cost_per_leg"]})
+        .add("report", stage_report, inputs=["trades"], params={"k": 3})
+    )
+
+
+def show_results(out: dict, params: dict, plot: bool = True) -> None:
     print("Top ranked pairs (train period):")
-    print(ranked_pairs.head())
-    s1, s2 = extract_pair(ranked_pairs,ranked_pos=0)
+    print(out["ranking"].head())
+    s1, s2 = out["backtest"]["pair"]
     print(f"\nSelected top pair (trained on < {TEST_START}): {s1} / {s2}")
-    pair_prices_test = test_prices[[s1,s2]]
 
-    # Hardcode enterprises to skip compute time: comment above, uncomment below.
-    # s1, s2 = ("ASML.AS","BESI.AS")
-    # pair_prices_test = test_prices[["ASML.AS","BESI.AS"]]
+    print(f"\nBacktest summary ({TEST_START}, {TEST_END}):")
+    for k, v in out["backtest"]["stats"].items():
+        print(f"  {k}: {v}")
 
-    # -------- 4) BACKTEST ON TEST --------
+    print(f"\nTrade periods ({TEST_START}, {TEST_END}):")
+    print_trade_table(out["trades"])
+    print(out["report"]["top_gains"])
+    print(out["report"]["top_losses"])
+
+    if plot:
+        series = out["backtest"]["series"]
+        plot_positions_with_z(
+            prices=out["split"]["test"][[s1, s2]],
+            positions=series["positions"],
+            z=series["z"],
+            entry_z=params["entry_z"],
+            exit_z=params["exit_z"],
+            title=f"{s1} /  {s2} - positions & z-score (test ≥ {TEST_START})",
+        )
+
+
+def record_run(out: dict, params: dict) -> str:
+    """Add the pipeline's backtest (series, stats, trades) to the results store."""
+    from utils.results_store import ResultsStore
+    s1, s2 = out["backtest"]["pair"]
+    series = out["backtest"]["series"]
+    run_id = ResultsStore().add_run(
+        {"positions": series["positions"], "pnl": series["pnl"], "equity": series["equity"],
+         "stats": out["backtest"]["stats"]},
+        pair=(s1, s2), params=params, data=out["split"]["test"][[s1, s2]], trades=out["trades"],
+        tags={"test_start": TEST_START, "test_end": TEST_END, "base_currency": BASE_CURRENCY},
+    )
+    print(f"[results] run {run_id} recorded")
+    return run_id
+
+
+def serve(pipeline: Pipeline, params: dict, top_n: int, host: str, port: int, unix_path: str | None) -> None:
+    """Signal service over the top-N ranked pairs, warmed on the test window (cached stages)."""
+    import asyncio
+    from utils.signal_service import PairState, SignalService
+    out = pipeline.run(targets=["split", "ranking"])
+    n = min(top_n, len(out["ranking"]))
+    pairs = [extract_pair(out["ranking"], ranked_pos=i) for i in range(n)]
+    state = PairState(
+        out["split"]["test"], pairs,
+        **{k: params[k] for k in ("entry_z", "exit_z", "tx_cost_per_leg", "use_rolling_z", "z_window",
+                                  "stop_loss_pct", "take_profit_pct", "max_bars_in_trade", "execution_lag")},
+    )
+    asyncio.run(SignalService(state).serve(host=host, port=port, unix_path=unix_path))
+
+
+def _parse_sets(items) -> dict:
+    out = {}
+    for item in items or []:
+        k, _, v = item.partition("=")
+        if k not in PARAMS:
+            raise SystemExit(f"unknown parameter {k!r}; known: {', '.join(PARAMS)}")
+        try:
+            out[k] = json.loads(v)
+        except json.JSONDecodeError:
+            out[k] = v
+    return out
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Pairs-trading pipeline (cached stages).")
+    sub = cli.add_subparsers(dest="cmd")
+    p_run = sub.add_parser("run", help="run the pipeline, re-running only stale stages")
+    p_run.add_argument("--set", action="append", metavar="KEY=VALUE", help="override a stage parameter")
+    p_run.add_argument("--force", action="append", default=[], metavar="STAGE", help="re-run a stage even if cached")
+    p_run.add_argument("--no-plot", action="store_true")
+    p_run.add_argument("--record", action="store_true", help="add the backtest to the results store (.results/)")
+    p_status = sub.add_parser("status", help="show which stages are cached / stale")
+    p_status.add_argument("--set", action="append", metavar="KEY=VALUE")
+    p_serve = sub.add_parser("serve", help="serve live z / position / open trade of the top ranked pairs")
+    p_serve.add_argument("--set", action="append", metavar="KEY=VALUE")
+    p_serve.add_argument("--top-n", type=int, default=100)
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_serve.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    p_gc = sub.add_parser("gc", help="delete artifacts not used by the last N runs")
+    p_gc.add_argument("--keep-runs", type=int, default=5)
+    args = cli.parse_args()
+
+    params = {**PARAMS, **_parse_sets(getattr(args, "set", None))}
+    pipeline = build_pipeline(params)
+
+    if args.cmd == "status":
+        print(pipeline.status().to_string(index=False))
+    elif args.cmd == "serve":
+        serve(pipeline, params, args.top_n, args.host, args.port, args.unix)
+    elif args.cmd == "gc":
+        print(pipeline.store.gc(keep_runs=args.keep_runs))
+    else:
+        out = pipeline.run(force=getattr(args, "force", []))
+        if args.record:
+            record_run(out, params)
+        show_results(out, params, plot=not getattr(args, "no_plot", False))
+
+    # Hardcode enterprises to skip compute time: --set ranked_pos=N picks another ranked pair.
 
     # 1st Assessment Delivery (re-structured)
     # strat = EmaRsiStrategy(
@@ -61,21 +285,6 @@ if __name__ == "__main__":
     # cum = (1 + res["portfolio_ew_returns"]).cumprod()
     # print(cum.tail())
 
-    strat = PairsZScoreOnlyStrategy(
-        stock1=s1, stock2=s2,
-        entry_z=2.4, exit_z=0.85, # 3.0 and 0.5 not that good in case in the interview we want to compare
-        tx_cost_per_leg=0.0005,   # 5 bps per leg
-        use_rolling_z=True,
-        z_window=30,
-    )
-
-    res = strat.execute(
-        data=pair_prices_test,
-        stop_loss_pct=0.05,         # cut at -5% since entry
-        take_profit_pct=0.45,       # take profit at +45%
-        max_bars_in_trade=None,       # (optional) time stop
-    )
-
     # Greedy search using 1) sharpe; 2) entry & exit sharpe ;3) stop loss & gain;
     # best = grid_search_pairs_params(
     #     prices=pair_prices_test,   # your test DataFrame with columns [s1, s2]
@@ -93,30 +302,7 @@ if __name__ == "__main__":
     # print("\nTop 10 combos:\n")
     # print(best.head(10))
 
-    print(f"\nBacktest summary ({TEST_START}, {TEST_END}):")
-    for k, v in res["stats"].items():
-        print(f"  {k}: {v}")
-
-    # -------- 5) TRADE TABLE + PLOT --------
-    trades = build_trade_table(
-        positions=res["positions"],
-        prices=pair_prices_test,
-        z=res["z"],
-        beta=res["hedge_ratio"],
-        tx_cost_per_leg=strat.tx_cost_per_leg,
-    )
-
-    print(f"\nTrade periods ({TEST_START}, {TEST_END}):")
-    print_trade_table(trades)
-    extremes = summarize_extreme_trades(trades, k=3, out_dir=None)  # or set a folder path
-    print(extremes["top_gains"])
-    print(extremes["top_losses"])
-
-    plot_positions_with_z(
-        prices=pair_prices_test,
-        positions=res["positions"],
-        z=res["z"],
-        entry_z=strat.entry_z,
-        exit_z=strat.exit_z,
-        title=f"{s1} /  {s2} - positions & z-score (test ≥ {TEST_START})",
-    )
\ No newline at end of file
+    # Headless batch export of the top-N ranked pairs (parallel, Agg backend):
+    # from utils.plotting import export_top_pair_plots
+    # export_top_pair_plots(ranked_pairs, test_prices, out_dir="images/pairs", top_n=10,
+    #                       strategy={"entry_z": 2.4, "exit_z": 0.85, "use_rolling_z": True, "z_window": 30})
@@ -0,0 +1,111 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Iterable
+import numpy as np
+import pandas as pd
+
+# Volume-aware transaction costs on an OHLCV panel {field: DataFrame (bars x tickers)}
+# (see data.market.universe.load_ohlcv_panel). Every estimate at bar t only uses bars
+# up to t-1, so the cost of a trade decided on the close of t is known at that point.
+#
+#   half spread  Corwin-Schultz high/low estimator, averaged over spread_window bars
+#   impact       impact_coef * sigma_daily * sqrt(Q / ADV)   (square-root law)
+#   capacity     Q_max = max_participation * ADV per leg; a pair trades at most the
+#                smaller of its legs' Q_max
+#
+# Costs are one-way fractions of the traded notional, like tx_cost_per_leg.
+
+_K = 3.0 - 2.0 * np.sqrt(2.0)
+
+
+def corwin_schultz_spread(high: pd.DataFrame, low: pd.DataFrame) -> pd.DataFrame:
+    """Bid-ask spread estimate per bar from the highs/lows of bars t-1 and t (negative -> 0)."""
+    hl = np.log(high / low) ** 2
+    beta = hl + hl.shift(1)
+    h2 = np.maximum(high, high.shift(1))
+    l2 = np.minimum(low, low.shift(1))
+    gamma = np.log(h2 / l2) ** 2
+    alpha = (np.sqrt(2.0 * beta) - np.sqrt(beta)) / _K - np.sqrt(gamma / _K)
+    spread = 2.0 * (np.exp(alpha) - 1.0) / (1.0 + np.exp(alpha))
+    return spread.clip(lower=0.0)
+
+
+@dataclass
+class CostModel:
+    notional: float = 1_000_000.0     # notional traded per leg on a position change (currency)
+    spread_window: int = 20
+    adv_window: int = 20
+    vol_window: int = 20
+    impact_coef: float = 1.0
+    max_participation: float = 0.10   # share of ADV one leg may trade in a bar
+    fallback: float = 0.0005          # cost where the panel has no estimate yet (warm-up, missing volume)
+
+    # ---- per-ticker inputs (bars x tickers), all lagged one bar
+    def half_spread(self, panel: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        cs = corwin_schultz_spread(panel["High"], panel["Low"])
+        return (cs.rolling(self.spread_window, min_periods=self.spread_window // 2).mean() / 2.0).shift(1)
+
+    def adv(self, panel: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        traded = panel["Close"] * panel["Volume"].where(panel["Volume"] > 0)
+        return traded.rolling(self.adv_window, min_periods=self.adv_window // 2).mean().shift(1)
+
+    def volatility(self, panel: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        rets = panel["Close"].pct_change()
+        return rets.rolling(self.vol_window, min_periods=self.vol_window // 2).std().shift(1)
+
+    def capacity(self, panel: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """Max notional per leg and bar."""
+        return self.max_participation * self.adv(panel)
+
+    # ---- costs
+    def leg_costs(self, panel: Dict[str, pd.DataFrame], notional: float | pd.DataFrame | None = None) -> pd.DataFrame:
+        """One-way cost per ticker and bar for trading `notional` (default self.notional)."""
+        q = self.notional if notional is None else notional
+        adv = self.adv(panel)
+        impact = self.impact_coef * self.volatility(panel) * np.sqrt(q / adv)
+        return (self.half_spread(panel) + impact).fillna(self.fallback)
+
+    def pair_costs(self, panel: Dict[str, pd.DataFrame], pairs: Iterable[tuple[str, str]]) -> pd.DataFrame:
+        """
+        Cost of one unit of position change per pair and bar (both legs), with the traded
+        notional capped at the pair's capacity. Columns 'A/B'; all pairs in one pass.
+        """
+        pairs = list(pairs)
+        a = [p[0] for p in pairs]
+        b = [p[1] for p in pairs]
+        cap = self.capacity(panel)
+        pair_cap = np.fmin(cap[a].to_numpy(), cap[b].to_numpy())
+        q = np.fmin(self.notional, pair_cap)      # NaN capacity (warm-up) -> full notional
+
+        adv, vol, hs = self.adv(panel), self.volatility(panel), self.half_spread(panel)
+        cols = [f"{x}/{y}" for x, y in pairs]
+
+        def leg(t):
+            cost = hs[t].to_numpy() + self.impact_coef * vol[t].to_numpy() * np.sqrt(q / adv[t].to_numpy())
+            return np.where(np.isfinite(cost), cost, self.fallback)
+
+        return pd.DataFrame(leg(a) + leg(b), index=panel["Close"].index, columns=cols)
+
+    def fill_fraction(self, panel: Dict[str, pd.DataFrame], pairs: Iterable[tuple[str, str]]) -> pd.DataFrame:
+        """
+        Share of a full position (notional per leg) each pair can trade per bar, capped at 1:
+        the fill_cap of PairsZScoreOnlyStrategy.prepare for partial fills. Columns 'A/B';
+        NaN capacity (warm-up) -> 1.
+        """
+        pairs = list(pairs)
+        cap = self.capacity(panel)
+        pair_cap = np.fmin(cap[[p[0] for p in pairs]].to_numpy(), cap[[p[1] for p in pairs]].to_numpy())
+        frac = np.where(np.isfinite(pair_cap), np.minimum(pair_cap / self.notional, 1.0), 1.0)
+        return pd.DataFrame(frac, index=panel["Close"].index, columns=[f"{a}/{b}" for a, b in pairs])
+
+    def pair_capacity(self, panel: Dict[str, pd.DataFrame], pairs: Iterable[tuple[str, str]],
+                      quantile: float = 0.1) -> pd.Series:
+        """
+        Capacity per pair: a low quantile (default 10%) over bars of min(leg capacities),
+        i.e. the notional the pair could trade on all but its thinnest days.
+        """
+        pairs = list(pairs)
+        cap = self.capacity(panel)
+        per_bar = np.fmin(cap[[p[0] for p in pairs]].to_numpy(), cap[[p[1] for p in pairs]].to_numpy())
+        return pd.Series(np.nanquantile(per_bar, quantile, axis=0),
+                         index=[f"{a}/{b}" for a, b in pairs], name="capacity")
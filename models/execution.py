@@ -0,0 +1,58 @@
+from __future__ import annotations
+import numpy as np
+
+# Execution model: turns target positions (decided on the close of the signal bar) into
+# the exposure actually held, for (bars,) or (bars x paths) arrays like models.metrics.
+#
+#   lag      exposure over bar t is the target of bar t - lag. lag=0 earns the return of
+#            the bar that produced the signal (look-ahead); lag=1 fills on the signal
+#            close and earns from the next bar; lag=N adds N-1 bars of latency.
+#   open     with open fills, the fill happens at the open of bar t: the previous exposure
+#            still earns the overnight gap close[t-1] -> open[t] (see gap_adjustment)
+#   caps     partial fills: |Δexposure| per bar is capped (fraction of a full position, e.g.
+#            pair capacity / notional), the rest of the order carries over to later bars
+
+
+def lag_positions(positions, lag: int) -> np.ndarray:
+    """Targets shifted down by `lag` bars (flat before the first fill); dtype is kept."""
+    pos = np.asarray(positions)
+    lag = int(lag)
+    if lag < 0:
+        raise ValueError(f"execution lag must be >= 0, got {lag}")
+    if lag == 0:
+        return pos
+    out = np.zeros_like(pos)
+    if lag < pos.shape[0]:
+        out[lag:] = pos[:-lag]
+    return out
+
+
+def partial_fills(targets, cap) -> np.ndarray:
+    """
+    Exposure that moves toward the target by at most cap[t] per bar. cap: scalar or
+    (bars,) array, NaN = no cap. One pass over the bars, vectorized over the paths.
+    """
+    tgt = np.asarray(targets, dtype=float)
+    squeeze = tgt.ndim == 1
+    if squeeze:
+        tgt = tgt[:, None]
+    cap = np.broadcast_to(np.nan_to_num(np.asarray(cap, dtype=float), nan=np.inf), (tgt.shape[0],))
+    out = np.empty_like(tgt)
+    held = np.zeros(tgt.shape[1])
+    for t in range(tgt.shape[0]):
+        held = held + np.clip(tgt[t] - held, -cap[t], cap[t])
+        out[t] = held
+    return out[:, 0] if squeeze else out
+
+
+def gap_adjustment(exposure, gap_ret) -> np.ndarray:
+    """
+    Open fills: pnl correction (prev - new exposure) * gap for each bar, so the position
+    held into the open earns close[t-1] -> open[t] and the new one only the rest of bar t.
+    """
+    pos = np.asarray(exposure)
+    if pos.ndim == 1:
+        pos = pos[:, None]
+    prev = np.zeros_like(pos)
+    prev[1:] = pos[:-1]
+    return (prev - pos) * np.asarray(gap_ret)[:, None]
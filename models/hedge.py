@@ -1,7 +1,5 @@
 import numpy as np
 import pandas as pd
-import statsmodels.api as sm
-from statsmodels.regression.linear_model import OLS
 
 class OLSHedge:
     # fits y = alpha + beta * x
@@ -9,6 +7,8 @@ class OLSHedge:
         xy = pd.concat([y, x], axis=1).dropna()
         if len(xy) < 30:
             return np.nan, np.nan, None
+        import statsmodels.api as sm  # deferred: heavy import
+        from statsmodels.regression.linear_model import OLS
         X = sm.add_constant(xy.iloc[:, 1])
         model = OLS(xy.iloc[:, 0], X).fit()
         alpha = float(model.params["const"])
@@ -18,4 +18,64 @@ class OLSHedge:
     @staticmethod
     def spread(y: pd.Series, x: pd.Series, alpha: float, beta: float) -> pd.Series:
         xy = pd.concat([y, x], axis=1).dropna()
-        return xy.iloc[:, 0] - (alpha + beta * xy.iloc[:, 1])
\ No newline at end of file
+        return xy.iloc[:, 0] - (alpha + beta * xy.iloc[:, 1])
+
+def _window_sum(a: np.ndarray, window: int) -> np.ndarray:
+    # trailing-window sums from one running (cumulative) sum: S[t] = C[t] - C[t-w]
+    c = np.cumsum(a, axis=0)
+    out = c.copy()
+    out[window:] -= c[:-window]
+    return out
+
+
+def rolling_hedge_zscore(y, x, beta_window: int = 60, z_window: int = 30, min_periods: int | None = None) -> dict:
+    """
+    Rolling OLS hedge ratio of y on x and the z-score of the spread y_t - beta_t * x_t,
+    using only data up to each bar (no look-ahead).
+
+    Everything comes from running sums (sum x, sum y, sum xy, sum x^2 over the beta window,
+    then sum s, sum s^2 over the z window), so it is O(n) and works on (bars,) or
+    (bars x pairs) arrays at once. Inputs are de-meaned by their first value before
+    summing, which leaves beta/z unchanged but keeps the sums well conditioned.
+
+    Returns a dict of arrays with the input shape: 'beta', 'spread', 'z'.
+    beta needs a full window of valid bars; z needs `min_periods` (default z_window)
+    valid spreads. NaN bars are skipped by the sums.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    squeeze = y.ndim == 1
+    if squeeze:
+        y, x = y[:, None], x[:, None]
+    min_periods = z_window if min_periods is None else int(min_periods)
+
+    cols = np.arange(y.shape[1])
+    ok = np.isfinite(y) & np.isfinite(x)
+    first = np.argmax(ok, axis=0)
+    yc = np.where(ok, y - y[first, cols], 0.0)
+    xc = np.where(ok, x - x[first, cols], 0.0)
+    w = _window_sum(ok.astype(float), beta_window)
+    sx, sy = _window_sum(xc, beta_window), _window_sum(yc, beta_window)
+    sxy, sxx = _window_sum(xc * yc, beta_window), _window_sum(xc * xc, beta_window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        beta = (w * sxy - sx * sy) / (w * sxx - sx * sx)
+    beta[w < beta_window] = np.nan
+
+    spread = y - beta * x
+    valid = np.isfinite(spread)
+    # de-mean by each column's first valid spread (mean/std are shift invariant)
+    first = np.argmax(valid, axis=0)
+    s0 = np.where(valid.any(axis=0), spread[first, cols], 0.0)
+    sc = np.where(valid, spread - s0, 0.0)
+    n = _window_sum(valid.astype(float), z_window)
+    s1, s2 = _window_sum(sc, z_window), _window_sum(sc * sc, z_window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = s1 / n
+        sd = np.sqrt(np.maximum(s2 / n - mu * mu, 0.0))
+        z = (sc - mu) / sd
+    z[(n < min_periods) | ~valid] = np.nan
+
+    out = {"beta": beta, "spread": spread, "z": z}
+    if squeeze:
+        out = {k: v[:, 0] for k, v in out.items()}
+    return out
@@ -0,0 +1,197 @@
+from __future__ import annotations
+import numpy as np
+
+TRADING_DAYS = 252
+
+# All functions take arrays shaped (bars,) or (bars x strategies) and return one
+# value per strategy (column), so thousands of equity curves go through one call.
+# float32 returns stay float32 and integer positions (e.g. int8) stay integer, so a
+# compact batch is not upcast to float64 on the way in (see PairsZScoreOnlyStrategy.dtype).
+
+
+def _as_2d(a) -> np.ndarray:
+    a = np.asarray(a)
+    if a.dtype != np.float32:
+        a = a.astype(float, copy=False)
+    return a[:, None] if a.ndim == 1 else a
+
+
+def _positions_2d(a) -> np.ndarray:
+    a = np.asarray(a)
+    if not np.issubdtype(a.dtype, np.integer):
+        a = a.astype(float, copy=False)
+    return a[:, None] if a.ndim == 1 else a
+
+
+def equity_curve(pnl) -> np.ndarray:
+    return np.cumprod(1.0 + _as_2d(pnl), axis=0)
+
+
+def sharpe(pnl, periods_per_year: float = TRADING_DAYS) -> tuple[np.ndarray, np.ndarray]:
+    """(per-bar Sharpe, annualised Sharpe) = mean / std (ddof=0), times sqrt(periods)."""
+    r = _as_2d(pnl)
+    per_bar = r.mean(axis=0) / (r.std(axis=0) + 1e-12)
+    return per_bar, per_bar * np.sqrt(periods_per_year)
+
+
+def sortino(pnl, periods_per_year: float = TRADING_DAYS) -> np.ndarray:
+    """Annualised mean / downside deviation (root mean square of negative returns)."""
+    r = _as_2d(pnl)
+    downside = np.sqrt(np.mean(np.minimum(r, 0.0) ** 2, axis=0))
+    return r.mean(axis=0) / (downside + 1e-12) * np.sqrt(periods_per_year)
+
+
+def max_drawdown(equity) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Max drawdown as a positive fraction, and the longest underwater stretch in bars
+    (bars spent below the running peak).
+    """
+    eq = _as_2d(equity)
+    if eq.shape[0] == 0:
+        zeros = np.zeros(eq.shape[1])
+        return zeros, zeros.astype(int)
+    peak = np.maximum.accumulate(eq, axis=0)
+    mdd = -(eq / peak - 1.0).min(axis=0)
+
+    # bars since the last new peak; its max is the longest drawdown duration
+    idx = np.arange(eq.shape[0], dtype=np.int32)[:, None]
+    last_peak = np.maximum.accumulate(np.where(eq >= peak, idx, -1), axis=0)
+    duration = (idx - last_peak).max(axis=0)
+    return mdd, duration
+
+
+def annual_return(equity, periods_per_year: float = TRADING_DAYS) -> np.ndarray:
+    eq = _as_2d(equity)
+    if eq.shape[0] == 0:
+        return np.zeros(eq.shape[1])
+    with np.errstate(invalid="ignore"):
+        return np.power(np.maximum(eq[-1], 0.0), periods_per_year / eq.shape[0]) - 1.0
+
+
+def calmar(equity, periods_per_year: float = TRADING_DAYS) -> np.ndarray:
+    mdd, _ = max_drawdown(equity)
+    return annual_return(equity, periods_per_year) / (mdd + 1e-12)
+
+
+def position_changes(positions) -> np.ndarray:
+    """|Δposition| per bar; the first bar counts as a change from flat."""
+    pos = _positions_2d(positions)
+    if pos.shape[0] == 0:
+        return pos
+    return np.abs(np.diff(pos, axis=0, prepend=np.zeros((1, pos.shape[1]), dtype=pos.dtype)))
+
+
+def turnover(positions) -> np.ndarray:
+    """Total |Δposition| per strategy (a flip +1 -> -1 counts 2)."""
+    return position_changes(positions).sum(axis=0)
+
+
+def exposure(positions) -> np.ndarray:
+    """Fraction of bars with a non-zero position."""
+    pos = _positions_2d(positions)
+    if pos.shape[0] == 0:
+        return np.zeros(pos.shape[1])
+    return (pos != 0).mean(axis=0)
+
+
+def trade_returns(pnl, positions) -> dict:
+    """
+    Compounded return of every closed trade, for all strategies at once.
+
+    A trade starts when the position leaves 0 and lasts while it is non-zero (a
+    direct flip stays in the same trade). The last trade of a strategy is dropped
+    if it is still open on the final bar.
+
+    Returns a dict of flat arrays: 'returns', 'strategy' (column of each trade),
+    'start' and 'end' (bar indices, inclusive).
+    """
+    r, pos = _as_2d(pnl), _positions_2d(positions)
+    n, k = pos.shape
+    active = pos != 0
+    prev = np.zeros_like(active)
+    prev[1:] = active[:-1]
+    entries = active & ~prev
+
+    # column-major flattening keeps each strategy's bars contiguous, so every trade
+    # is one contiguous segment of the active bars and reduceat compounds it
+    act_flat = active.T.ravel()
+    ent_flat = entries.T.ravel()
+    if not act_flat.any():
+        empty = np.empty(0)
+        return {"returns": empty, "strategy": empty.astype(int),
+                "start": empty.astype(int), "end": empty.astype(int)}
+
+    growth = (1.0 + r.T.ravel())[act_flat]
+    seg_starts = np.flatnonzero(ent_flat[act_flat])
+    rets = np.multiply.reduceat(growth, seg_starts) - 1.0
+
+    start_flat = np.flatnonzero(ent_flat)
+    seg_len = np.diff(np.append(seg_starts, growth.size))
+    strategy = start_flat // n
+    start = start_flat % n
+    end = start + seg_len - 1
+
+    closed = ~((end == n - 1) & active[-1, strategy])
+    return {"returns": rets[closed], "strategy": strategy[closed],
+            "start": start[closed], "end": end[closed]}
+
+
+def trade_stats(pnl, positions, trades: dict | None = None) -> dict:
+    """
+    Per-strategy closed-trade count, winners, win rate, mean and std (ddof=0).
+    `trades` may be a precomputed trade_returns() result for the same inputs.
+    """
+    k = _positions_2d(positions).shape[1]
+    tr = trade_returns(pnl, positions) if trades is None else trades
+    rets, col = tr["returns"], tr["strategy"]
+    n = np.bincount(col, minlength=k)
+    wins = np.bincount(col, weights=(rets > 0).astype(float), minlength=k).astype(int)
+    s1 = np.bincount(col, weights=rets, minlength=k)
+    s2 = np.bincount(col, weights=rets * rets, minlength=k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, s1 / n, 0.0)
+        var = np.where(n > 0, s2 / n - mean ** 2, 0.0)
+        win_rate = np.where(n > 0, wins / n, 0.0)
+    return {
+        "n_trades": n,
+        "positive_trades": wins,
+        "positive_trade_rate": win_rate,
+        "avg_trade_return": mean,
+        "std_trade_return": np.sqrt(np.maximum(var, 0.0)),
+    }
+
+
+def performance_summary(
+    pnl,
+    positions,
+    periods_per_year: float = TRADING_DAYS,
+    trades: dict | None = None,
+) -> dict:
+    """
+    All metrics for a (bars x strategies) batch in one pass. Every value is an array
+    with one entry per strategy.
+    """
+    r, pos = _as_2d(pnl), _positions_2d(positions)
+    eq = equity_curve(r)
+    final = eq[-1] if eq.shape[0] else np.ones(r.shape[1])
+    sr_bar, sr_ann = sharpe(r, periods_per_year)
+    mdd, mdd_dur = max_drawdown(eq)
+    ann_ret = annual_return(eq, periods_per_year)
+    out = {
+        "n_bars": np.full(r.shape[1], r.shape[0]),
+        "final_equity": final,
+        "total_return": final - 1.0,
+        "annual_return": ann_ret,
+        "avg_return": r.mean(axis=0),
+        "vol_return": r.std(axis=0),
+        "sharpe": sr_bar,
+        "sharpe_annual": sr_ann,
+        "sortino_annual": sortino(r, periods_per_year),
+        "max_drawdown": mdd,
+        "max_drawdown_duration": mdd_dur,
+        "calmar": ann_ret / (mdd + 1e-12),
+        "turnover": turnover(pos),
+        "exposure": exposure(pos),
+    }
+    out.update(trade_stats(r, pos, trades=trades))
+    return out
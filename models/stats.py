@@ -1,12 +1,12 @@
 import numpy as np
 import pandas as pd
-import statsmodels.api as sm
-from statsmodels.regression.linear_model import OLS
 
 def half_life(spread: pd.Series) -> float:
     s = spread.dropna()
     if len(s) < 60:
         return np.nan
+    import statsmodels.api as sm  # deferred: heavy import
+    from statsmodels.regression.linear_model import OLS
     s_lag = s.shift(1).dropna()
     delta = (s - s_lag).dropna()
     s_lag = s_lag.loc[delta.index]
@@ -19,6 +19,8 @@ def rolling_beta_cv(y: pd.Series, x: pd.Series, window: int = 60) -> float:
     xy = pd.concat([y, x], axis=1).dropna()
     if len(xy) < window + 10:
         return np.nan
+    import statsmodels.api as sm  # deferred: heavy import
+    from statsmodels.regression.linear_model import OLS
     betas = []
     for i in range(window, len(xy)):
         X = sm.add_constant(xy.iloc[i-window:i, 1])
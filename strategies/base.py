@@ -1,13 +1,121 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from collections.abc import Mapping
+from typing import Dict, Any, Callable, Iterable
+import numpy as np
 import pandas as pd
 
 Result = Dict[str, Any]
 
+class LazyResult(Mapping):
+    """
+    Dict-like result whose fields are computed on first access and cached.
+
+    Builders are zero-argument callables registered with add(). Names starting with
+    '_' are internal intermediates shared between fields and are not listed in
+    keys(). `fields` limits which public fields are exposed (None = all).
+    """
+
+    def __init__(self, fields: Iterable[str] | None = None):
+        self._builders: Dict[str, Callable[[], Any]] = {}
+        self._values: Dict[str, Any] = {}
+        self._fields = None if fields is None else tuple(fields)
+
+    def add(self, name: str, builder: Callable[[], Any]) -> None:
+        self._builders[name] = builder
+
+    def get_field(self, name: str) -> Any:
+        # internal access: ignores the `fields` restriction
+        if name not in self._values:
+            if name not in self._builders:
+                raise KeyError(name)
+            self._values[name] = self._builders[name]()
+        return self._values[name]
+
+    def _public(self) -> list[str]:
+        names = [k for k in self._builders if not k.startswith("_")]
+        if self._fields is not None:
+            names = [k for k in names if k in self._fields]
+        return names
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._public():
+            raise KeyError(key)
+        return self.get_field(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        # callers that annotate the result keep working as with a plain dict
+        self._builders.setdefault(key, lambda: value)
+        self._values[key] = value
+        if self._fields is not None and key not in self._fields:
+            self._fields = self._fields + (key,)
+
+    def __iter__(self):
+        return iter(self._public())
+
+    def __len__(self) -> int:
+        return len(self._public())
+
+    @property
+    def computed(self) -> list[str]:
+        """Public fields already materialised."""
+        return [k for k in self._public() if k in self._values]
+
+    def to_dict(self) -> Result:
+        return {k: self[k] for k in self}
+
+    def __repr__(self) -> str:
+        return f"LazyResult(fields={self._public()}, computed={self.computed})"
+
+class PackedMask:
+    """
+    Boolean series stored as bits (np.packbits): one bit per bar instead of one byte,
+    index shared by reference. Used for the stop masks of compact results; to_series()
+    gives back the boolean Series.
+    """
+
+    __slots__ = ("bits", "n", "index", "name")
+
+    def __init__(self, mask, index: pd.Index | None = None, name: str | None = None):
+        if isinstance(mask, pd.Series):
+            index = mask.index if index is None else index
+            name = mask.name if name is None else name
+        values = np.asarray(mask, dtype=bool)
+        self.bits = np.packbits(values)
+        self.n = values.size
+        self.index = index
+        self.name = name
+
+    def to_numpy(self) -> np.ndarray:
+        return np.unpackbits(self.bits, count=self.n).astype(bool)
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(self.to_numpy(), index=self.index, name=self.name)
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.to_numpy()
+        return out if dtype is None else out.astype(dtype)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def any(self) -> bool:
+        return bool(self.bits.any())
+
+    def sum(self) -> int:
+        return int(np.unpackbits(self.bits, count=self.n).sum())
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def __repr__(self) -> str:
+        return f"PackedMask(n={self.n}, set={self.sum()})"
+
+
 class Strategy(ABC):
     """Minimal base: every strategy exposes execute(data) -> Result dict."""
 
     @abstractmethod
     def execute(self, data: pd.DataFrame, **kwargs) -> Result:
-        ...
\ No newline at end of file
+        ...
@@ -0,0 +1,92 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Any, Sequence
+import pandas as pd
+import numpy as np
+from models import metrics
+from .base import Strategy
+from .zscore_only import ZScoreSpreadMixin
+
+def johansen_weights(prices: np.ndarray, det_order: int = 0, k_ar_diff: int = 1) -> Dict[str, Any]:
+    """
+    Johansen test on a (bars x legs) matrix. Returns the trace statistic and 95% critical
+    value for r=0 and the first cointegrating vector normalised to weight 1 on leg 0.
+    """
+    from statsmodels.tsa.vector_ar.vecm import coint_johansen  # deferred: heavy import
+    res = coint_johansen(prices, det_order, k_ar_diff)
+    vec = res.evec[:, 0]
+    return {
+        "trace_stat": float(res.lr1[0]),
+        "trace_crit_95": float(res.cvt[0, 1]),
+        "weights": vec / vec[0],
+    }
+
+@dataclass
+class BasketZScoreStrategy(ZScoreSpreadMixin, Strategy):
+    """
+    Z-score strategy on a basket spread S = sum_i w_i * P_i (log P_i if use_logs), w_0 = 1.
+    +1 = long the spread (buy legs with w_i > 0, sell legs with w_i < 0), -1 = short it.
+    A pair is the basket (stock1, stock2) with weights (1, -beta).
+    """
+    tickers: Sequence[str]
+    weights: Sequence[float] | None = None   # None: Johansen vector on the data passed in
+    use_logs: bool = False                   # spread on log prices (BasketAnalyzer weights are)
+    entry_z: float = 2.0
+    exit_z: float = 0.5
+    tx_cost_per_leg: float = 0.0005          # paid on every leg per position change
+    use_rolling_z: bool = False
+    z_window: int = 60
+    dtype: str = "float64"                   # see PairsZScoreOnlyStrategy.dtype / compact
+    compact: bool = False
+    periods_per_year: float = metrics.TRADING_DAYS
+    execution_lag: int = 0                   # see PairsZScoreOnlyStrategy.execution_lag / fill
+    fill: str = "close"
+
+    def __post_init__(self):
+        self.tickers = tuple(self.tickers)
+        if len(self.tickers) < 2:
+            raise ValueError("A basket needs at least 2 tickers.")
+        if self.weights is not None and len(self.weights) != len(self.tickers):
+            raise ValueError("weights must have one entry per ticker.")
+
+    @property
+    def n_legs(self) -> int:
+        return len(self.tickers)
+
+    def _legs(self) -> tuple:
+        return self.tickers
+
+    @staticmethod
+    def _last_hedge(weights: pd.Series) -> Dict[str, float]:
+        return {k: float(v) for k, v in weights.items()}
+
+    def prepare(
+        self,
+        data: pd.DataFrame,
+        costs: pd.Series | pd.DataFrame | None = None,
+        opens: pd.DataFrame | None = None,
+        fill_cap: pd.Series | float | None = None,
+    ) -> Dict[str, Any]:
+        """Prices, basket weights, z of the basket spread and the per-bar basket return."""
+        missing = [t for t in self.tickers if t not in data.columns]
+        if missing:
+            raise ValueError(f"Data must contain {missing}")
+
+        prices = data[list(self.tickers)].copy().dropna()
+        prices.index = pd.to_datetime(prices.index)
+        rets = prices.pct_change().fillna(0.0)
+
+        levels = np.log(prices) if self.use_logs else prices
+        if self.weights is None:
+            w = johansen_weights(levels.to_numpy())["weights"]
+        else:
+            w = np.asarray(self.weights, dtype=float)
+        weights = pd.Series(w, index=list(self.tickers), name="weight")
+
+        spread = levels @ weights
+        z = self._compute_z(spread)
+        basket_ret = rets @ weights   # same convention as r1 - beta * r2 for a pair
+        return {"prices": prices, "beta": weights, "z": z, "pair_ret": basket_ret,
+                "unit_cost": self._unit_cost(costs, prices.index),
+                "gap_ret": self._gap_ret(prices, opens, weights),
+                "fill_cap": fill_cap.reindex(prices.index) if isinstance(fill_cap, pd.Series) else fill_cap}
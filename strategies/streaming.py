@@ -0,0 +1,319 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator
+import numpy as np
+import pandas as pd
+from DataStructures import BarFrequency, SESSION_MINUTES
+from models.hedge import rolling_hedge_zscore
+from .zscore_only import PairsZScoreOnlyStrategy
+
+# Out-of-core PairsZScoreOnlyStrategy for long (intraday) histories.
+#
+# The price source yields (bars x tickers) chunks in time order (data.market.bars.iter_bars);
+# everything that spans chunk boundaries is carried in a small state:
+#   rolling windows   the last z_window spreads (static hedge) or beta_window + z_window
+#                     prices (rolling hedge) are prepended to the next chunk
+#   positions         last entry signal, pre-stop position, open-block return / bar count
+#                     for the stops, the last execution_lag targets not yet filled, held
+#                     position (costs on the first bar of a chunk)
+#   metrics           running mean / M2 of pnl, downside sum, equity, peak, drawdown and
+#                     its duration, turnover, exposure, closed-trade sums, the open trade
+# so memory is bounded by the chunk size. A static hedge ratio (one OLS beta over the whole
+# window, like execute()) needs a first pass over the source for the co-moments of the two
+# legs; that pass also gives the full-sample spread mean / std when use_rolling_z=False.
+# Results match execute() on the same bars up to floating-point rounding.
+
+
+class _Moments:
+    """Count, means and co-moments of (x, y), merged chunk by chunk (Chan et al.)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mx = self.my = 0.0
+        self.cxx = self.cxy = self.cyy = 0.0
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> None:
+        nb = x.size
+        if nb == 0:
+            return
+        mxb, myb = x.mean(), y.mean()
+        dx, dy = x - mxb, y - myb
+        n = self.n + nb
+        ddx, ddy = mxb - self.mx, myb - self.my
+        f = self.n * nb / n
+        self.cxx += dx @ dx + ddx * ddx * f
+        self.cxy += dx @ dy + ddx * ddy * f
+        self.cyy += dy @ dy + ddy * ddy * f
+        self.mx += ddx * nb / n
+        self.my += ddy * nb / n
+        self.n = n
+
+
+@dataclass
+class StreamingPairsZScore:
+    stock1: str
+    stock2: str
+    entry_z: float = 2.0
+    exit_z: float = 0.5
+    tx_cost_per_leg: float = 0.0005
+    use_rolling_z: bool = True
+    z_window: int = 60              # bars
+    hedge_mode: str = "static"      # "static" (two passes) or "rolling" (one pass)
+    beta_window: int = 60           # bars, used if hedge_mode="rolling"
+    execution_lag: int = 0          # as PairsZScoreOnlyStrategy (close fills, no partial fills)
+    freq: BarFrequency = BarFrequency.DAY1
+    session_minutes: int = SESSION_MINUTES
+
+    n_legs = 2
+
+    @classmethod
+    def from_days(cls, stock1: str, stock2: str, freq: BarFrequency, z_days: float = 30,
+                  beta_days: float = 60, session_minutes: int = SESSION_MINUTES, **kwargs) -> "StreamingPairsZScore":
+        """Windows given in trading days, converted to bars of `freq`."""
+        return cls(stock1, stock2, freq=freq, session_minutes=session_minutes,
+                   z_window=freq.bars(z_days, session_minutes), beta_window=freq.bars(beta_days, session_minutes),
+                   **kwargs)
+
+    @property
+    def periods_per_year(self) -> float:
+        return self.freq.periods_per_year(self.session_minutes)
+
+    # ---- source
+    def _pairs(self, source) -> Iterator[pd.DataFrame]:
+        for chunk in (source() if callable(source) else source):
+            c = chunk[[self.stock1, self.stock2]].dropna()
+            if len(c):
+                yield c.astype(float)
+
+    def _fit_static(self, source) -> Dict[str, float]:
+        mom = _Moments()
+        for c in self._pairs(source):
+            mom.update(c[self.stock2].to_numpy(), c[self.stock1].to_numpy())
+        if mom.n < 3:
+            raise ValueError(f"Not enough joint bars for {self.stock1}/{self.stock2}")
+        beta = mom.cxy / mom.cxx
+        var_s = (mom.cyy - 2.0 * beta * mom.cxy + beta * beta * mom.cxx) / (mom.n - 1)
+        return {"beta": beta, "mean_s": mom.my - beta * mom.mx, "sd_s": float(np.sqrt(var_s))}
+
+    # ---- per-chunk steps
+    def _signals(self, px: np.ndarray, st: Dict[str, Any], fit: Dict[str, float] | None):
+        """z, pair return and hedge of a chunk, continuing the carried windows."""
+        prev = np.vstack([px[:1] if st["last_px"] is None else st["last_px"][None, :], px[:-1]])
+        rets = px / prev - 1.0
+        st["last_px"] = px[-1]
+        zw = self.z_window
+        if self.hedge_mode == "static":
+            beta = fit["beta"]
+            spread = px[:, 0] - beta * px[:, 1]
+            if self.use_rolling_z:
+                s_all = np.concatenate([st["tail"], spread])
+                roll = pd.Series(s_all).rolling(zw, min_periods=zw // 2)
+                z = ((s_all - roll.mean().to_numpy()) / roll.std(ddof=0).to_numpy())[len(st["tail"]):]
+                st["tail"] = s_all[-(zw - 1):] if zw > 1 else s_all[:0]
+            else:
+                z = (spread - fit["mean_s"]) / fit["sd_s"]
+            return z, rets[:, 0] - beta * rets[:, 1], beta
+        keep = self.beta_window + zw
+        p_all = np.vstack([st["tail"], px]) if len(st["tail"]) else px
+        roll = rolling_hedge_zscore(p_all[:, 0], p_all[:, 1], beta_window=self.beta_window, z_window=zw)
+        k = len(p_all) - len(px)
+        beta_prev = np.concatenate([[np.nan], roll["beta"][:-1]])[k:]
+        pair_ret = rets[:, 0] - beta_prev * rets[:, 1]
+        st["tail"] = p_all[-keep:]
+        return roll["z"][k:], np.where(np.isnan(pair_ret), 0.0, pair_ret), roll["beta"][-1]
+
+    def _positions(self, z: np.ndarray, pair_ret: np.ndarray, st: Dict[str, Any],
+                   stop_loss_pct, take_profit_pct, max_bars_in_trade) -> np.ndarray:
+        """build_positions on a chunk, starting from the carried state."""
+        n = z.size
+        raw = np.where(z >= self.entry_z, -1, np.where(z <= -self.entry_z, 1, 0)).astype(np.int8)
+        last = np.maximum.accumulate(np.where(raw != 0, np.arange(n), -1))
+        last_raw = np.where(last >= 0, raw[np.maximum(last, 0)], st["last_raw"]).astype(np.int8)
+        pos0 = np.where(np.abs(z) <= self.exit_z, 0, last_raw).astype(np.int8)
+        st["last_raw"] = int(last_raw[-1])
+
+        if stop_loss_pct is None and take_profit_pct is None and max_bars_in_trade is None:
+            st["pos0"] = int(pos0[-1])
+            return pos0
+
+        active = pos0 != 0
+        prev0 = np.concatenate([[st["pos0"]], pos0[:-1]])
+        block = np.cumsum(active & (prev0 == 0))
+        # with an execution lag the trade is marked from the signal close (as build_positions)
+        growth = 1.0 + (prev0 if self.execution_lag else pos0) * pair_ret
+        carried = bool(active[0] and st["pos0"] != 0)     # block open at the previous chunk's end
+        if carried:
+            growth[0] *= st["block_cum"]
+        grouped = pd.Series(np.where(active, growth, np.nan)).groupby(np.where(active, block, -1))
+        cum = grouped.cumprod().to_numpy()
+        bars_in = grouped.cumcount().to_numpy() + 1
+        if carried:
+            bars_in = np.where(active & (block == 0), bars_in + st["block_bars"], bars_in)
+        open_ret = np.where(active, cum - 1.0, 0.0)
+
+        hit = np.zeros(n, dtype=bool)
+        if stop_loss_pct is not None:
+            hit |= open_ret <= -float(stop_loss_pct)
+        if take_profit_pct is not None:
+            hit |= open_ret >= float(take_profit_pct)
+        if max_bars_in_trade is not None:
+            hit |= bars_in >= int(max_bars_in_trade)
+        st["pos0"] = int(pos0[-1])
+        st["block_cum"] = float(cum[-1]) if active[-1] else 1.0
+        st["block_bars"] = int(bars_in[-1]) if active[-1] else 0
+        return np.where(hit & active, 0, pos0).astype(np.int8)
+
+    @staticmethod
+    def _accumulate(perf: Dict[str, Any], pnl: np.ndarray, pos: np.ndarray, prev_pos: int, index) -> None:
+        """Fold a chunk into the running metrics (same definitions as models.metrics)."""
+        n0, n = perf["n"], pnl.size
+        perf["ret"].update(pnl, pnl)
+        perf["down"] += float(np.sum(np.minimum(pnl, 0.0) ** 2))
+        growth = 1.0 + pnl
+        growth[0] *= perf["equity"]
+        eq = np.cumprod(growth)
+        peak = np.maximum(np.maximum.accumulate(eq), perf["peak"])
+        perf["mdd"] = max(perf["mdd"], float(-(eq / peak - 1.0).min()))
+        gidx = n0 + np.arange(n)
+        last_peak = np.maximum(np.maximum.accumulate(np.where(eq >= peak, gidx, -1)), perf["last_peak"])
+        perf["dur"] = max(perf["dur"], int((gidx - last_peak).max()))
+        perf["equity"], perf["peak"], perf["last_peak"] = float(eq[-1]), float(peak[-1]), int(last_peak[-1])
+        perf["turnover"] += int(np.abs(np.diff(pos, prepend=np.int8(prev_pos))).sum())
+        perf["exposed"] += int(np.count_nonzero(pos))
+        perf["n"] = n0 + n
+
+        # trades: blocks of non-zero positions (a flip stays in the trade), compounded pnl
+        active = pos != 0
+        carried = bool(active[0] and prev_pos != 0)
+        closed = [perf["trade_cum"]] if prev_pos != 0 and not active[0] else []   # closed on the boundary
+        ends_open = bool(active[-1])
+        rets = np.empty(0)
+        if active.any():
+            prev = np.concatenate([[prev_pos != 0], active[:-1]])
+            starts = np.flatnonzero(active & ~prev)
+            g = 1.0 + pnl
+            if carried:
+                g[0] *= perf["trade_cum"]
+            seg_first = np.concatenate([[0], starts]) if carried else starts
+            seg_pos = np.searchsorted(np.flatnonzero(active), seg_first)
+            rets = np.multiply.reduceat(g[active], seg_pos)
+            closed.extend(rets[:-1] if ends_open else rets)
+        closed = np.asarray(closed, dtype=float) - 1.0
+        perf["trades"] += closed.size
+        perf["wins"] += int(np.count_nonzero(closed > 0))
+        perf["s1"] += float(closed.sum())
+        perf["s2"] += float(closed @ closed)
+        if ends_open:
+            perf["trade_cum"] = float(rets[-1])
+            if not (carried and len(seg_first) == 1):
+                perf["trade_since"] = index[seg_first[-1]]
+
+    # ---- run
+    def run(
+        self,
+        source: Callable[[], Iterable[pd.DataFrame]] | Iterable[pd.DataFrame],
+        stop_loss_pct: float | None = None,
+        take_profit_pct: float | None = None,
+        max_bars_in_trade: int | None = None,
+        series_path: str | None = None,
+    ) -> Dict[str, Any]:
+        """
+        Backtest over a chunked price source: a zero-argument callable returning the chunk
+        iterator (needed for hedge_mode="static", which reads the source twice) or the
+        iterator itself. series_path: optional Parquet file receiving ts / z / position /
+        pnl / equity chunk by chunk. Returns stats (execute() layout), the hedge ratio, the
+        open trade and the number of chunks.
+        """
+        if self.hedge_mode not in ("static", "rolling"):
+            raise ValueError(f"Unknown hedge_mode: {self.hedge_mode!r} (use 'static' or 'rolling')")
+        if self.hedge_mode == "static" and not callable(source):
+            raise ValueError("hedge_mode='static' reads the source twice: pass a callable returning the chunks")
+        lag = int(self.execution_lag)
+        if lag < 0:
+            raise ValueError(f"execution lag must be >= 0, got {lag}")
+        fit = self._fit_static(source) if self.hedge_mode == "static" else None
+        unit_cost = self.n_legs * self.tx_cost_per_leg
+        st = {"last_px": None, "tail": np.empty((0,)) if self.hedge_mode == "static" else np.empty((0, 2)),
+              "last_raw": 0, "pos0": 0, "block_cum": 1.0, "block_bars": 0, "pos": 0,
+              "queued": np.zeros(lag, dtype=np.int8)}
+        perf = {"n": 0, "ret": _Moments(), "down": 0.0, "equity": 1.0, "peak": -np.inf, "mdd": 0.0,
+                "last_peak": -1, "dur": 0, "turnover": 0, "exposed": 0,
+                "trades": 0, "wins": 0, "s1": 0.0, "s2": 0.0, "trade_cum": 1.0, "trade_since": None}
+        writer, chunks, beta, z_last, last_prices = None, 0, None, np.nan, None
+        try:
+            for c in self._pairs(source):
+                px = c.to_numpy()
+                z, pair_ret, beta = self._signals(px, st, fit)
+                target = self._positions(z, pair_ret, st, stop_loss_pct, take_profit_pct, max_bars_in_trade)
+                # held exposure: the target of `lag` bars earlier (models.execution.lag_positions)
+                seq = np.concatenate([st["queued"], target.astype(np.int8)])
+                pos, st["queued"] = seq[:target.size], seq[target.size:]
+                prev_pos = st["pos"]
+                pnl = pos * pair_ret - np.abs(np.diff(pos, prepend=np.int8(prev_pos))) * unit_cost
+                eq0 = perf["equity"]
+                self._accumulate(perf, pnl, pos, prev_pos, c.index)
+                st["pos"] = int(pos[-1])
+                chunks += 1
+                z_last, last_prices = float(z[-1]), {self.stock1: float(px[-1, 0]), self.stock2: float(px[-1, 1])}
+                if series_path is not None:
+                    import pyarrow as pa  # deferred
+                    import pyarrow.parquet as pq
+                    g = 1.0 + pnl
+                    g[0] *= eq0
+                    table = pa.table({"ts": pd.DatetimeIndex(c.index).as_unit("ns"), "z": z, "position": pos,
+                                      "pnl": pnl, "equity": np.cumprod(g)})
+                    if writer is None:
+                        writer = pq.ParquetWriter(series_path, table.schema)
+                    writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        if perf["n"] == 0:
+            raise ValueError(f"No joint bars for {self.stock1}/{self.stock2}")
+        return {
+            "stats": self._stats(perf, beta, {"open_position": st["pos"], "execution": {
+                "lag": lag, "fill": "close", "partial_fills": False,
+            }, "stops": {
+                "stop_loss_pct": stop_loss_pct,
+                "take_profit_pct": take_profit_pct,
+                "max_bars_in_trade": max_bars_in_trade,
+            }}),
+            "hedge_ratio": beta,
+            "current_open_trade": None if st["pos"] == 0 else {
+                "since": pd.Timestamp(perf["trade_since"]),
+                "position": st["pos"],
+                "unrealized_return_%": (perf["trade_cum"] - 1.0) * 100.0,
+                "last_prices": last_prices,
+                "z_last": z_last,
+            },
+            "chunks": chunks,
+        }
+
+    def run_store(self, start=None, end=None, chunk_rows: int | None = None, **kwargs) -> Dict[str, Any]:
+        """run() over the bar store (data.market.bars) at self.freq."""
+        from data.market.bars import iter_bars
+        tickers = [self.stock1, self.stock2]
+        return self.run(lambda: iter_bars(tickers, self.freq, start, end, chunk_rows=chunk_rows), **kwargs)
+
+    def _stats(self, perf: Dict[str, Any], beta, extra: Dict[str, Any]) -> Dict[str, Any]:
+        n, ppy = perf["n"], self.periods_per_year
+        mean, vol = perf["ret"].mx, np.sqrt(perf["ret"].cxx / n)
+        sr = mean / (vol + 1e-12)
+        final = perf["equity"]
+        with np.errstate(invalid="ignore"):
+            ann = np.power(max(final, 0.0), ppy / n) - 1.0
+        k = perf["trades"]
+        t_mean = perf["s1"] / k if k else 0.0
+        t_var = perf["s2"] / k - t_mean ** 2 if k else 0.0
+        summary = {key: np.array([v]) for key, v in {
+            "n_bars": n, "final_equity": final, "total_return": final - 1.0, "annual_return": ann,
+            "avg_return": mean, "vol_return": vol, "sharpe": sr, "sharpe_annual": sr * np.sqrt(ppy),
+            "sortino_annual": mean / (np.sqrt(perf["down"] / n) + 1e-12) * np.sqrt(ppy),
+            "max_drawdown": perf["mdd"], "max_drawdown_duration": perf["dur"],
+            "calmar": ann / (perf["mdd"] + 1e-12), "turnover": perf["turnover"], "exposure": perf["exposed"] / n,
+            "n_trades": k, "positive_trades": perf["wins"], "positive_trade_rate": perf["wins"] / k if k else 0.0,
+            "avg_trade_return": t_mean, "std_trade_return": np.sqrt(max(t_var, 0.0)),
+        }.items()}
+        stats = PairsZScoreOnlyStrategy._stats_from_summary(summary, 0, beta=beta)
+        stats.update(extra)
+        return stats
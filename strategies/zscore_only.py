@@ -1,29 +1,22 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, Iterable
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-from .base import Strategy
+from models import execution, metrics
+from models.hedge import rolling_hedge_zscore
+from .base import Strategy, LazyResult, PackedMask
 
 def zscore(series: pd.Series) -> pd.Series:
     return (series - series.mean()) / series.std()
 
-@dataclass
-class PairsZScoreOnlyStrategy(Strategy):
-    stock1: str
-    stock2: str
-    entry_z: float = 2.0            # enter when |z| >= entry_z
-    exit_z: float = 0.5             # exit when |z| <= exit_z
-    tx_cost_per_leg: float = 0.0005 # 5 bps per leg per trade (0.05%)
-    use_rolling_z: bool = False
-    z_window: int = 60              # used if use_rolling_z=True
-
-    def _compute_hedge_ratio(self, data: pd.DataFrame) -> float:
-        y = data[self.stock1]
-        X = sm.add_constant(data[self.stock2])
-        model = sm.OLS(y, X, missing="drop").fit()
-        return float(model.params[self.stock2])
+class ZScoreSpreadMixin:
+    """
+    Signals, stops, execution, pnl and the lazy result of a z-score strategy on one
+    spread, shared by the pair and basket strategies. Subclasses are dataclasses with
+    the z / threshold / cost / execution fields of PairsZScoreOnlyStrategy and provide
+    n_legs, _legs(), _last_hedge() and prepare().
+    """
 
     def _compute_z(self, spread: pd.Series) -> pd.Series:
         if self.use_rolling_z:
@@ -32,38 +25,150 @@ class PairsZScoreOnlyStrategy(Strategy):
             return (spread - mu) / sd
         return zscore(spread)
 
-    def _max_drawdown(self,eq: pd.Series) -> float:
-        if eq.empty: return 0.0
-        rm = eq.cummax()
-        dd = eq / rm - 1.0
-        return float(-dd.min())  # positive fraction
+    def _float_dtype(self) -> np.dtype:
+        if self.dtype not in ("float64", "float32"):
+            raise ValueError(f"dtype must be 'float64' or 'float32', got {self.dtype!r}")
+        return np.dtype(self.dtype)
+
+    def batch_pnl(self, prepared: Dict[str, Any], positions: np.ndarray) -> np.ndarray:
+        """
+        Net per-bar pnl for a (bars x k) matrix of position paths on the same pair.
+        Costs: n_legs legs per position change, so a flip costs twice that. With per-bar
+        costs (prepare(..., costs=...)) a unit change at bar t costs unit_cost[t].
+
+        Integer positions (int8 in compact mode) are used as they are; the result is in
+        self.dtype. float32 keeps ~7 significant digits per bar: against float64, pnl
+        differs by <= 1e-7 relative, equity after n bars by about n * 6e-8 relative at
+        worst, Sharpe / drawdown by ~1e-5 (`python -m utils.bench memory`: 7.5e-6 / 2.5e-6
+        on 2520 bars x 4000 paths; enough to rank a sweep, not to reconcile).
+        """
+        dt = self._float_dtype()
+        pos = np.asarray(positions)
+        if not np.issubdtype(pos.dtype, np.integer):
+            pos = pos.astype(dt, copy=False)
+        if pos.ndim == 1:
+            pos = pos[:, None]
+        pair_ret = prepared["pair_ret"].to_numpy(dtype=dt)[:, None]
+        unit_cost = prepared.get("unit_cost")
+        unit_cost = np.asarray(self.n_legs * self.tx_cost_per_leg if unit_cost is None
+                               else unit_cost.to_numpy()[:, None], dtype=dt)
+        cost = metrics.position_changes(pos) * unit_cost
+        pnl = pos * pair_ret - cost
+        if self.fill == "open":
+            pnl += execution.gap_adjustment(pos, prepared["gap_ret"].to_numpy(dtype=dt))
+        return pnl
+
+    def executed_positions(self, prepared: Dict[str, Any], positions: np.ndarray, lag: int | None = None) -> np.ndarray:
+        """
+        Exposure held per bar for a (bars x k) matrix of target paths: targets delayed by
+        `lag` bars (default self.execution_lag) and, with prepare(fill_cap=...), partially
+        filled at most fill_cap per bar. Only shifts and one capped pass: z / beta / the
+        targets are reused, so a sweep can vary the latency on the same prepared inputs.
+        """
+        lag = self.execution_lag if lag is None else int(lag)
+        if self.fill not in ("close", "open"):
+            raise ValueError(f"fill must be 'close' or 'open', got {self.fill!r}")
+        if self.fill == "open" and lag < 1:
+            raise ValueError("fill='open' fills at the next open: execution_lag must be >= 1")
+        if self.fill == "open" and prepared.get("gap_ret") is None:
+            raise ValueError("fill='open' needs open prices: prepare(..., opens=...)")
+        held = execution.lag_positions(positions, lag)
+        cap = prepared.get("fill_cap")
+        if cap is not None:
+            held = execution.partial_fills(held, cap.to_numpy() if isinstance(cap, pd.Series) else cap)
+        return held
+
+    def batch_summary(self, prepared: Dict[str, Any], positions: np.ndarray,
+                      chunk: int | None = None, lag: int | None = None) -> Dict[str, np.ndarray]:
+        """
+        metrics.performance_summary of a (bars x k) batch of target position paths, after
+        the execution model (see executed_positions; lag overrides execution_lag). chunk:
+        paths evaluated per call, so the pnl / equity temporaries span chunk columns instead
+        of the whole batch (None = all at once).
+        """
+        pos = np.asarray(positions)
+        if pos.ndim == 1:
+            pos = pos[:, None]
+        step = pos.shape[1] if chunk is None else max(int(chunk), 1)
+
+        def _part(j):
+            held = self.executed_positions(prepared, pos[:, j:j + step], lag=lag)
+            return metrics.performance_summary(self.batch_pnl(prepared, held), held,
+                                               periods_per_year=self.periods_per_year)
+
+        parts = [_part(j) for j in range(0, pos.shape[1], step)]
+        if len(parts) == 1:
+            return parts[0]
+        return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    @staticmethod
+    def _stats_from_summary(summary: Dict[str, np.ndarray], i: int, beta: float | None = None) -> Dict[str, Any]:
+        """Column i of metrics.performance_summary in the strategy's stats layout."""
+        return {
+            "n_days": int(summary["n_bars"][i]),
+            "beta": beta,
+            "final_equity": float(summary["final_equity"][i]),
+            "total_return_%": float(summary["total_return"][i]) * 100.0,
 
-    def execute(
+            # requested daily stats
+            "avg_daily_return": float(summary["avg_return"][i]),
+            "vol_daily_return": float(summary["vol_return"][i]),
+            "sharpe_daily": float(summary["sharpe"][i]),           # (mean / vol)
+            "sharpe_annual": float(summary["sharpe_annual"][i]),   # sharpe_daily * sqrt(periods_per_year)
+            "sortino_annual": float(summary["sortino_annual"][i]),
+            "calmar": float(summary["calmar"][i]),
+
+            "max_drawdown_%": float(summary["max_drawdown"][i]) * 100.0,
+            "max_drawdown_bars": int(summary["max_drawdown_duration"][i]),
+
+            # count of position changes (a flip counts twice)
+            "number_of_position_changes": int(summary["turnover"][i]),
+            "exposure": float(summary["exposure"][i]),
+
+            # trade-level metrics (closed trades only)
+            "n_trades": int(summary["n_trades"][i]),
+            "positive_trades": int(summary["positive_trades"][i]),
+            "positive_trade_rate": float(summary["positive_trade_rate"][i]),        # fraction in [0,1]
+            "avg_trade_return_%": float(summary["avg_trade_return"][i]) * 100.0,    # percent
+            "std_trade_return_%": float(summary["std_trade_return"][i]) * 100.0,    # percent
+        }
+
+    def _unit_cost(self, costs, index: pd.Index) -> pd.Series | None:
+        # per-bar cost of one unit of position change: a Series (all legs), or a
+        # DataFrame of per-leg costs (e.g. models.costs.CostModel.leg_costs) summed over legs
+        if costs is None:
+            return None
+        if isinstance(costs, pd.DataFrame):
+            costs = costs[list(self._legs())].sum(axis=1)
+        return costs.reindex(index).ffill().fillna(self.n_legs * self.tx_cost_per_leg)
+
+    def _gap_ret(self, prices: pd.DataFrame, opens: pd.DataFrame | None, hedge) -> pd.Series | None:
+        # pair return from the previous close to the open of each bar, same hedge as pair_ret
+        if opens is None:
+            return None
+        legs = list(self._legs())
+        gaps = (opens.reindex(prices.index)[legs] / prices[legs].shift(1) - 1.0).fillna(0.0)
+        if isinstance(hedge, pd.Series) and hedge.index.equals(prices.index):   # rolling beta
+            return (gaps[legs[0]] - hedge * gaps[legs[1]]).fillna(0.0)
+        weights = hedge if isinstance(hedge, pd.Series) else pd.Series([1.0, -hedge], index=legs)
+        return gaps @ weights
+
+    def build_positions(
         self,
-        data: pd.DataFrame,
-        close_at_end: bool = False,
+        prepared: Dict[str, Any],
         stop_loss_pct: float | None = None,
         take_profit_pct: float | None = None,
         max_bars_in_trade: int | None = None,
     ) -> Dict[str, Any]:
-
-
-
-        if self.stock1 not in data.columns or self.stock2 not in data.columns:
-            raise ValueError(f"Data must contain {self.stock1} and {self.stock2}")
-
-        # --- prices & simple returns
-        prices = data[[self.stock1, self.stock2]].copy().dropna()
-        prices.index = pd.to_datetime(prices.index)
-        rets = prices.pct_change().fillna(0.0)
-
-        # --- hedge ratio & z-score on spread
-        beta = float(self._compute_hedge_ratio(prices))
-        spread = prices[self.stock1] - beta * prices[self.stock2]
-        z = self._compute_z(spread)
+        """
+        Carried positions for the current entry/exit thresholds and stops.
+        Returns the raw signals, final positions and the stop masks.
+        """
+        z, pair_ret = prepared["z"], prepared["pair_ret"]
+        int_dtype = np.int8 if self.compact else int
 
         # --- raw event signals from z (NO EMA gate)
-        raw = pd.Series(0, index=prices.index, dtype=int)
+        raw = pd.Series(0, index=z.index, dtype=int_dtype)
         raw[z >=  self.entry_z] = -1   # short stock1, long stock2
         raw[z <= -self.entry_z] =  1   # long stock1, short stock2
 
@@ -73,145 +178,270 @@ class PairsZScoreOnlyStrategy(Strategy):
         # --- build carried position: hold until any exit hits
         pos = raw.replace(0, np.nan).ffill()
         pos[exits_z] = 0
-        pos = pos.fillna(0).astype(int)
+        pos = pos.fillna(0).astype(int_dtype)
+
+        no_stop = pd.Series(False, index=pos.index)
+        if stop_loss_pct is None and take_profit_pct is None and max_bars_in_trade is None:
+            return self._pack({"signals": raw, "positions": pos,
+                               "stop_loss": no_stop, "take_profit": no_stop, "time_stop": no_stop})
 
-        # --- per-bar pair return and signed PnL (before costs)
-        pair_ret = rets[self.stock1] - beta * rets[self.stock2]
-        signed_pair_ret = pos * pair_ret
+        # --- signed PnL (before costs); with an execution lag the trade is marked from the
+        # signal close, so the signal bar's own return does not count toward the stops
+        signed_pair_ret = (pos.shift(1).fillna(0) if self.execution_lag else pos) * pair_ret
 
         # --- open-trade return (since last entry) for stops
         entries = (pos != 0) & (pos.shift(1).fillna(0) == 0)  # 0 -> nonzero
         trade_id = entries.cumsum().where(pos != 0)           # NA when flat
-        cum_since_entry = (1.0 + signed_pair_ret.where(pos != 0)).groupby(trade_id).cumprod() - 1.0
-        open_ret = cum_since_entry.where(pos != 0, 0.0).fillna(0.0)
+        if stop_loss_pct is not None or take_profit_pct is not None:
+            cum_since_entry = (1.0 + signed_pair_ret.where(pos != 0)).groupby(trade_id).cumprod() - 1.0
+            open_ret = cum_since_entry.where(pos != 0, 0.0).fillna(0.0)
 
         # --- optional time stop
         if max_bars_in_trade is not None:
             bars_in = pos.where(pos != 0).groupby(trade_id).cumcount() + 1
             time_stop_hit = (bars_in >= int(max_bars_in_trade)) & (pos != 0)
         else:
-            time_stop_hit = pd.Series(False, index=pos.index)
+            time_stop_hit = no_stop
 
         # --- PnL-based stops
-        stop_loss_hit = (open_ret <= -float(stop_loss_pct)) & (pos != 0) if stop_loss_pct is not None else pd.Series(False, index=pos.index)
-        take_profit_hit = (open_ret >=  float(take_profit_pct)) & (pos != 0) if take_profit_pct is not None else pd.Series(False, index=pos.index)
+        stop_loss_hit = (open_ret <= -float(stop_loss_pct)) & (pos != 0) if stop_loss_pct is not None else no_stop
+        take_profit_hit = (open_ret >=  float(take_profit_pct)) & (pos != 0) if take_profit_pct is not None else no_stop
 
         # --- force exits when any condition hits
         force_exit = exits_z | stop_loss_hit | take_profit_hit | time_stop_hit
         if force_exit.any():
             pos = pos.copy()
             pos[force_exit] = 0
-            pos = pos.astype(int)
-
-        # --- trading costs on position changes (2 legs per change; flip costs 4 legs)
-        trades = pos.diff().abs().fillna(pos.abs().iloc[0])
-        cost = trades * (2 * self.tx_cost_per_leg)
-
-        # --- final pnl/equity (daily series)
-        pnl = (pos * pair_ret) - cost
-        equity = (1.0 + pnl).cumprod()
-
-        # --- recompute trade blocks AFTER applying forced exits (for trade-level stats)
-        entries2 = (pos != 0) & (pos.shift(1).fillna(0) == 0)
-        trade_id2 = entries2.cumsum().where(pos != 0)
-
-        # Closed-trade compounded returns (exclude last if still open)
-        trade_returns = (
-            (1.0 + pnl.where(pos != 0))
-            .groupby(trade_id2)
-            .prod()
-            .dropna()
-            .subtract(1.0)
+            pos = pos.astype(int_dtype)
+
+        return self._pack({
+            "signals": raw,
+            "positions": pos,
+            "stop_loss": stop_loss_hit,
+            "take_profit": take_profit_hit,
+            "time_stop": time_stop_hit,
+        })
+
+    def _pack(self, built: Dict[str, Any]) -> Dict[str, Any]:
+        # compact mode: stop masks as bits (PackedMask.to_series() restores them)
+        if not self.compact:
+            return built
+        for k in ("stop_loss", "take_profit", "time_stop"):
+            built[k] = PackedMask(built[k])
+        return built
+
+    def execute(
+        self,
+        data: pd.DataFrame,
+        close_at_end: bool = False,
+        stop_loss_pct: float | None = None,
+        take_profit_pct: float | None = None,
+        max_bars_in_trade: int | None = None,
+        fields: Iterable[str] | None = None,
+        stats_only: bool = False,
+        costs: pd.Series | pd.DataFrame | None = None,
+        opens: pd.DataFrame | None = None,
+        fill_cap: pd.Series | float | None = None,
+    ) -> LazyResult:
+        """
+        Backtest on `data`. The result behaves like the usual dict, but each field is
+        only computed on first access. `fields` restricts the exposed fields;
+        stats_only=True is shorthand for fields=("stats",). costs / opens / fill_cap:
+        see prepare.
+        """
+        prepared = self.prepare(data, costs=costs, opens=opens, fill_cap=fill_cap)
+        built = self.build_positions(
+            prepared,
+            stop_loss_pct=stop_loss_pct,
+            take_profit_pct=take_profit_pct,
+            max_bars_in_trade=max_bars_in_trade,
+        )
+        return self.evaluate(
+            prepared, built,
+            close_at_end=close_at_end,
+            stop_loss_pct=stop_loss_pct,
+            take_profit_pct=take_profit_pct,
+            max_bars_in_trade=max_bars_in_trade,
+            fields=("stats",) if stats_only else fields,
         )
-        # Drop the last trade if it's still open
-        if int(pos.iloc[-1]) != 0 and not trade_returns.empty:
-            last_id = int(trade_id2.iloc[-1])
-            if last_id in trade_returns.index:
-                trade_returns = trade_returns.drop(last_id, errors="ignore")
-
-        n_trades = int(trade_returns.shape[0])
-        n_pos_trades = int((trade_returns > 0).sum())
-        pos_trade_rate = float(n_pos_trades / n_trades) if n_trades > 0 else 0.0
-        avg_trade_ret = float(trade_returns.mean()) if n_trades > 0 else 0.0
-        std_trade_ret = float(trade_returns.std(ddof=0)) if n_trades > 0 else 0.0
+
+    def evaluate(
+        self,
+        prepared: Dict[str, Any],
+        built: Dict[str, Any],
+        close_at_end: bool = False,
+        stop_loss_pct: float | None = None,
+        take_profit_pct: float | None = None,
+        max_bars_in_trade: int | None = None,
+        fields: Iterable[str] | None = None,
+    ) -> LazyResult:
+        """
+        PnL, equity, trade-level stats and the full (lazy) result for given positions.
+        'positions' is the exposure after the execution model, 'target_positions' the
+        signal-side path from build_positions.
+        """
+        prices, beta, z = prepared["prices"], prepared["beta"], prepared["z"]
+        target = built["positions"]
+        pos = pd.Series(self.executed_positions(prepared, target.to_numpy()), index=target.index)
+        res = LazyResult(fields=fields)
+        get = res.get_field
+
+        # --- final pnl/equity (daily series); costs on position changes
+        res.add("_pnl", lambda: self.batch_pnl(prepared, pos.to_numpy())[:, 0])
+
+        # --- closed trades (vectorized, last one dropped if still open)
+        res.add("_closed", lambda: metrics.trade_returns(get("_pnl"), pos.to_numpy()))
+
+        # --- trade blocks AFTER applying forced exits (open-trade snapshot / path)
+        def _trade_id():
+            entries2 = (pos != 0) & (pos.shift(1).fillna(0) == 0)
+            return entries2, entries2.cumsum().where(pos != 0)
+        res.add("_trade_id", _trade_id)
+
+        last_pos = pos.iloc[-1].item()   # int, or a fraction with partial fills
 
         # --- current open trade snapshot (mark-to-market at last prices)
-        current_open_trade = None
-        last_pos = int(pos.iloc[-1])
-        if last_pos != 0:
+        def _current_open_trade():
+            if last_pos == 0:
+                return None
+            entries2, _ = get("_trade_id")
             last_entry_time = entries2[entries2].index[-1] if entries2.any() else prices.index[-1]
-            current_open_trade = {
+            return {
                 "since": pd.Timestamp(last_entry_time),
                 "position": last_pos,  # +1: long A/short B; -1: short A/long B
-                "unrealized_return_%": float(((1.0 + pnl.where(pos != 0)).groupby(trade_id2).cumprod().iloc[-1] - 1.0) * 100.0),
-                "last_prices": {
-                    self.stock1: float(prices[self.stock1].iloc[-1]),
-                    self.stock2: float(prices[self.stock2].iloc[-1]),
-                },
+                "unrealized_return_%": float(get("open_trade_return").iloc[-1] * 100.0),
+                "last_prices": {c: float(prices[c].iloc[-1]) for c in prices.columns},
                 "z_last": float(z.iloc[-1]),
             }
 
         # --- optionally “close now” (apply exit cost at last bar)
-        equity_close_now = None
-        if close_at_end and last_pos != 0:
-            pnl_close = pnl.copy()
-            pnl_close.iloc[-1] -= (2 * self.tx_cost_per_leg) * abs(last_pos)
-            equity_close_now = (1.0 + pnl_close).cumprod()
-
-        # --- daily stats and Sharpe
-        avg = float(pnl.mean())                # mean daily pnl (decimal)
-        vol = float(pnl.std(ddof=0))           # std daily pnl (decimal)
-        sharpe_daily_ratio = float(avg / (vol + 1e-12))
-        sharpe_annual = float(sharpe_daily_ratio * np.sqrt(252.0))
-
-        stats = {
-            "n_days": int(len(pnl)),
-            "beta": beta,
-            "final_equity": float(equity.iloc[-1]),
-            "total_return_%": (float(equity.iloc[-1]) - 1.0) * 100.0,
+        def _equity_close_now():
+            if not (close_at_end and last_pos != 0):
+                return None
+            pnl_close = get("pnl").copy()
+            unit_cost = prepared.get("unit_cost")
+            last_cost = self.n_legs * self.tx_cost_per_leg if unit_cost is None else float(unit_cost.iloc[-1])
+            pnl_close.iloc[-1] -= last_cost * abs(last_pos)
+            return (1.0 + pnl_close).cumprod()
+
+        # --- all performance/trade metrics in one vectorized call
+        def _stats():
+            summary = metrics.performance_summary(get("_pnl"), pos.to_numpy(), trades=get("_closed"),
+                                                  periods_per_year=self.periods_per_year)
+            stats = self._stats_from_summary(summary, 0, beta=self._last_hedge(beta))
+            stats.update({
+                "open_position": last_pos,
+                "execution": {"lag": self.execution_lag, "fill": self.fill,
+                              "partial_fills": prepared.get("fill_cap") is not None},
+                "stops": {
+                    "stop_loss_pct": stop_loss_pct,
+                    "take_profit_pct": take_profit_pct,
+                    "max_bars_in_trade": max_bars_in_trade,
+                },
+            })
+            return stats
+
+        res.add("signals", lambda: built["signals"])   # +1/-1/0 events (z-only)
+        res.add("positions", lambda: pos)               # carried state, as executed
+        res.add("target_positions", lambda: target)
+        res.add("pnl", lambda: pd.Series(get("_pnl"), index=pos.index))
+        res.add("equity", lambda: (1.0 + get("pnl")).cumprod())
+        res.add("stats", _stats)
+        res.add("hedge_ratio", lambda: beta)
+        res.add("z", lambda: z)
+        res.add("open_trade_return", lambda: (1.0 + get("pnl").where(pos != 0)).groupby(get("_trade_id")[1]).cumprod() - 1.0)
+        res.add("current_open_trade", _current_open_trade)
+        res.add("equity_close_now", _equity_close_now)
+        res.add("stops_triggered", lambda: {
+            "stop_loss": built["stop_loss"],
+            "take_profit": built["take_profit"],
+            "time_stop": built["time_stop"],
+        })
+        # closed-trade compounded returns (decimal), indexed by entry time
+        res.add("trade_returns", lambda: pd.Series(
+            get("_closed")["returns"], index=pos.index[get("_closed")["start"]], name="trade_return"))
+        return res
 
-            # requested daily stats
-            "avg_daily_return": avg,
-            "vol_daily_return": vol,
-            "sharpe_daily": sharpe_daily_ratio,    # (mean / vol)
-            "sharpe_annual": sharpe_annual,        # sharpe_daily * sqrt(252)
 
-            "max_drawdown_%": self._max_drawdown(equity) * 100.0,
+@dataclass
+class PairsZScoreOnlyStrategy(ZScoreSpreadMixin, Strategy):
+    stock1: str
+    stock2: str
+    entry_z: float = 2.0            # enter when |z| >= entry_z
+    exit_z: float = 0.5             # exit when |z| <= exit_z
+    tx_cost_per_leg: float = 0.0005 # 5 bps per leg per trade (0.05%)
+    use_rolling_z: bool = False
+    z_window: int = 60              # used if use_rolling_z=True
+    hedge_mode: str = "static"      # "static": one OLS beta on the window; "rolling": no look-ahead
+    beta_window: int = 60           # used if hedge_mode="rolling"
+    dtype: str = "float64"          # "float32": pnl / metrics in float32 (positions are unaffected)
+    compact: bool = False           # int8 signals/positions, bit-packed stop masks in results
+    periods_per_year: float = metrics.TRADING_DAYS   # annualisation (BarFrequency.periods_per_year() for intraday)
+    execution_lag: int = 0          # bars from the signal close to the exposure earning returns (0: same bar)
+    fill: str = "close"             # "close", or "open": fill at the open of the lagged bar (prepare(opens=...))
 
-            # “trades” here = count of position changes (legacy)
-            "trades": int(trades.sum()),
+    n_legs = 2                      # legs traded per position change (costs)
 
-            # trade-level metrics (closed trades only)
-            "n_trades": n_trades,
-            "positive_trades": n_pos_trades,
-            "positive_trade_rate": pos_trade_rate,        # fraction in [0,1]
-            "avg_trade_return_%": avg_trade_ret * 100.0,  # percent
-            "std_trade_return_%": std_trade_ret * 100.0,  # percent
-
-            "open_position": last_pos,
-            "stops": {
-                "stop_loss_pct": stop_loss_pct,
-                "take_profit_pct": take_profit_pct,
-                "max_bars_in_trade": max_bars_in_trade,
-            },
-        }
+    def _compute_hedge_ratio(self, data: pd.DataFrame) -> float:
+        import statsmodels.api as sm  # deferred: heavy import
+        y = data[self.stock1]
+        X = sm.add_constant(data[self.stock2])
+        model = sm.OLS(y, X, missing="drop").fit()
+        return float(model.params[self.stock2])
 
-        return {
-            "signals": raw,                 # +1/-1/0 events (z-only)
-            "positions": pos,               # carried state
-            "pnl": pnl,
-            "equity": equity,
-            "stats": stats,
-            "hedge_ratio": beta,
-            "z": z,
-            "open_trade_return": (1.0 + pnl.where(pos != 0)).groupby(trade_id2).cumprod() - 1.0,
-            "current_open_trade": current_open_trade,
-            "equity_close_now": equity_close_now,
-            "stops_triggered": {
-                "stop_loss": stop_loss_hit,
-                "take_profit": take_profit_hit,
-                "time_stop": time_stop_hit,
-            },
-            "trade_returns": trade_returns,  # closed-trade compounded returns (decimal)
-        }
+    @staticmethod
+    def _last_hedge(beta):
+        # hedge in force at the end of the backtest (stats["beta"])
+        return float(beta.iloc[-1]) if isinstance(beta, pd.Series) else beta
+
+    def _legs(self) -> tuple:
+        return (self.stock1, self.stock2)
+
+    def prepare(
+        self,
+        data: pd.DataFrame,
+        costs: pd.Series | pd.DataFrame | None = None,
+        opens: pd.DataFrame | None = None,
+        fill_cap: pd.Series | float | None = None,
+    ) -> Dict[str, Any]:
+        """
+        Parameter-independent inputs of a backtest (prices, returns, beta, z).
+        Depends only on the data and the z settings, so sweeps over entry/exit/stops
+        can compute it once and reuse it. costs: optional per-bar transaction costs
+        replacing the flat tx_cost_per_leg (see _unit_cost). opens: open prices of the
+        legs (fill="open"). fill_cap: max |Δposition| per bar as a fraction of a full
+        position (e.g. models.costs.CostModel.fill_fraction), for partial fills.
+        """
+        if self.stock1 not in data.columns or self.stock2 not in data.columns:
+            raise ValueError(f"Data must contain {self.stock1} and {self.stock2}")
+
+        # --- prices & simple returns
+        prices = data[[self.stock1, self.stock2]].copy().dropna()
+        prices.index = pd.to_datetime(prices.index)
+        rets = prices.pct_change().fillna(0.0)
+
+        # --- hedge ratio & z-score on spread
+        if self.hedge_mode == "rolling":
+            # per-bar beta from the trailing window; z from the trailing window of that spread
+            roll = rolling_hedge_zscore(
+                prices[self.stock1].to_numpy(), prices[self.stock2].to_numpy(),
+                beta_window=self.beta_window, z_window=self.z_window,
+            )
+            beta = pd.Series(roll["beta"], index=prices.index, name="beta")
+            z = pd.Series(roll["z"], index=prices.index)
+            # the hedge held over bar t was set at the close of t-1
+            hedge = beta.shift(1)
+            pair_ret = (rets[self.stock1] - hedge * rets[self.stock2]).fillna(0.0)
+        elif self.hedge_mode == "static":
+            beta = hedge = float(self._compute_hedge_ratio(prices))
+            spread = prices[self.stock1] - beta * prices[self.stock2]
+            z = self._compute_z(spread)
+            # --- per-bar pair return (before position/costs)
+            pair_ret = rets[self.stock1] - beta * rets[self.stock2]
+        else:
+            raise ValueError(f"Unknown hedge_mode: {self.hedge_mode!r} (use 'static' or 'rolling')")
 
+        return {"prices": prices, "beta": beta, "z": z, "pair_ret": pair_ret,
+                "unit_cost": self._unit_cost(costs, prices.index),
+                "gap_ret": self._gap_ret(prices, opens, hedge),
+                "fill_cap": fill_cap.reindex(prices.index) if isinstance(fill_cap, pd.Series) else fill_cap}
@@ -0,0 +1,10 @@
+import pytest
+from utils.bench import HEAVY_MODULES, IMPORT_BUDGET_US, import_profile, own_import_time
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGET_US))
+def test_import_budget(module):
+    prof = import_profile(module)
+    pulled = sorted({name.split(".")[0] for name in prof} & set(HEAVY_MODULES))
+    assert not pulled, f"{module} imports {pulled} at load time"
+    assert own_import_time(prof) <= IMPORT_BUDGET_US[module]
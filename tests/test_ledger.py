@@ -0,0 +1,48 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from strategies.zscore_only import PairsZScoreOnlyStrategy
+from utils.ledger import TradeLedger
+
+PRICES = Path(__file__).resolve().parents[1] / "data" / "market" / "prices"
+PAIR = ("ASML.AS", "RI.PA")
+TX = 0.0005
+
+
+def _prices() -> pd.DataFrame:
+    px = pd.concat([pd.read_parquet(PRICES / f"ticker={t}" / "close.parquet")["Close"].rename(t) for t in PAIR], axis=1)
+    return px.loc["2023-01-01":"2025-01-01"].dropna()
+
+
+def _strategy_trades(lag: int, fill_cap):
+    # README backtest settings
+    px = _prices()
+    strat = PairsZScoreOnlyStrategy(*PAIR, entry_z=2.4, exit_z=0.85, use_rolling_z=True, z_window=30,
+                                    tx_cost_per_leg=TX, execution_lag=lag)
+    res = strat.execute(px, stop_loss_pct=0.05, take_profit_pct=0.45, fill_cap=fill_cap)
+    led = TradeLedger.from_positions(res["positions"], px, res["z"], res["hedge_ratio"], tx_cost_per_leg=TX)
+    return res, strat.prepare(px)["pair_ret"].to_numpy(), led.to_pandas()
+
+
+@pytest.mark.parametrize("lag,fill_cap", [(1, 0.5), (1, 0.3), (0, 0.5), (0, None)])
+def test_trades_match_strategy_pnl(lag, fill_cap):
+    res, pair_ret, trades = _strategy_trades(lag, fill_cap)
+    pos = res["positions"].to_numpy(dtype=float)
+    assert fill_cap is None or (pos % 1 != 0).any(), "expected partial fills"
+    assert len(trades) == res["stats"]["n_trades"]
+
+    unit = 2 * TX
+    traded = np.abs(np.diff(pos, prepend=0.0)) * unit
+    gross_bar = res["pnl"].to_numpy() + traded          # strategy pnl before costs: pos * pair_ret
+    idx = res["positions"].index
+    flips = 0
+    for t in trades.itertuples():
+        i0, i1 = idx.get_loc(t.start), idx.get_loc(t.end)
+        flips += np.unique(np.sign(pos[i0:i1])).size > 1
+        # live bars as the strategy earned them, plus the closing bar at the exposure it closes
+        gross = np.prod(1.0 + gross_bar[i0:i1]) * (1.0 + pos[i1 - 1] * pair_ret[i1]) - 1.0
+        assert t.gross == pytest.approx(gross, rel=1e-5, abs=1e-6)
+        assert t.cost == pytest.approx(traded[i0:i1 + 1].sum(), rel=1e-5)
+    if fill_cap is None:
+        assert flips > 0, "expected flipped trades"
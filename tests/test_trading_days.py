@@ -0,0 +1,27 @@
+from pathlib import Path
+import pandas as pd
+import pytest
+from DataStructures import derive_trading_days
+
+PRICES = Path(__file__).resolve().parents[1] / "data" / "market" / "prices"
+UNIVERSE = ["ASML.AS", "BESI.AS", "IFX.DE", "HSBA.L", "INGA.AS", "ISP.MI", "ABI.BR", "RI.PA", "BN.PA", "TSCO.L"]
+HOLIDAYS = ["2023-04-07", "2023-04-10", "2023-05-01", "2024-03-29"]   # Good Friday, Easter Monday, 1 May
+
+
+def _closes() -> pd.DataFrame:
+    return pd.concat([pd.read_parquet(PRICES / f"ticker={t}" / "close.parquet")["Close"].rename(t)
+                      for t in UNIVERSE], axis=1).sort_index()
+
+
+@pytest.mark.parametrize("ticker", ["IFX.DE", "ISP.MI", "ABI.BR"])
+def test_single_ticker_exchange_drops_universe_holidays(ticker):
+    closes = _closes()
+    alone = derive_trading_days(closes[ticker])
+    days = derive_trading_days(closes[ticker], universe=closes.drop(columns=ticker))
+    assert set(pd.to_datetime(HOLIDAYS)) <= set(alone)          # the ticker alone cannot tell
+    assert not set(pd.to_datetime(HOLIDAYS)) & set(days)
+    # an unchanged close while the other exchanges traded is still a session
+    dropped = alone.difference(days)
+    elsewhere = (closes.drop(columns=ticker).diff().fillna(0) != 0).any(axis=1)
+    assert not elsewhere.reindex(dropped).any()
+    assert len(dropped) < 20
@@ -0,0 +1,223 @@
+from __future__ import annotations
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Heavy dependencies that the backtest path (cached parquet -> rank -> execute) must
+# not pull in at import time; they are imported inside the functions that need them.
+HEAVY_MODULES = ("yfinance", "statsmodels", "matplotlib", "scipy")
+
+# Top-level packages of this repository: their own import work is what the budgets cover.
+PROJECT_PACKAGES = ("DataStructures", "main", "analysis", "data", "indicators", "models", "strategies", "utils")
+
+# Import budget (microseconds) of each pipeline module, counting only the repo's own
+# modules it loads (sum of their self times); pandas / numpy / pyarrow start-up depends on
+# the machine and is excluded, the heavy-package check covers what gets pulled in.
+IMPORT_BUDGET_US: Dict[str, int] = {
+    "DataStructures": 100_000,
+    "data.market.universe": 100_000,
+    "utils.io": 100_000,
+    "utils.report": 100_000,
+    "utils.plotting": 100_000,
+    "models.hedge": 100_000,
+    "models.stats": 100_000,
+    "strategies.zscore_only": 100_000,
+    "analysis.pair_analysis": 100_000,
+    "analysis.coint_null": 100_000,
+    "analysis.baskets": 100_000,
+    "analysis.clustering": 100_000,
+    "analysis.incremental": 100_000,
+    "utils.sweep_queue": 100_000,
+    "utils.signal_service": 100_000,
+    "utils.results_store": 100_000,
+    "models.costs": 100_000,
+    "data.market.fx": 100_000,
+    "strategies.basket_zscore": 100_000,
+    "data.market.bars": 100_000,
+    "strategies.streaming": 100_000,
+    "models.execution": 100_000,
+    "analysis.allocation": 100_000,
+    "data.market.quality": 100_000,
+    "analysis.features": 100_000,
+    "utils.ledger": 100_000,
+}
+
+
+def import_profile(module: str) -> Dict[str, tuple[int, int]]:
+    """
+    Import `module` in a fresh interpreter with `python -X importtime` and return
+    {imported module: (self microseconds, cumulative microseconds)}.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    out = {}
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line.split("|")
+        out[name.strip()] = (int(own.split(":")[1]), int(cumulative))
+    return out
+
+
+def own_import_time(profile: Dict[str, tuple[int, int]], packages: Iterable[str] = PROJECT_PACKAGES) -> int:
+    """Microseconds spent in the repo's own modules (self times) of an import_profile."""
+    packages = set(packages)
+    return sum(own for name, (own, _) in profile.items() if name.split(".")[0] in packages)
+
+
+def check_import_budgets(
+    budgets: Dict[str, int] | None = None,
+    heavy: Iterable[str] = HEAVY_MODULES,
+    verbose: bool = True,
+) -> Dict[str, int]:
+    """
+    Measure each module's cold import (own modules only, see IMPORT_BUDGET_US) and raise
+    RuntimeError if it exceeds its budget or imports one of the `heavy` packages.
+    Returns {module: own microseconds}.
+    """
+    budgets = IMPORT_BUDGET_US if budgets is None else budgets
+    heavy = tuple(heavy)
+    times, problems = {}, []
+    for module, budget in budgets.items():
+        prof = import_profile(module)
+        times[module] = own_import_time(prof)
+        pulled = sorted({name.split(".")[0] for name in prof} & set(heavy))
+        if pulled:
+            problems.append(f"{module} imports {', '.join(pulled)} at load time")
+        if times[module] > budget:
+            problems.append(f"{module} took {times[module] / 1e3:.1f} ms in repo modules (budget {budget / 1e3:.0f} ms)")
+        if verbose:
+            total = prof.get(module, (0, 0))[1]
+            print(f"{module:<28} {times[module] / 1e3:8.1f} ms own {total / 1e3:8.1f} ms total")
+    if problems:
+        raise RuntimeError("Import budget exceeded:\n  " + "\n  ".join(problems))
+    return times
+
+
+def peak_memory(func: Callable, *args, **kwargs) -> tuple[Any, int]:
+    """(func(*args, **kwargs), peak bytes allocated during the call), via tracemalloc (numpy buffers included)."""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        out = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return out, peak
+
+
+def peak_rss(args: Iterable[str]) -> int:
+    """
+    Peak resident set growth (bytes) of `python -m utils.bench rss <args>` in a fresh
+    interpreter: the process's RSS high-water mark during the call minus its RSS once
+    imports and inputs are loaded (Linux /proc; the high-water mark is reset first, as
+    ru_maxrss of an exec'd child would start from the parent's peak).
+    """
+    out = subprocess.run([sys.executable, "-m", "utils.bench", "rss", *map(str, args)],
+                         cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return int(out.stdout.split()[-1])
+
+
+def _vm_kib(field: str) -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith(field + ":"):
+            return int(line.split()[1])
+    raise RuntimeError(f"{field} not in /proc/self/status")
+
+
+def _batch_inputs(bars: int, paths: int, seed: int):
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    idx = pd.bdate_range("2000-01-03", periods=bars)
+    prepared = {"pair_ret": pd.Series(rng.normal(0.0, 0.01, bars), index=idx), "unit_cost": None}
+    if not paths:
+        return prepared, None
+    # carried -1/0/+1 paths that change state on ~5% of the bars
+    state = rng.integers(-1, 2, size=(bars, paths), dtype=np.int8)
+    keep = rng.random((bars, paths)) > 0.05
+    keep[0] = False
+    rows = np.where(keep, 0, np.arange(bars)[:, None])
+    return prepared, np.take_along_axis(state, np.maximum.accumulate(rows, axis=0), axis=0)
+
+
+def _score(mode: str, prepared: Dict[str, Any], base, chunk: int | None):
+    # one mode of the benchmark: default = int64 paths in float64, compact = int8 paths in float32
+    import numpy as np
+    from strategies.zscore_only import PairsZScoreOnlyStrategy
+    if mode == "compact":
+        return PairsZScoreOnlyStrategy("A", "B", compact=True, dtype="float32").batch_summary(
+            prepared, base.copy(), chunk=chunk)
+    return PairsZScoreOnlyStrategy("A", "B").batch_summary(prepared, base.astype(np.int64), chunk=chunk)
+
+
+def _rss_worker(mode: str, chunk: str, paths_file: str, seed: str) -> None:
+    import gc
+    import numpy as np
+    base = np.load(paths_file)      # generated by the parent: building them here would set the peak
+    prepared, _ = _batch_inputs(base.shape[0], 0, int(seed))
+    gc.collect()
+    Path("/proc/self/clear_refs").write_text("5")      # reset VmHWM to the current RSS
+    before = _vm_kib("VmRSS")
+    _score(mode, prepared, base, None if chunk == "None" else int(chunk))
+    print((_vm_kib("VmHWM") - before) * 1024)
+
+
+def bench_compact_memory(bars: int = 2520, paths: int = 4000, chunk: int | None = 256, seed: int = 0,
+                         target: float = 4.0, verbose: bool = True) -> Dict[str, Any]:
+    """
+    Peak memory of scoring a (bars x paths) batch of position paths, as a parameter sweep
+    does, in default mode (int64 paths, float64) vs compact mode (int8 paths, float32),
+    both with the same `chunk` paths per call so the ratio is the representation gain
+    alone: peak RSS growth (peak_rss, one subprocess per mode) and peak traced
+    allocations (tracemalloc, peak_memory), and whether the RSS ratio reaches `target`.
+    Also reports the largest Sharpe / drawdown difference between the two.
+    """
+    import numpy as np
+
+    prepared, base = _batch_inputs(bars, paths, seed)
+    ref, traced_default = peak_memory(lambda: _score("default", prepared, base, chunk))
+    out, traced_compact = peak_memory(lambda: _score("compact", prepared, base, chunk))
+    with tempfile.TemporaryDirectory() as tmp:
+        paths_file = Path(tmp) / "paths.npy"
+        np.save(paths_file, base)
+        rss = {m: peak_rss([m, chunk, paths_file, seed]) for m in ("default", "compact")}
+    res = {
+        "bars": bars, "paths": paths, "chunk": chunk,
+        "rss_default_mb": rss["default"] / 2**20, "rss_compact_mb": rss["compact"] / 2**20,
+        "rss_ratio": rss["default"] / max(rss["compact"], 1),
+        "target_met": rss["default"] >= target * rss["compact"],
+        "traced_default_mb": traced_default / 2**20, "traced_compact_mb": traced_compact / 2**20,
+        "traced_ratio": traced_default / max(traced_compact, 1),
+        "max_sharpe_annual_diff": float(np.max(np.abs(ref["sharpe_annual"] - out["sharpe_annual"]))),
+        "max_drawdown_diff": float(np.max(np.abs(ref["max_drawdown"] - out["max_drawdown"]))),
+        "trades_equal": bool(np.array_equal(ref["n_trades"], out["n_trades"])),
+    }
+    if verbose:
+        print(f"{bars} bars x {paths} paths, chunk {chunk}: peak RSS growth default "
+              f"{res['rss_default_mb']:.1f} MB, compact {res['rss_compact_mb']:.1f} MB "
+              f"({res['rss_ratio']:.1f}x lower, {target:g}x target {'met' if res['target_met'] else 'NOT met'}); traced peak default {res['traced_default_mb']:.1f} MB, "
+              f"compact {res['traced_compact_mb']:.1f} MB ({res['traced_ratio']:.1f}x lower); "
+              f"max |dSharpe_annual| {res['max_sharpe_annual_diff']:.2e}, "
+              f"max |dMDD| {res['max_drawdown_diff']:.2e}, trades equal: {res['trades_equal']}")
+    return res
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["memory"]:
+        bench_compact_memory()
+    elif sys.argv[1:2] == ["rss"]:
+        _rss_worker(*sys.argv[2:])
+    else:
+        check_import_budgets()
@@ -1,6 +1,5 @@
 import pandas as pd
 import numpy as np
-import yfinance as yf
 
 def prep_prices(prices: pd.DataFrame) -> pd.DataFrame:
     """
@@ -52,6 +51,7 @@ def fetch_close_prices(tickers, start="2023-01-01", end=None) -> pd.DataFrame:
     Downloads daily close prices for a list/iterable of tickers and
     returns a cleaned DataFrame ready for strategies.
     """
+    import yfinance as yf  # deferred: network client only needed here
     df = yf.download(list(tickers), start=start, end=end, auto_adjust=False, progress=False)
     # yfinance returns MultiIndex columns; prep_prices will select Close for us
     return prep_prices(df)
\ No newline at end of file
@@ -0,0 +1,229 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Sequence
+import numpy as np
+import pandas as pd
+
+# Compact trade ledger: one contiguous NumPy array per field (Arrow's columnar layout),
+# ~45 bytes per trade instead of a dict with formatted strings:
+#
+#   pair            int32 code into `pairs` ("A/B" names, categorical)
+#   side            int8, +1 long s1 / short s2, -1 short s1 / long s2
+#   start, end      int64 ns timestamps of the entry bar and the flat bar that closes it
+#   bars            int32 price bars held (start..end, both included)
+#   entry_z, exit_z float32
+#   gross, cost, net float32 returns as fractions (the trade table shows them in %)
+#
+# Trades are cut from a position path with array ops (runs of non-zero positions, one
+# multiply.reduceat for the compounded returns, one add.reduceat for the costs), with the
+# same rules as the old per-bar loop in build_trade_table for -1/0/+1 paths; fractional
+# exposures (partial fills) weight the returns and costs by the size held / traded. Columns are exported without copying: to_pandas()
+# wraps the arrays, to_arrow() / to_parquet() hand them to pyarrow. top_k() uses
+# argpartition, by_pair() bincount over the pair codes.
+
+TRADE_FIELDS = {
+    "pair": np.int32, "side": np.int8, "start": np.int64, "end": np.int64, "bars": np.int32,
+    "entry_z": np.float32, "exit_z": np.float32, "gross": np.float32, "cost": np.float32, "net": np.float32,
+}
+RETURN_FIELDS = ("gross", "cost", "net")
+
+
+def _ns(index) -> np.ndarray:
+    return pd.DatetimeIndex(index).as_unit("ns").asi8
+
+
+class TradeLedger:
+    def __init__(self, columns: Mapping[str, np.ndarray] | None = None, pairs: Sequence[str] = ()):
+        columns = columns or {}
+        self.pairs = [str(p) for p in pairs]
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.ascontiguousarray(columns.get(name, ()), dtype=dtype) for name, dtype in TRADE_FIELDS.items()
+        }
+        sizes = {a.size for a in self.columns.values()}
+        if len(sizes) > 1:
+            raise ValueError(f"ledger columns have different lengths: {sorted(sizes)}")
+
+    # ---- building
+    @classmethod
+    def from_positions(
+        cls,
+        positions: pd.Series,        # +1 long s1/short s2, -1 short s1/long s2, 0 flat (fractions: partial fills)
+        prices: pd.DataFrame,        # columns [s1, s2]
+        z: pd.Series,
+        beta: float | pd.Series,     # static hedge ratio, or a rolling one (applied with one bar lag)
+        tx_cost_per_leg: float = 0.0005,
+        unit_cost: pd.Series | None = None,   # per-bar cost of a position change (both legs)
+        pair: str | None = None,
+    ) -> "TradeLedger":
+        """
+        Trades of one position path. A trade opens on the first non-zero bar after a flat
+        one and closes on the next flat bar (a flip keeps the trade open, as before); a
+        trade still open on the last bar is not recorded. side is the sign of the entry
+        exposure; returns compound the exposure actually held on each bar (after a flip,
+        the new side) and costs are |Δposition| x unit cost, so partial fills count at
+        their size and a flip pays for both legs of the reversal.
+        """
+        s1, s2 = prices.columns[:2]
+        idx = positions.index
+        pos = np.nan_to_num(positions.to_numpy(dtype=float))
+        live = pos != 0
+        prev = np.concatenate([[False], live[:-1]])
+        starts = np.flatnonzero(live & ~prev)
+        ends = np.flatnonzero(~live & prev)
+        starts = starts[:ends.size]
+        pair = f"{s1}/{s2}" if pair is None else pair
+        if not ends.size:
+            return cls(pairs=[pair])
+
+        # returns compound over every price bar from start to end (the price index may hold
+        # bars the position path skipped, they keep the exposure held before them; the flat
+        # closing bar earns with the exposure it closes); a NaN hedge ratio leaves a bar out
+        rets = prices[[s1, s2]].pct_change().fillna(0)
+        b = beta.shift(1).reindex(rets.index).to_numpy(dtype=float) if isinstance(beta, pd.Series) else float(beta)
+        x = rets[s1].to_numpy(dtype=float) - b * rets[s2].to_numpy(dtype=float)
+        held = positions.reindex(rets.index).ffill().fillna(0).to_numpy(dtype=float)
+        held = np.where(held != 0, held, np.concatenate([[0.0], held[:-1]]))
+        lo = rets.index.searchsorted(idx[starts], side="left")
+        hi = rets.index.searchsorted(idx[ends], side="right")
+        side = np.sign(pos[starts]).astype(np.int8)
+        cuts = np.column_stack([lo, np.maximum(hi, lo + 1)]).ravel()
+        gross = np.multiply.reduceat(np.append(np.nan_to_num(1.0 + held * x, nan=1.0), 1.0), cuts)[::2] - 1.0
+
+        default = 2 * tx_cost_per_leg
+        uc = np.full(idx.size, default) if unit_cost is None else \
+            np.nan_to_num(unit_cost.reindex(idx).to_numpy(dtype=float), nan=default)
+        traded = np.abs(np.diff(pos, prepend=0.0)) * uc
+        cost = np.add.reduceat(np.append(traded, 0.0), np.column_stack([starts, ends + 1]).ravel())[::2]
+        zv = z.reindex(idx).to_numpy(dtype=float)
+        t = _ns(idx)
+        return cls({
+            "pair": np.zeros(ends.size), "side": side, "start": t[starts], "end": t[ends],
+            "bars": hi - lo, "entry_z": zv[starts], "exit_z": zv[ends],
+            "gross": gross, "cost": cost, "net": gross - cost,
+        }, pairs=[pair])
+
+    @classmethod
+    def from_trade_table(cls, trades: pd.DataFrame, pair: str) -> "TradeLedger":
+        """Ledger of a build_trade_table frame (returns in %, side strings)."""
+        return cls({
+            "pair": np.zeros(len(trades)),
+            "side": np.where(trades["side"].astype(str).str.startswith("LONG"), 1, -1),
+            "start": _ns(trades["start"]), "end": _ns(trades["end"]), "bars": trades["days"],
+            "entry_z": trades["entry_z"].astype(float), "exit_z": trades["exit_z"].astype(float),
+            **{f: trades[c].to_numpy(dtype=float) / 100.0
+               for f, c in zip(RETURN_FIELDS, ("gross_return_%", "est_cost_%", "net_return_%"))},
+        }, pairs=[pair])
+
+    @classmethod
+    def concat(cls, ledgers: Iterable["TradeLedger"]) -> "TradeLedger":
+        """One ledger over several (e.g. per-pair) ledgers; pair codes are remapped."""
+        ledgers = list(ledgers)
+        pairs = list(dict.fromkeys(p for led in ledgers for p in led.pairs))
+        code = {p: i for i, p in enumerate(pairs)}
+        cols = {name: [] for name in TRADE_FIELDS}
+        for led in ledgers:
+            remap = np.array([code[p] for p in led.pairs], dtype=np.int32)
+            for name, arr in led.columns.items():
+                cols[name].append(remap[arr] if name == "pair" and arr.size else arr)
+        return cls({name: np.concatenate(parts) if parts else () for name, parts in cols.items()}, pairs=pairs)
+
+    # ---- queries
+    def __len__(self) -> int:
+        return int(self.columns["net"].size)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.columns.values())
+
+    def take(self, rows) -> "TradeLedger":
+        return TradeLedger({name: a[rows] for name, a in self.columns.items()}, pairs=self.pairs)
+
+    def top_k(self, k: int, by: str = "net", largest: bool = True) -> "TradeLedger":
+        """k trades with the largest (or smallest) `by`, best first: argpartition + sort of k."""
+        v = self.columns[by].astype(np.float64)
+        k = min(int(k), v.size)
+        if k <= 0:
+            return self.take(np.zeros(0, dtype=np.int64))
+        key = -v if largest else v
+        part = np.argpartition(key, k - 1)[:k] if k < v.size else np.arange(v.size)
+        return self.take(part[np.lexsort((part, key[part]))])
+
+    def by_pair(self) -> pd.DataFrame:
+        """Per-pair trade count, win rate, mean / compounded / best / worst net %, mean bars."""
+        code = self.columns["pair"]
+        n_pairs = len(self.pairs)
+        net = self.columns["net"].astype(np.float64)
+        trades = np.bincount(code, minlength=n_pairs)
+        best = np.full(n_pairs, -np.inf)
+        worst = np.full(n_pairs, np.inf)
+        np.maximum.at(best, code, net)
+        np.minimum.at(worst, code, net)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = pd.DataFrame({
+                "trades": trades,
+                "win_rate": np.bincount(code, weights=net > 0, minlength=n_pairs) / trades,
+                "mean_net_%": np.bincount(code, weights=net, minlength=n_pairs) / trades * 100.0,
+                "compounded_net_%": np.expm1(np.bincount(code, weights=np.log1p(net), minlength=n_pairs)) * 100.0,
+                "best_%": np.where(trades > 0, best, np.nan) * 100.0,
+                "worst_%": np.where(trades > 0, worst, np.nan) * 100.0,
+                "mean_bars": np.bincount(code, weights=self.columns["bars"], minlength=n_pairs) / trades,
+            }, index=pd.Index(self.pairs, name="pair"))
+        return out
+
+    # ---- export
+    def to_pandas(self) -> pd.DataFrame:
+        """Columns as stored (returns as fractions); numeric and timestamp columns share memory."""
+        c = self.columns
+        data = {name: c[name] for name in TRADE_FIELDS}
+        data["pair"] = pd.Categorical.from_codes(c["pair"], categories=self.pairs, validate=False)
+        data["start"] = c["start"].view("datetime64[ns]")
+        data["end"] = c["end"].view("datetime64[ns]")
+        return pd.DataFrame(data, copy=False)
+
+    def to_trade_table(self) -> pd.DataFrame:
+        """The build_trade_table layout: side strings, returns in %."""
+        c = self.columns
+        legs = [(p.split("/", 1) + [""])[:2] for p in self.pairs]
+        labels = np.array([f"LONG {a} / SHORT {b}" for a, b in legs]
+                          + [f"SHORT {a} / LONG {b}" for a, b in legs], dtype=object)
+        side = labels[c["pair"] + len(self.pairs) * (c["side"] != 1)]
+        return pd.DataFrame({
+            "start": pd.to_datetime(c["start"].view("datetime64[ns]")),
+            "end": pd.to_datetime(c["end"].view("datetime64[ns]")),
+            "days": c["bars"].astype(np.int64),
+            "side": side,
+            "entry_z": c["entry_z"].astype(np.float64),
+            "exit_z": c["exit_z"].astype(np.float64),
+            "gross_return_%": c["gross"].astype(np.float64) * 100.0,
+            "est_cost_%": c["cost"].astype(np.float64) * 100.0,
+            "net_return_%": c["net"].astype(np.float64) * 100.0,
+        })
+
+    def to_arrow(self):
+        import pyarrow as pa  # deferred
+        c = self.columns
+        arrays = {name: pa.array(a) for name, a in c.items()}
+        arrays["pair"] = pa.DictionaryArray.from_arrays(arrays["pair"], pa.array(self.pairs, type=pa.string()))
+        arrays["start"] = pa.array(c["start"].view("datetime64[ns]"))
+        arrays["end"] = pa.array(c["end"].view("datetime64[ns]"))
+        return pa.table(arrays)
+
+    def to_parquet(self, path: str | Path) -> Path:
+        import pyarrow.parquet as pq  # deferred
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(self.to_arrow(), path)
+        return path
+
+    @classmethod
+    def from_parquet(cls, path: str | Path) -> "TradeLedger":
+        import pyarrow.parquet as pq  # deferred
+        table = pq.read_table(path).unify_dictionaries().combine_chunks()
+        pair = table.column("pair").chunk(0) if table.num_rows else None
+        cols = {name: table.column(name).to_numpy().view(np.int64) if name in ("start", "end")
+                else table.column(name).to_numpy()
+                for name in TRADE_FIELDS if name != "pair"}
+        if pair is None:
+            return cls(cols, pairs=[])
+        cols["pair"] = pair.indices.to_numpy()
+        return cls(cols, pairs=pair.dictionary.to_pylist())
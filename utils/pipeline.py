@@ -0,0 +1,336 @@
+from __future__ import annotations
+import ast
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import shutil
+import time
+import types
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List
+import numpy as np
+import pandas as pd
+
+PIPELINE_ROOT = Path(".pipeline")
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _sha(*parts: bytes | str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode() if isinstance(p, str) else p)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _module_file(name: str) -> Path | None:
+    """Source file of a module of this repository (None for stdlib / third-party)."""
+    base = REPO_ROOT.joinpath(*name.split("."))
+    for path in (base.with_suffix(".py"), base / "__init__.py"):
+        if path.is_file():
+            return path
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _imports_of(path: Path, mtime_ns: int) -> tuple[Path, ...]:
+    # repo modules imported anywhere in the file (module level or deferred in a function)
+    out = set()
+    for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module] + [f"{node.module}.{a.name}" for a in node.names]
+        else:
+            continue
+        out.update(f for f in map(_module_file, names) if f is not None)
+    return tuple(sorted(out))
+
+
+def _code_deps(func: Callable) -> List[Path]:
+    """Repo modules `func` uses (globals it references, deferred imports) and everything they import."""
+    names, codes = set(), [getattr(func, "__code__", None)]
+    while codes:
+        code = codes.pop()
+        if code is None:
+            continue
+        names.update(code.co_names)
+        codes.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+    g = getattr(func, "__globals__", {})
+    todo = set()
+    for n in names:
+        obj = g.get(n)
+        mod = obj.__name__ if isinstance(obj, types.ModuleType) else getattr(obj, "__module__", None)
+        for cand in (mod, n):
+            f = _module_file(cand) if isinstance(cand, str) else None
+            if f is not None:
+                todo.add(f)
+    seen = set()
+    while todo:
+        f = todo.pop()
+        if f not in seen:
+            seen.add(f)
+            todo.update(_imports_of(f, f.stat().st_mtime_ns))
+    return sorted(seen)
+
+
+def _code_hash(func: Callable) -> str:
+    # editing a stage function, or any repo module it (transitively) uses, invalidates
+    # its artifacts
+    try:
+        own = inspect.getsource(func)
+    except (OSError, TypeError):
+        own = getattr(func, "__qualname__", repr(func))
+    deps = [f"{p.relative_to(REPO_ROOT).as_posix()}:{hashlib.sha256(p.read_bytes()).hexdigest()}"
+            for p in _code_deps(func)]
+    return _sha(own, *deps)
+
+
+class ArtifactStore:
+    """
+    Content-addressed artifacts on local disk.
+
+      objects/<sha256>.<ext>   DataFrame/Series -> parquet, ndarray -> npy,
+                               JSON-able -> json, anything else -> pkl
+      objects/<sha256>.bundle/ dict holding frames/arrays: one file per entry
+      index/<stage_key>.json   stage key (code + params + upstream content) -> object
+      runs/<ts>.json           stage -> object map of each run (roots for gc)
+
+    Identical outputs share one object, whichever stage or run produced them.
+    """
+
+    def __init__(self, root: str | Path = PIPELINE_ROOT):
+        self.root = Path(root)
+        for sub in ("objects", "index", "runs", "tmp"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+
+    # ---- (de)serialisation of single values
+    @staticmethod
+    def _write_value(obj: Any, base: Path) -> Path:
+        if isinstance(obj, pd.Series):
+            path = base.with_suffix(".series.parquet")
+            obj.to_frame(name=obj.name if obj.name is not None else "__value__").to_parquet(path)
+        elif isinstance(obj, pd.DataFrame):
+            path = base.with_suffix(".parquet")
+            obj.to_parquet(path)
+        elif isinstance(obj, np.ndarray):
+            path = base.with_suffix(".npy")
+            np.save(path, obj, allow_pickle=False)
+        else:
+            try:
+                text = json.dumps(obj, sort_keys=True, default=None)
+                path = base.with_suffix(".json")
+                path.write_text(text)
+            except TypeError:
+                path = base.with_suffix(".pkl")
+                path.write_bytes(pickle.dumps(obj))
+        return path
+
+    @staticmethod
+    def _read_value(path: Path, columns: List[str] | None = None) -> Any:
+        name = path.name
+        if name.endswith(".series.parquet"):
+            df = pd.read_parquet(path)
+            s = df.iloc[:, 0]
+            return s.rename(None) if s.name == "__value__" else s
+        if name.endswith(".parquet"):
+            return pd.read_parquet(path, columns=columns)
+        if name.endswith(".npy"):
+            return np.load(path, allow_pickle=False)
+        if name.endswith(".json"):
+            return json.loads(path.read_text())
+        return pickle.loads(path.read_bytes())
+
+    @staticmethod
+    def _file_digest(path: Path) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    # ---- objects
+    def put(self, obj: Any) -> str:
+        """Store obj, return its object id ('<sha>' + suffix)."""
+        tmp = self.root / "tmp" / f"{time.time_ns()}"
+        if isinstance(obj, dict) and any(isinstance(v, (pd.DataFrame, pd.Series, np.ndarray)) for v in obj.values()):
+            tmp.mkdir(parents=True)
+            parts = {k: self._write_value(v, tmp / k) for k, v in obj.items()}
+            digest = _sha(*[f"{k}:{self._file_digest(p)}" for k, p in sorted(parts.items())])
+            oid = f"{digest}.bundle"
+            dest = self.root / "objects" / oid
+            if dest.exists():
+                shutil.rmtree(tmp)
+            else:
+                tmp.rename(dest)
+            return oid
+        path = self._write_value(obj, tmp)
+        suffix = path.name[len(tmp.name):]
+        oid = f"{self._file_digest(path)}{suffix}"
+        dest = self.root / "objects" / oid
+        if dest.exists():
+            path.unlink()
+        else:
+            path.rename(dest)
+        return oid
+
+    def get(self, oid: str, columns: List[str] | None = None) -> Any:
+        path = self.root / "objects" / oid
+        if oid.endswith(".bundle"):
+            return {p.name.split(".", 1)[0]: self._read_value(p) for p in sorted(path.iterdir())}
+        return self._read_value(path, columns=columns)
+
+    def has(self, oid: str) -> bool:
+        return (self.root / "objects" / oid).exists()
+
+    # ---- stage index
+    def lookup(self, stage_key: str) -> str | None:
+        path = self.root / "index" / f"{stage_key}.json"
+        if not path.exists():
+            return None
+        oid = json.loads(path.read_text())["object"]
+        return oid if self.has(oid) else None
+
+    def record(self, stage_key: str, stage: str, oid: str) -> None:
+        (self.root / "index" / f"{stage_key}.json").write_text(
+            json.dumps({"stage": stage, "object": oid, "created": time.time()}))
+
+    def write_run(self, entries: Dict[str, Dict[str, str]]) -> Path:
+        path = self.root / "runs" / f"{time.strftime('%Y%m%dT%H%M%S')}_{time.time_ns() % 10**9:09d}.json"
+        path.write_text(json.dumps(entries, indent=2))
+        return path
+
+    def gc(self, keep_runs: int = 5) -> Dict[str, int]:
+        """Keep the last `keep_runs` runs; delete index entries and objects only older runs used."""
+        runs = sorted((self.root / "runs").glob("*.json"))
+        old, kept = runs[:-keep_runs] if keep_runs > 0 else runs, runs[-keep_runs:] if keep_runs > 0 else []
+        for p in old:
+            p.unlink()
+        live_keys, live_objs = set(), set()
+        for p in kept:
+            for entry in json.loads(p.read_text()).values():
+                live_keys.add(entry["key"])
+                live_objs.add(entry["object"])
+        removed_idx = removed_obj = freed = 0
+        for p in (self.root / "index").glob("*.json"):
+            if p.stem not in live_keys:
+                p.unlink()
+                removed_idx += 1
+        for p in (self.root / "objects").iterdir():
+            if p.name not in live_objs:
+                size = sum(f.stat().st_size for f in p.rglob("*")) if p.is_dir() else p.stat().st_size
+                shutil.rmtree(p) if p.is_dir() else p.unlink()
+                removed_obj += 1
+                freed += size
+        shutil.rmtree(self.root / "tmp", ignore_errors=True)
+        (self.root / "tmp").mkdir()
+        return {"runs_removed": len(old), "index_removed": removed_idx,
+                "objects_removed": removed_obj, "bytes_freed": freed}
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[..., Any]             # func(*upstream outputs, **params)
+    inputs: tuple = ()                   # upstream stage names, in argument order
+    params: Dict[str, Any] = field(default_factory=dict)
+    fingerprint: Callable[[], str] | None = None   # external inputs (e.g. files on disk)
+
+
+class Pipeline:
+    """
+    Small DAG runner. A stage re-runs only when its code (the stage function and the
+    sources of the repo modules it uses, see _code_deps), its params, its external
+    fingerprint or the *content* of an upstream artifact changed; otherwise its stored
+    artifact is loaded. Changing only a backtest parameter therefore re-runs only the
+    stages downstream of it.
+    """
+
+    def __init__(self, store: ArtifactStore | None = None):
+        self.store = store or ArtifactStore()
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func: Callable[..., Any], inputs: Iterable[str] = (),
+            params: Dict[str, Any] | None = None, fingerprint: Callable[[], str] | None = None) -> "Pipeline":
+        inputs = tuple(inputs)
+        for i in inputs:
+            if i not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {i!r} (add stages in order)")
+        self.stages[name] = Stage(name, func, inputs, dict(params or {}), fingerprint)
+        return self
+
+    def _key(self, stage: Stage, upstream_oids: List[str]) -> str:
+        return _sha(
+            stage.name,
+            _code_hash(stage.func),
+            json.dumps(stage.params, sort_keys=True, default=str),
+            stage.fingerprint() if stage.fingerprint else "",
+            *upstream_oids,
+        )
+
+    def _closure(self, targets: Iterable[str] | None) -> List[str]:
+        if targets is None:
+            return list(self.stages)
+        need = set()
+        def visit(n):
+            if n not in need:
+                need.add(n)
+                for i in self.stages[n].inputs:
+                    visit(i)
+        for t in targets:
+            visit(t)
+        return [n for n in self.stages if n in need]
+
+    def run(self, targets: Iterable[str] | None = None, force: Iterable[str] = (), verbose: bool = True) -> Dict[str, Any]:
+        """Run (or load) the stages needed for `targets`; returns {stage: output}."""
+        force = set(force)
+        oids: Dict[str, str] = {}
+        outputs: Dict[str, Any] = {}
+        run_entries: Dict[str, Dict[str, str]] = {}
+        for name in self._closure(targets):
+            stage = self.stages[name]
+            key = self._key(stage, [oids[i] for i in stage.inputs])
+            oid = None if name in force else self.store.lookup(key)
+            t0 = time.perf_counter()
+            if oid is not None:
+                outputs[name] = self.store.get(oid)
+                status = "cached"
+            else:
+                outputs[name] = stage.func(*[outputs[i] for i in stage.inputs], **stage.params)
+                oid = self.store.put(outputs[name])
+                self.store.record(key, name, oid)
+                status = "ran"
+            oids[name] = oid
+            run_entries[name] = {"key": key, "object": oid}
+            if verbose:
+                print(f"[pipeline] {name:<10} {status:<6} {time.perf_counter() - t0:7.2f}s  {oid[:12]}")
+        self.store.write_run(run_entries)
+        return outputs
+
+    def status(self) -> pd.DataFrame:
+        """Per stage: cached (up to date), stale (would re-run) or blocked (upstream stale)."""
+        rows, oids = [], {}
+        for name, stage in self.stages.items():
+            if any(i not in oids for i in stage.inputs):
+                rows.append({"stage": name, "status": "blocked", "object": None})
+                continue
+            oid = self.store.lookup(self._key(stage, [oids[i] for i in stage.inputs]))
+            if oid is not None:
+                oids[name] = oid
+            rows.append({"stage": name, "status": "cached" if oid else "stale", "object": oid})
+        return pd.DataFrame(rows)
+
+
+def files_fingerprint(paths: Iterable[str | Path]) -> str:
+    """Cheap fingerprint of files on disk (path, size, mtime)."""
+    parts = []
+    for p in sorted(Path(x) for x in paths):
+        if p.exists():
+            st = p.stat()
+            parts.append(f"{p}:{st.st_size}:{st.st_mtime_ns}")
+        else:
+            parts.append(f"{p}:missing")
+    return _sha(*parts)
@@ -1,5 +1,53 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+
+def position_runs(positions: pd.Series) -> Dict[int, tuple[np.ndarray, np.ndarray]]:
+    """
+    Contiguous runs of long (+1) and short (-1) exposure, found with array diffs; a
+    partial fill (e.g. 0.5) counts by its sign. Returns {side: (start_idx, end_idx)}
+    with end_idx exclusive (a run ending on the last bar ends at len - 1, as the old
+    span loop did).
+    """
+    pos = np.sign(np.nan_to_num(np.asarray(positions, dtype=float)))
+    n = len(pos)
+    out = {}
+    for value in (1, -1):
+        flag = np.concatenate(([0], (pos == value).astype(np.int8), [0]))
+        edges = np.diff(flag)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.minimum(np.flatnonzero(edges == -1), n - 1)
+        out[value] = (starts, ends)
+    return out
+
+
+def downsample_idx(values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indices of a min/max decimation of `values` to about max_points points, so long
+    series keep their peaks and troughs on screen. All indices if already short.
+    """
+    n = len(values)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    k = int(np.ceil(n / max(max_points // 2, 1)))   # bucket size, 2 points per bucket
+    pad = (-n) % k
+    v = np.concatenate([np.asarray(values, dtype=float), np.full(pad, np.nan)]).reshape(-1, k)
+    filled = ~np.isnan(v).all(axis=1)
+    lo = np.nanargmin(np.where(np.isnan(v), np.inf, v), axis=1)
+    hi = np.nanargmax(np.where(np.isnan(v), -np.inf, v), axis=1)
+    base = np.arange(v.shape[0]) * k
+    idx = np.concatenate([(base + lo)[filled], (base + hi)[filled], [0, n - 1]])
+    return np.unique(idx[idx < n])
+
+
+def _plot_line(ax, s: pd.Series, max_points: int, **kwargs):
+    idx = downsample_idx(s.to_numpy(), max_points)
+    return ax.plot(s.index[idx], s.to_numpy()[idx], **kwargs)
+
 
 def plot_positions_with_z(
     prices: pd.DataFrame,       # columns [s1, s2]
@@ -8,39 +56,43 @@ def plot_positions_with_z(
     entry_z: float,
     exit_z: float,
     title: str = "Pairs Trading — Positions & Z-score",
+    show: bool = True,
+    save_path: str | Path | None = None,
+    max_points: int | None = 4000,
+    dpi: int = 100,
 ):
+    """
+    Normalized prices, z-score with thresholds, and green/red bands for long/short.
+
+    Bands are drawn with one broken_barh call per side; lines are min/max decimated
+    to `max_points`. show=False + save_path renders headless (no window) and closes
+    the figure; returns the figure otherwise.
+    """
+    import matplotlib.pyplot as plt  # deferred: only plotting jobs pay for it
+    import matplotlib.dates as mdates
     s1, s2 = prices.columns[:2]
 
     # Normalize prices for visual comparison
     norm = prices / prices.iloc[0]
 
     fig, ax1 = plt.subplots(figsize=(11, 6))
-    norm[s1].plot(ax=ax1, label=s1)
-    norm[s2].plot(ax=ax1, label=s2)
+    _plot_line(ax1, norm[s1], max_points, label=s1)
+    _plot_line(ax1, norm[s2], max_points, label=s2)
     ax1.set_ylabel("Normalized Price")
     ax1.legend(loc="upper left")
 
-    # Shade position regions
-    # Long periods (+1)
-    long_mask = positions == 1
-    short_mask = positions == -1
-    for mask, alpha in [(long_mask, 0.12), (short_mask, 0.12)]:
-        # draw contiguous spans
-        in_span = False
-        span_start = None
-        for t, flag in mask.items():
-            if flag and not in_span:
-                in_span = True
-                span_start = t
-            elif not flag and in_span:
-                ax1.axvspan(span_start, t, color=("green" if mask is long_mask else "red"), alpha=alpha)
-                in_span = False
-        if in_span:
-            ax1.axvspan(span_start, positions.index[-1], color=("green" if mask is long_mask else "red"), alpha=alpha)
+    # Shade position regions: green = long (> 0), red = short (< 0)
+    x = mdates.date2num(pd.DatetimeIndex(positions.index).to_pydatetime())
+    for value, (starts, ends) in position_runs(positions).items():
+        if starts.size == 0:
+            continue
+        spans = np.column_stack([x[starts], x[ends] - x[starts]])
+        ax1.broken_barh(spans, (0, 1), transform=ax1.get_xaxis_transform(),
+                        facecolors=("green" if value == 1 else "red"), alpha=0.12)
 
     # Twin axis for z-score
     ax2 = ax1.twinx()
-    z.plot(ax=ax2, linewidth=1.0, alpha=0.6, label="z-score")
+    _plot_line(ax2, z, max_points, linewidth=1.0, alpha=0.6, label="z-score")
     ax2.axhline(entry_z, linestyle="--")
     ax2.axhline(-entry_z, linestyle="--")
     ax2.axhline(exit_z, linestyle=":")
@@ -49,4 +101,82 @@ def plot_positions_with_z(
 
     fig.suptitle(title)
     fig.tight_layout()
-    plt.show()
\ No newline at end of file
+    if save_path is not None:
+        Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(save_path, dpi=dpi)
+    if show:
+        plt.show()
+    elif save_path is not None:
+        plt.close(fig)
+        return None
+    return fig
+
+
+# ----------------- headless batch export -----------------
+
+def _init_headless() -> None:
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+
+
+def _render_pair(job: Dict[str, Any]) -> str:
+    """Worker: optionally backtest one pair, then render its PNG."""
+    if "positions" not in job:
+        from strategies.zscore_only import PairsZScoreOnlyStrategy
+        strat = PairsZScoreOnlyStrategy(stock1=job["s1"], stock2=job["s2"], **job.get("strategy", {}))
+        res = strat.execute(job["prices"], fields=("positions", "z"), **job.get("execute", {}))
+        job = {**job, "positions": res["positions"], "z": res["z"],
+               "entry_z": strat.entry_z, "exit_z": strat.exit_z}
+    plot_positions_with_z(
+        prices=job["prices"],
+        positions=job["positions"],
+        z=job["z"],
+        entry_z=job["entry_z"],
+        exit_z=job["exit_z"],
+        title=job.get("title", f"{job.get('s1', '')} / {job.get('s2', '')} - positions & z-score"),
+        show=False,
+        save_path=job["path"],
+        max_points=job.get("max_points", 4000),
+    )
+    return str(job["path"])
+
+
+def export_pair_plots(jobs: Iterable[Dict[str, Any]], processes: int | None = None) -> List[str]:
+    """
+    Render many position/z plots to PNG in parallel worker processes (Agg backend).
+
+    Each job is a dict with 'prices' and 'path', plus either precomputed
+    'positions'/'z'/'entry_z'/'exit_z' or 's1'/'s2' and optional 'strategy'
+    (PairsZScoreOnlyStrategy kwargs) / 'execute' (execute kwargs) to backtest in the
+    worker. Returns the written paths in job order.
+    """
+    jobs = list(jobs)
+    if processes == 1 or len(jobs) <= 1:
+        _init_headless()
+        return [_render_pair(j) for j in jobs]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_headless) as pool:
+        return list(pool.map(_render_pair, jobs))
+
+
+def export_top_pair_plots(
+    ranked: pd.DataFrame,
+    prices: pd.DataFrame,
+    out_dir: str | Path,
+    top_n: int = 10,
+    strategy: Dict[str, Any] | None = None,
+    execute: Dict[str, Any] | None = None,
+    processes: int | None = None,
+) -> List[str]:
+    """Backtest and render the top_n pairs of a rank_pairs table to out_dir/<A>_<B>.png."""
+    out_dir = Path(out_dir)
+    jobs = []
+    for pair in ranked["pair"].head(top_n):
+        s1, s2 = [x.strip() for x in pair.split("/", 1)]
+        jobs.append({
+            "s1": s1, "s2": s2,
+            "prices": prices[[s1, s2]],
+            "strategy": strategy or {},
+            "execute": execute or {},
+            "path": out_dir / f"{s1}_{s2}.png",
+        })
+    return export_pair_plots(jobs, processes=processes)
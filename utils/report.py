@@ -1,54 +1,28 @@
 from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Optional
+import hashlib
 import pandas as pd
 import numpy as np
 import itertools
+from utils.ledger import TradeLedger
 
 def build_trade_table(
     positions: pd.Series,        # +1 long s1/short s2, -1 short s1/long s2, 0 flat
     prices: pd.DataFrame,        # columns [s1, s2]
     z: pd.Series,                # z-score of spread
-    beta: float,                 # hedge ratio used
+    beta: float | pd.Series,     # hedge ratio used (Series for a rolling hedge)
     tx_cost_per_leg: float = 0.0005,   # 5 bps per leg
+    unit_cost: pd.Series | None = None,  # per-bar cost of a position change (both legs), e.g. CostModel.pair_costs
 ) -> pd.DataFrame:
     """
     Returns a per-trade table with start/end, side, days, gross/net return.
+    Built from a TradeLedger (utils.ledger); use TradeLedger.from_positions directly to
+    keep the compact form for large / multi-pair runs.
     """
-    s1, s2 = prices.columns[:2] 
-    rets = prices.pct_change().fillna(0)
-
-    trades = []
-    in_trade = False
-    trade_side = 0
-    start_t = None
-    for i, t in enumerate(positions.index):
-        pos = int(positions.iloc[i])
-        if not in_trade and pos != 0:
-            in_trade = True
-            trade_side = pos
-            start_t = t
-        elif in_trade and pos == 0:
-            end_t = t
-            slice_ = slice(start_t, end_t)
-            port_ret = trade_side * (rets[s1].loc[slice_] - beta * rets[s2].loc[slice_])
-            gross = float((1 + port_ret).prod() - 1)
-            cost = 2 * (2 * tx_cost_per_leg)  # entry + exit, 2 legs each
-            net = gross - cost
-            trades.append({
-                "start": start_t,
-                "end": end_t,
-                "days": int(len(port_ret)),
-                "side": f"LONG {s1} / SHORT {s2}" if trade_side == 1 else f"SHORT {s1} / LONG {s2}",
-                "entry_z": float(z.loc[start_t]) if start_t in z.index else None,
-                "exit_z": float(z.loc[end_t]) if end_t in z.index else None,
-                "gross_return_%": gross * 100.0,
-                "est_cost_%": cost * 100.0,
-                "net_return_%": net * 100.0,
-            })
-            in_trade = False
-            trade_side = 0
-            start_t = None
-
-    return pd.DataFrame(trades)
+    return TradeLedger.from_positions(
+        positions, prices, z=z, beta=beta, tx_cost_per_leg=tx_cost_per_leg, unit_cost=unit_cost,
+    ).to_trade_table()
 
 
 def print_trade_table(df: pd.DataFrame, max_rows: int = 30) -> None:
@@ -67,7 +41,7 @@ def print_trade_table(df: pd.DataFrame, max_rows: int = 30) -> None:
 
 
 def summarize_extreme_trades(
-    trades: pd.DataFrame,
+    trades: pd.DataFrame | TradeLedger,
     k: int = 3,
     out_dir: Optional[str | Path] = None,
 ) -> Dict[str, pd.DataFrame]:
@@ -81,7 +55,16 @@ def summarize_extreme_trades(
 
     If out_dir is provided, also saves:
       out_dir/top_gains.csv and out_dir/top_losses.csv
+
+    A TradeLedger is queried with argpartition and only the 2k selected trades are
+    turned into rows.
     """
+    cols = ["start", "end", "days", "side", "net_return_%"]
+    if isinstance(trades, TradeLedger):
+        top_gains = trades.top_k(k, "net").to_trade_table()[cols]
+        top_losses = trades.top_k(k, "net", largest=False).to_trade_table()[cols]
+        return _save_extremes(top_gains, top_losses, out_dir)
+
     required = {"start", "end", "days", "side", "net_return_%"}
     missing = required - set(trades.columns)
     if missing:
@@ -92,11 +75,13 @@ def summarize_extreme_trades(
         return {"top_gains": empty, "top_losses": empty}
 
     k = min(int(k), len(trades))
-    cols = ["start", "end", "days", "side", "net_return_%"]
-
     top_gains = trades.nlargest(k, "net_return_%")[cols].reset_index(drop=True)
     top_losses = trades.nsmallest(k, "net_return_%")[cols].reset_index(drop=True)
+    return _save_extremes(top_gains, top_losses, out_dir)
 
+
+def _save_extremes(top_gains: pd.DataFrame, top_losses: pd.DataFrame,
+                   out_dir: Optional[str | Path]) -> Dict[str, pd.DataFrame]:
     if out_dir is not None:
         out_dir = Path(out_dir)
         out_dir.mkdir(parents=True, exist_ok=True)
@@ -105,6 +90,12 @@ def summarize_extreme_trades(
 
     return {"top_gains": top_gains, "top_losses": top_losses}
 
+def _positions_digest(positions: pd.Series) -> bytes:
+    """Digest of a position path (packed int8 buffer), used to spot identical runs."""
+    buf = np.ascontiguousarray(positions.to_numpy(), dtype=np.int8).tobytes()
+    return hashlib.blake2b(buf, digest_size=16).digest()
+
+
 def grid_search_pairs_params(
     prices: pd.DataFrame,
     s1: str, s2: str,
@@ -118,53 +109,120 @@ def grid_search_pairs_params(
     tp_grid    = (None, 0.06, 0.10, 0.15),
     max_bars_in_trade = None,
     objective = "sharpe_penalized",   # "sharpe", "return", or "sharpe_penalized"
-    dd_limit_pct = 20.0               # penalty kicks in beyond this drawdown
+    dd_limit_pct = 20.0,              # penalty kicks in beyond this drawdown
+    hedge_mode: str = "static",       # "static" or "rolling" (see PairsZScoreOnlyStrategy)
+    beta_window: int = 60,
+    costs: pd.Series | pd.DataFrame | None = None,   # per-bar costs (see PairsZScoreOnlyStrategy.prepare)
+    compact: bool = False,            # int8 paths, scored in column chunks (see batch_summary)
+    dtype: str = "float64",           # "float32": pnl / metrics in float32 (see batch_pnl)
+    chunk: int | None = None,         # paths per scoring call (default 256 when compact)
+    lag_grid = (0,),                  # execution lags (see PairsZScoreOnlyStrategy.execution_lag)
+    fill: str = "close",              # "close" or "open" (needs opens)
+    opens: pd.DataFrame | None = None,
+    fill_cap: pd.Series | float | None = None,   # partial fills (see PairsZScoreOnlyStrategy.prepare)
+    verbose: bool = False,
 ) -> pd.DataFrame:
-    rows = []
+    """
+    Grid search over entry/exit thresholds and stops.
+
+    Beta and z do not depend on the grid, so they are prepared once. Many combos
+    end up with exactly the same position path (e.g. every take-profit above the
+    largest open return), so each path is hashed and evaluated only once: the
+    unique paths are stacked into a (bars x paths) matrix and scored with a single
+    models.metrics.performance_summary call (or a few column chunks of it).
+    Lags in lag_grid are scored on the same prepared z / beta and, for lags >= 1, on the
+    same target paths (the execution model is only a shift / capped fill of them).
+    Evaluation counts are stored in df.attrs["evaluations"].
+    """
+    strat = None
+    prepared = None
+    combos = []                      # (entry_z, exit_z, sl, tp, lag, path index)
+    path_index: Dict[bytes, int] = {}
+    paths = []
+    # stops mark trades from the signal close once there is a lag, so targets are built
+    # once for lag 0 and once for all lags >= 1
+    marks = sorted({lag > 0 for lag in lag_grid})
     for entry_z, exit_z in itertools.product(entry_grid, exit_grid):
         if not (exit_z < entry_z):  # valid hysteresis
             continue
-        for sl, tp in itertools.product(sl_grid, tp_grid):
+        for (sl, tp), marked in itertools.product(itertools.product(sl_grid, tp_grid), marks):
             if sl is not None and tp is not None and sl >= tp:
                 continue
             strat = StrategyClass(
                 stock1=s1, stock2=s2,
                 entry_z=entry_z, exit_z=exit_z,
                 tx_cost_per_leg=tx_cost_per_leg,
-                use_rolling_z=use_rolling_z, z_window=z_window
+                use_rolling_z=use_rolling_z, z_window=z_window,
+                hedge_mode=hedge_mode, beta_window=beta_window,
+                compact=compact, dtype=dtype, fill=fill, execution_lag=int(marked),
             )
-            res = strat.execute(
-                data=prices,
+            if prepared is None:
+                prepared = strat.prepare(prices, costs=costs, opens=opens, fill_cap=fill_cap)
+            pos = strat.build_positions(
+                prepared,
                 stop_loss_pct=sl,
                 take_profit_pct=tp,
                 max_bars_in_trade=max_bars_in_trade,
-            )
-            st = res["stats"]
-            sharpe = st["sharpe_daily"]
-            retpct = st["total_return_%"]
-            ddpct  = st["max_drawdown_%"]
-            trades = st["number_of_position_changes"]
-
-            if objective == "sharpe":
-                score = sharpe
-            elif objective == "return":
-                score = retpct
-            else:  # sharpe_penalized
-                # penalty if drawdown exceeds dd_limit_pct
-                penalty = max(0.0, (ddpct - dd_limit_pct) / 10.0)
-                score = sharpe - penalty
-
-            rows.append({
-                "entry_z": entry_z, "exit_z": exit_z,
-                "stop_loss_pct": sl, "take_profit_pct": tp,
-                "z_window": z_window, "use_rolling_z": use_rolling_z,
-                "sharpe": sharpe, "total_return_%": retpct,
-                "max_drawdown_%": ddpct, "number_of_position_changes": trades,
-                "score": score,
-            })
+            )["positions"]
+            key = _positions_digest(pos)
+            if key not in path_index:
+                path_index[key] = len(paths)
+                paths.append(pos.to_numpy())
+            combos.extend((entry_z, exit_z, sl, tp, lag, path_index[key])
+                          for lag in lag_grid if (lag > 0) == marked)
+
+    if not combos:
+        raise RuntimeError("No parameter combinations evaluated (check grids/constraints).")
+
+    n_paths = len(paths)
+    pos_matrix = np.column_stack(paths)
+    paths.clear()
+    chunk = 256 if compact and chunk is None else chunk
+    summaries = {}                   # lag -> (summary of its paths, path index -> column)
+    n_scored = 0                     # a path is scored once per lag it is used with
+    for lag in lag_grid:
+        cols = sorted({c[5] for c in combos if c[4] == lag})
+        summaries[lag] = (strat.batch_summary(prepared, pos_matrix[:, cols], chunk=chunk, lag=lag),
+                          {j: i for i, j in enumerate(cols)})
+        n_scored += len(cols)
+
+    rows = []
+    for entry_z, exit_z, sl, tp, lag, path in combos:
+        summary, col = summaries[lag]
+        j = col[path]
+        sharpe = float(summary["sharpe"][j])
+        retpct = float(summary["total_return"][j]) * 100.0
+        ddpct  = float(summary["max_drawdown"][j]) * 100.0
+        trades = int(summary["turnover"][j])
+
+        if objective == "sharpe":
+            score = sharpe
+        elif objective == "return":
+            score = retpct
+        else:  # sharpe_penalized
+            # penalty if drawdown exceeds dd_limit_pct
+            penalty = max(0.0, (ddpct - dd_limit_pct) / 10.0)
+            score = sharpe - penalty
+
+        rows.append({
+            "entry_z": entry_z, "exit_z": exit_z,
+            "stop_loss_pct": sl, "take_profit_pct": tp,
+            "z_window": z_window, "use_rolling_z": use_rolling_z, "execution_lag": lag,
+            "sharpe": sharpe, "total_return_%": retpct,
+            "max_drawdown_%": ddpct, "number_of_position_changes": trades,
+            "score": score,
+        })
 
     df = pd.DataFrame(rows)
-    if df.empty:
-        raise RuntimeError("No parameter combinations evaluated (check grids/constraints).")
     df = df.sort_values(by=["score", "sharpe", "total_return_%"], ascending=[False, False, False]).reset_index(drop=True)
-    return df
\ No newline at end of file
+    df.attrs["evaluations"] = {
+        "combos": len(combos),
+        "unique_paths": n_paths,
+        "scored": n_scored,
+        "skipped": len(combos) - n_scored,
+    }
+    if verbose:
+        ev = df.attrs["evaluations"]
+        print(f"[grid] {ev['combos']} combos, {ev['unique_paths']} unique position paths, "
+              f"{ev['skipped']} evaluations skipped")
+    return df
@@ -0,0 +1,358 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping
+import numpy as np
+import pandas as pd
+
+# Backtest results store: compare runs without re-running them.
+#
+#   <root>/index.sqlite                     runs (pair, params, data fingerprint, code version,
+#                                           headline stats as columns) + sweeps
+#   <root>/series/pair=A_B/<sha>.parquet    date | position (int8; float32 with partial
+#                                           fills) | pnl | equity, one row
+#                                           group per quarter so date filters skip row groups
+#   <root>/trades/<sha>.parquet             trade tables (build_trade_table)
+#   <root>/sweeps/<sha>.parquet             sweep DataFrames (grid_search_pairs_params, sweep_queue)
+#
+# Files are named by the hash of their content, so identical series / tables (the same
+# path reached by different params, or a run stored twice) are written once. A run id is
+# the hash of (strategy, pair, params, data fingerprint, code version): adding the same
+# run again replaces its index row.
+
+RESULTS_ROOT = Path(".results")
+ROW_GROUP_BARS = 63                   # ~ one quarter of daily bars
+STAT_COLUMNS = {                      # stats key -> index column
+    "sharpe_annual": "sharpe_annual",
+    "sortino_annual": "sortino_annual",
+    "calmar": "calmar",
+    "total_return_%": "total_return_pct",
+    "max_drawdown_%": "max_drawdown_pct",
+    "n_trades": "n_trades",
+    "positive_trade_rate": "positive_trade_rate",
+    "exposure": "exposure",
+}
+SERIES_COLUMNS = ("position", "pnl", "equity")
+
+
+def _sha(*parts: bytes | str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode() if isinstance(p, str) else p)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def data_fingerprint(prices: pd.DataFrame | pd.Series) -> str:
+    """Hash of the price data a run was computed on (values, index and columns)."""
+    cols = prices.columns if isinstance(prices, pd.DataFrame) else [prices.name]
+    return _sha(json.dumps([str(c) for c in cols]),
+                pd.util.hash_pandas_object(prices, index=True).to_numpy().tobytes())[:32]
+
+
+def code_version(cwd: str | Path | None = None) -> str | None:
+    """git commit of the working tree ('-dirty' if modified), None outside a repository."""
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty", "--abbrev=12"], cwd=cwd,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.stdout.strip() or None
+
+
+def _frame_digest(df: pd.DataFrame) -> str:
+    return _sha(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes(),
+                json.dumps([str(c) for c in df.columns]))
+
+
+def _json_default(v):
+    if isinstance(v, (np.integer, np.floating)):
+        return v.item()
+    if isinstance(v, pd.Timestamp):
+        return str(v)
+    raise TypeError(f"not JSON serialisable: {type(v).__name__}")
+
+
+def _position_column(pos: np.ndarray) -> np.ndarray:
+    # -1/0/+1 paths as int8; fractional exposures (partial fills) keep their value
+    pos = np.asarray(pos, dtype=float)
+    return pos.astype(np.int8) if np.array_equal(pos, np.round(pos)) else pos.astype(np.float32)
+
+
+class ResultsStore:
+    def __init__(self, root: str | Path = RESULTS_ROOT, timeout: float = 60.0):
+        self.root = Path(root)
+        for sub in ("series", "trades", "sweeps"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "index.sqlite"
+        self.timeout = timeout
+        stat_cols = ", ".join(f"{c} REAL" for c in STAT_COLUMNS.values())
+        with self._connect() as con:
+            con.executescript(f"""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY, created REAL, strategy TEXT,
+                    stock1 TEXT, stock2 TEXT, pair TEXT, params TEXT,
+                    data_fp TEXT, code_version TEXT, start TEXT, end TEXT, n_bars INTEGER,
+                    series TEXT, trades TEXT, stats TEXT, tags TEXT, {stat_cols});
+                CREATE INDEX IF NOT EXISTS runs_pair ON runs (pair, created);
+                CREATE TABLE IF NOT EXISTS sweeps (
+                    name TEXT PRIMARY KEY, created REAL, pair TEXT, spec TEXT,
+                    data_fp TEXT, code_version TEXT, path TEXT, n_rows INTEGER);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=DELETE")
+            yield con
+        finally:
+            con.close()
+
+    # ---- content-addressed files
+    def _write_once(self, df: pd.DataFrame, path: Path, **kwargs) -> None:
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        df.to_parquet(tmp, index=False, **kwargs)
+        os.replace(tmp, path)
+
+    def _put_series(self, pair: str, positions: pd.Series, pnl: pd.Series, equity: pd.Series | None) -> str:
+        equity = (1.0 + pnl).cumprod() if equity is None else equity
+        df = pd.DataFrame({
+            "date": pd.DatetimeIndex(positions.index).as_unit("ns"),
+            "position": _position_column(positions.to_numpy()),
+            "pnl": pnl.to_numpy(dtype=float),
+            "equity": equity.to_numpy(dtype=float),
+        })
+        rel = Path("series") / f"pair={pair.replace('/', '_')}" / f"{_frame_digest(df)}.parquet"
+        self._write_once(df, self.root / rel, row_group_size=ROW_GROUP_BARS)
+        return str(rel)
+
+    def _put_table(self, kind: str, df: pd.DataFrame) -> str:
+        if any(n is not None for n in df.index.names):
+            df = df.reset_index()            # keep a named index (e.g. trade start) as a column
+        rel = Path(kind) / f"{_frame_digest(df)}.parquet"
+        self._write_once(df, self.root / rel)
+        return str(rel)
+
+    # ---- writing
+    def add_run(
+        self,
+        result: Mapping[str, Any],
+        pair: tuple[str, str],
+        params: Dict[str, Any],
+        data: pd.DataFrame | None = None,
+        data_fp: str | None = None,
+        trades: pd.DataFrame | None = None,
+        strategy: str = "PairsZScoreOnlyStrategy",
+        version: str | None = None,
+        tags: Dict[str, Any] | None = None,
+    ) -> str:
+        """
+        Store one backtest: result is execute()'s output (or any mapping with
+        'positions', 'pnl', 'stats' and optionally 'equity'). The data fingerprint comes
+        from `data` (the prices the run used) or `data_fp`; version defaults to the git
+        commit. Returns the run id.
+        """
+        if data_fp is None:
+            if data is None:
+                raise ValueError("add_run needs the run's price data or its data_fp")
+            data_fp = data_fingerprint(data)
+        version = code_version() if version is None else version
+        s1, s2 = pair
+        name = f"{s1}/{s2}"
+        params_json = json.dumps(params, sort_keys=True, default=_json_default)
+        run_id = _sha(strategy, name, params_json, data_fp, str(version))[:24]
+
+        positions, pnl = result["positions"], result["pnl"]
+        equity = result.get("equity")
+        stats = dict(result["stats"])
+        series = self._put_series(name, positions, pnl, equity)
+        trades_rel = None if trades is None else self._put_table("trades", trades)
+
+        idx = pd.DatetimeIndex(positions.index)
+        row = {
+            "run_id": run_id, "created": time.time(), "strategy": strategy,
+            "stock1": s1, "stock2": s2, "pair": name, "params": params_json,
+            "data_fp": data_fp, "code_version": version,
+            "start": str(idx.min().date()) if len(idx) else None, "end": str(idx.max().date()) if len(idx) else None,
+            "n_bars": int(len(idx)), "series": series, "trades": trades_rel,
+            "stats": json.dumps(stats, default=_json_default), "tags": json.dumps(tags or {}, default=_json_default),
+            **{col: (None if stats.get(k) is None else float(stats[k])) for k, col in STAT_COLUMNS.items()},
+        }
+        with self._connect() as con:
+            con.execute(f"INSERT OR REPLACE INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                        list(row.values()))
+        return run_id
+
+    def add_sweep(self, name: str, table: pd.DataFrame, pair: tuple[str, str] | None = None,
+                  spec: Dict[str, Any] | None = None, data_fp: str | None = None,
+                  version: str | None = None) -> str:
+        """Store a sweep DataFrame under `name` (replacing an earlier one of that name)."""
+        rel = self._put_table("sweeps", table)
+        with self._connect() as con:
+            con.execute("INSERT OR REPLACE INTO sweeps VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (name, time.time(), None if pair is None else "/".join(pair),
+                         json.dumps(spec or {}, sort_keys=True, default=_json_default), data_fp,
+                         code_version() if version is None else version, rel, int(len(table))))
+        return rel
+
+    # ---- querying
+    def runs(
+        self,
+        pair: str | tuple[str, str] | None = None,
+        since: str | pd.Timestamp | None = None,
+        until: str | pd.Timestamp | None = None,
+        where: Dict[str, Any] | None = None,
+        order_by: str = "sharpe_annual",
+        ascending: bool = False,
+        top: int | None = None,
+        params: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Run index filtered in SQL: pair ('A/B' or tuple), runs stored since/until a date,
+        `where` = {index column: value} (e.g. data_fp, code_version, strategy) and
+        {"params.<key>": value} on the run parameters. Sorted by any index column.
+        """
+        cond, args = [], []
+        if pair is not None:
+            cond.append("pair = ?")
+            args.append(pair if isinstance(pair, str) else "/".join(pair))
+        if since is not None:
+            cond.append("created >= ?")
+            args.append(pd.Timestamp(since).timestamp())
+        if until is not None:
+            cond.append("created < ?")
+            args.append(pd.Timestamp(until).timestamp())
+        for k, v in (where or {}).items():
+            if k.startswith("params."):
+                cond.append("json_extract(params, ?) = ?")
+                args += [f"$.{k[len('params.'):]}", v]
+            else:
+                cond.append(f"{self._column(k)} = ?")
+                args.append(v)
+        sql = "SELECT * FROM runs"
+        if cond:
+            sql += " WHERE " + " AND ".join(cond)
+        sql += f" ORDER BY {self._column(order_by)} IS NULL, {self._column(order_by)} {'ASC' if ascending else 'DESC'}"
+        if top is not None:
+            sql += f" LIMIT {int(top)}"
+        with self._connect() as con:
+            out = pd.read_sql_query(sql, con, params=args)
+        out["created"] = pd.to_datetime(out["created"], unit="s")
+        if params and len(out):
+            out = out.join(pd.json_normalize([json.loads(p) for p in out["params"]]).add_prefix("params."))
+        return out.set_index("run_id")
+
+    def _column(self, name: str) -> str:
+        with self._connect() as con:
+            cols = {r[1] for r in con.execute("PRAGMA table_info(runs)")}
+        name = STAT_COLUMNS.get(name, name)
+        if name not in cols:
+            raise ValueError(f"unknown run column {name!r}; known: {sorted(cols)}")
+        return name
+
+    def top(self, n: int = 10, by: str = "sharpe_annual", **filters) -> pd.DataFrame:
+        """Top-n runs by a stat (see runs for the filters)."""
+        return self.runs(order_by=by, top=n, **filters)
+
+    def series(
+        self,
+        run_ids: str | Iterable[str],
+        column: str = "equity",
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> pd.DataFrame:
+        """
+        (dates x runs) matrix of one series column. Only that column and the row groups
+        overlapping [start, end] are read; runs sharing a series file read it once.
+        """
+        import pyarrow.parquet as pq  # deferred
+        if column not in SERIES_COLUMNS:
+            raise ValueError(f"column must be one of {SERIES_COLUMNS}")
+        run_ids = [run_ids] if isinstance(run_ids, str) else list(run_ids)
+        with self._connect() as con:
+            rows = con.execute(f"SELECT run_id, series FROM runs WHERE run_id IN ({', '.join('?' * len(run_ids))})",
+                               run_ids).fetchall()
+        files = dict(rows)
+        missing = [r for r in run_ids if r not in files]
+        if missing:
+            raise KeyError(f"unknown runs: {missing}")
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("date", "<=", pd.Timestamp(end)))
+        read: Dict[str, pd.Series] = {}
+        for rel in dict.fromkeys(files.values()):
+            t = pq.read_table(self.root / rel, columns=["date", column], filters=filters or None)
+            read[rel] = t.to_pandas().set_index("date")[column]
+        return pd.DataFrame({r: read[files[r]] for r in run_ids})
+
+    def trades(self, run_id: str) -> pd.DataFrame | None:
+        with self._connect() as con:
+            row = con.execute("SELECT trades FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"unknown run {run_id!r}")
+        return None if row[0] is None else pd.read_parquet(self.root / row[0])
+
+    def stats(self, run_id: str) -> Dict[str, Any]:
+        with self._connect() as con:
+            row = con.execute("SELECT stats FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"unknown run {run_id!r}")
+        return json.loads(row[0])
+
+    def sweep(self, name: str, columns: List[str] | None = None) -> pd.DataFrame:
+        with self._connect() as con:
+            row = con.execute("SELECT path FROM sweeps WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"unknown sweep {name!r}")
+        return pd.read_parquet(self.root / row[0], columns=columns)
+
+    def usage(self) -> Dict[str, Any]:
+        """Runs vs distinct series files (deduplication) and bytes on disk."""
+        with self._connect() as con:
+            n_runs, n_series = con.execute("SELECT COUNT(*), COUNT(DISTINCT series) FROM runs").fetchone()
+        files = [p for sub in ("series", "trades", "sweeps") for p in (self.root / sub).rglob("*.parquet")]
+        return {"runs": n_runs, "series_files": n_series,
+                "bytes": int(sum(p.stat().st_size for p in files)) + self.db_path.stat().st_size}
+
+
+if __name__ == "__main__":
+    import argparse
+    cli = argparse.ArgumentParser(description="Query the backtest results store.")
+    cli.add_argument("--root", default=str(RESULTS_ROOT))
+    sub = cli.add_subparsers(dest="cmd", required=True)
+    p_top = sub.add_parser("top", help="top-N runs by a stat")
+    p_top.add_argument("-n", type=int, default=10)
+    p_top.add_argument("--by", default="sharpe_annual")
+    p_top.add_argument("--asc", action="store_true")
+    p_top.add_argument("--pair")
+    p_top.add_argument("--since", help="runs stored on/after this date")
+    p_series = sub.add_parser("series", help="export a series column of some runs")
+    p_series.add_argument("run_ids", nargs="+")
+    p_series.add_argument("--column", default="equity", choices=SERIES_COLUMNS)
+    p_series.add_argument("--out", required=True, help=".parquet or .csv")
+    sub.add_parser("usage", help="runs, distinct series files and bytes on disk")
+    args = cli.parse_args()
+
+    store = ResultsStore(args.root)
+    if args.cmd == "top":
+        cols = ["pair", "created", "start", "end", *STAT_COLUMNS.values()]
+        out = store.top(args.n, by=args.by, ascending=args.asc, pair=args.pair, since=args.since)
+        print(out[cols + [c for c in out.columns if c.startswith("params.")]].to_string())
+    elif args.cmd == "series":
+        df = store.series(args.run_ids, column=args.column)
+        df.to_csv(args.out) if args.out.endswith(".csv") else df.to_parquet(args.out)
+        print(f"[results] {df.shape[1]} runs x {len(df)} bars -> {args.out}")
+    else:
+        print(store.usage())
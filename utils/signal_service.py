@@ -0,0 +1,347 @@
+from __future__ import annotations
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+
+# Local signal service: current z, position and open trade for many pairs.
+#
+# PairState holds the PairsZScoreOnlyStrategy state of every pair in arrays and advances
+# all pairs by one bar at a time (rolling z on a ring buffer, carried position, stops,
+# open-trade compounding), so a new bar costs O(pairs) and a query is an array gather.
+# The hedge ratio is the static OLS beta of the history the state was warmed on (as in
+# execute(), but frozen afterwards); use_rolling_z=True is required since a full-sample
+# z cannot be updated bar by bar. execution_lag delays the held position behind the
+# target as in execute() (close fills; partial fills are not modelled).
+#
+# SignalService serves it over HTTP/1.1 on TCP or a Unix socket with asyncio streams:
+#   GET  /signal?pair=A/B[&pair=C/D]   POST /signals {"pairs": [...]}   (micro-batched)
+#   POST /ingest {"date": "...", "prices": {ticker: close}}
+#   GET  /pairs   GET /metrics   GET /health
+# SignalClient is a small keep-alive client for the same protocol.
+
+
+class PairState:
+    def __init__(self, prices: pd.DataFrame, pairs: Iterable[tuple[str, str]], entry_z: float = 2.0,
+                 exit_z: float = 0.5, tx_cost_per_leg: float = 0.0005, z_window: int = 60,
+                 stop_loss_pct: float | None = None, take_profit_pct: float | None = None,
+                 max_bars_in_trade: int | None = None, use_rolling_z: bool = True, execution_lag: int = 0):
+        if not use_rolling_z:
+            raise ValueError("PairState needs use_rolling_z=True (full-sample z is not incremental)")
+        if int(execution_lag) < 0:
+            raise ValueError(f"execution lag must be >= 0, got {execution_lag}")
+        self.execution_lag = int(execution_lag)
+        self.pairs = [tuple(p) for p in pairs]
+        self.tickers = list(dict.fromkeys(t for p in self.pairs for t in p))
+        self.entry_z, self.exit_z = entry_z, exit_z
+        self.unit_cost = 2 * tx_cost_per_leg
+        self.z_window = z_window
+        self.stop_loss_pct, self.take_profit_pct, self.max_bars_in_trade = stop_loss_pct, take_profit_pct, max_bars_in_trade
+        self.index = {f"{a}/{b}": i for i, (a, b) in enumerate(self.pairs)}
+        pos = {t: i for i, t in enumerate(self.tickers)}
+        self._ia = np.array([pos[a] for a, _ in self.pairs])
+        self._ib = np.array([pos[b] for _, b in self.pairs])
+        self.warm(prices)
+
+    def _static_beta(self, px: np.ndarray) -> np.ndarray:
+        # OLS slope of y on (1, x) per pair over the bars where both legs are present
+        y, x = px[:, self._ia], px[:, self._ib]
+        m = np.isfinite(y) & np.isfinite(x)
+        n = m.sum(0)
+        y, x = np.where(m, y, 0.0), np.where(m, x, 0.0)
+        sx, sy = x.sum(0), y.sum(0)
+        return (n * (x * y).sum(0) - sx * sy) / (n * (x * x).sum(0) - sx * sx)
+
+    def warm(self, prices: pd.DataFrame) -> None:
+        """Reset and replay `prices` (beta fitted on the same window)."""
+        P, W = len(self.pairs), self.z_window
+        px = prices[self.tickers].to_numpy(dtype=float)
+        self.beta = self._static_beta(px)
+        self.buf = np.full((P, W), np.nan)       # last W spreads
+        self.nbuf = np.zeros(P, np.int64)
+        self.ptr = np.zeros(P, np.int64)
+        self.last = np.full((P, 2), np.nan)      # last joint prices
+        self.z = np.full(P, np.nan)
+        self.last_raw = np.zeros(P, np.int64)    # last non-zero entry signal
+        self.pos0 = np.zeros(P, np.int64)        # position before stops
+        self.block_cum = np.ones(P)              # gross compounding of the pos0 block (stops)
+        self.block_bars = np.zeros(P, np.int64)
+        self.target = np.zeros(P, np.int64)      # position after stops, decided on this bar's close
+        self.queued = np.zeros((P, self.execution_lag), np.int64)   # targets not filled yet, oldest first
+        self.pos = np.zeros(P, np.int64)         # held position
+        self.trade_cum = np.ones(P)              # net compounding of the open trade
+        self.trade_since = np.full(P, np.datetime64("NaT"), dtype="datetime64[ns]")
+        self.bar_time = np.full(P, np.datetime64("NaT"), dtype="datetime64[ns]")
+        self.n_bars = 0
+        for ts, row in zip(pd.DatetimeIndex(prices.index), px):
+            self._step(np.datetime64(ts, "ns"), row)
+
+    def ingest(self, ts, prices: Dict[str, float]) -> int:
+        """Advance all pairs by one bar; returns the number of pairs updated."""
+        row = np.array([prices.get(t, np.nan) for t in self.tickers], dtype=float)
+        return self._step(np.datetime64(pd.Timestamp(ts), "ns"), row)
+
+    def _step(self, ts: np.datetime64, row: np.ndarray) -> int:
+        y, x = row[self._ia], row[self._ib]
+        r = np.flatnonzero(np.isfinite(y) & np.isfinite(x))
+        if r.size == 0:
+            return 0
+        y, x, beta = y[r], x[r], self.beta[r]
+
+        # pair return over the bar (0 on the first joint bar, like pct_change().fillna(0))
+        ly, lx = self.last[r, 0], self.last[r, 1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pair_ret = np.nan_to_num((y / ly - 1.0) - beta * (x / lx - 1.0))
+
+        # rolling z of the spread: window z_window, min_periods z_window // 2, ddof=0
+        W = self.z_window
+        self.buf[r, self.ptr[r]] = y - beta * x
+        self.ptr[r] = (self.ptr[r] + 1) % W
+        self.nbuf[r] = np.minimum(self.nbuf[r] + 1, W)
+        win = self.buf[r]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = ((y - beta * x) - np.nanmean(win, axis=1)) / np.nanstd(win, axis=1)
+        z = np.where(self.nbuf[r] >= W // 2, z, np.nan)
+
+        # carried signal (PairsZScoreOnlyStrategy.build_positions): last entry signal,
+        # zeroed while |z| <= exit_z
+        raw = np.where(z >= self.entry_z, -1, np.where(z <= -self.entry_z, 1, 0))
+        last_raw = np.where(raw != 0, raw, self.last_raw[r])
+        pos0 = np.where(np.abs(z) <= self.exit_z, 0, last_raw)
+
+        # stops on the pos0 block (gross open return since entry; with an execution lag
+        # marked from the signal close, as build_positions)
+        new_block = (pos0 != 0) & (self.pos0[r] == 0)
+        marked = self.pos0[r] if self.execution_lag else pos0
+        block_cum = np.where(new_block, 1.0, self.block_cum[r]) * (1.0 + marked * pair_ret)
+        block_cum = np.where(pos0 != 0, block_cum, 1.0)
+        block_bars = np.where(pos0 != 0, np.where(new_block, 0, self.block_bars[r]) + 1, 0)
+        open_ret = block_cum - 1.0
+        hit = np.zeros(r.size, dtype=bool)
+        if self.stop_loss_pct is not None:
+            hit |= open_ret <= -float(self.stop_loss_pct)
+        if self.take_profit_pct is not None:
+            hit |= open_ret >= float(self.take_profit_pct)
+        if self.max_bars_in_trade is not None:
+            hit |= block_bars >= int(self.max_bars_in_trade)
+        target = np.where(hit & (pos0 != 0), 0, pos0)
+
+        # held position: the target of execution_lag joint bars earlier
+        if self.execution_lag:
+            q = self.queued[r]
+            pos = q[:, 0]
+            self.queued[r] = np.column_stack([q[:, 1:], target])
+        else:
+            pos = target
+
+        # net pnl and the open trade of the held position
+        prev = self.pos[r]
+        pnl = pos * pair_ret - np.abs(pos - prev) * self.unit_cost
+        entry = (pos != 0) & (prev == 0)
+        self.trade_cum[r] = np.where(pos != 0, np.where(entry, 1.0, self.trade_cum[r]) * (1.0 + pnl), 1.0)
+        self.trade_since[r] = np.where(entry, ts, np.where(pos != 0, self.trade_since[r], np.datetime64("NaT")))
+
+        self.last[r] = np.column_stack([y, x])
+        self.z[r], self.last_raw[r], self.pos0[r], self.pos[r] = z, last_raw, pos0, pos
+        self.target[r] = target
+        self.block_cum[r], self.block_bars[r] = block_cum, block_bars
+        self.bar_time[r] = ts
+        self.n_bars += 1
+        return int(r.size)
+
+    def snapshot(self, idx: np.ndarray) -> List[Dict[str, Any]]:
+        """State of the pairs at positions idx (one vectorized gather)."""
+        z = self.z[idx]
+        z = np.where(np.isfinite(z), z, np.nan).tolist()
+        pos, beta, last = self.pos[idx].tolist(), self.beta[idx].tolist(), self.last[idx].tolist()
+        target = self.target[idx].tolist()
+        unreal = ((self.trade_cum[idx] - 1.0) * 100.0).tolist()
+        since = np.datetime_as_string(self.trade_since[idx], unit="s").tolist()
+        bar = np.datetime_as_string(self.bar_time[idx], unit="s").tolist()
+        out = []
+        for k, i in enumerate(idx.tolist()):
+            a, b = self.pairs[i]
+            out.append({"pair": f"{a}/{b}", "bar": bar[k], "beta": beta[k],
+                        "z": None if z[k] != z[k] else z[k], "position": pos[k], "target": target[k],
+                        "last_prices": {a: last[k][0], b: last[k][1]},
+                        "open_trade": None if pos[k] == 0 else
+                        {"since": since[k], "position": pos[k], "unrealized_return_%": unreal[k]}})
+        return out
+
+
+class SignalService:
+    def __init__(self, state: PairState, max_batch: int = 512, batch_window_ms: float = 0.0,
+                 latency_samples: int = 10_000):
+        self.state = state
+        self.max_batch = max_batch
+        self.batch_window = batch_window_ms / 1000.0
+        self._queue: asyncio.Queue | None = None
+        self._lat = deque(maxlen=latency_samples)
+        self._handlers: dict = {}
+        self.counters = {"requests": 0, "signals": 0, "batches": 0, "batched_requests": 0, "ingests": 0, "errors": 0}
+        self.started = time.time()
+
+    # ---- micro-batching of signal lookups
+    async def _batcher(self) -> None:
+        while True:
+            items = [await self._queue.get()]
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            while len(items) < self.max_batch and not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            idx = np.unique(np.concatenate([i for i, _ in items]))
+            snap = dict(zip(idx.tolist(), self.state.snapshot(idx)))
+            for i, fut in items:
+                if not fut.done():
+                    fut.set_result([snap[j] for j in i.tolist()])
+            self.counters["batches"] += 1
+            self.counters["batched_requests"] += len(items)
+
+    async def signals(self, names: List[str]) -> List[Dict[str, Any]]:
+        missing = [n for n in names if n not in self.state.index]
+        if missing:
+            raise KeyError(f"unknown pairs: {missing}")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((np.array([self.state.index[n] for n in names], dtype=np.int64), fut))
+        self.counters["signals"] += len(names)
+        return await fut
+
+    def metrics(self) -> Dict[str, Any]:
+        lat = np.array(self._lat) * 1000.0 if self._lat else np.array([np.nan])
+        up = time.time() - self.started
+        return {
+            **self.counters,
+            "uptime_s": up,
+            "requests_per_s": self.counters["requests"] / up if up > 0 else 0.0,
+            "avg_batch_size": self.counters["batched_requests"] / max(self.counters["batches"], 1),
+            "latency_ms": {"p50": float(np.nanpercentile(lat, 50)), "p99": float(np.nanpercentile(lat, 99)),
+                           "max": float(np.nanmax(lat))},
+            "pairs": len(self.state.pairs), "bars": self.state.n_bars,
+        }
+
+    # ---- HTTP
+    async def _route(self, method: str, target: str, body: bytes) -> tuple[int, Any]:
+        url = urlsplit(target)
+        if method == "GET" and url.path == "/signal":
+            names = parse_qs(url.query).get("pair", [])
+            return 200, await self.signals(names)
+        if method == "POST" and url.path == "/signals":
+            return 200, await self.signals(json.loads(body or b"{}").get("pairs", []))
+        if method == "POST" and url.path == "/ingest":
+            msg = json.loads(body)
+            updated = self.state.ingest(msg["date"], msg["prices"])
+            self.counters["ingests"] += 1
+            return 200, {"updated_pairs": updated}
+        if method == "GET" and url.path == "/pairs":
+            return 200, list(self.state.index)
+        if method == "GET" and url.path == "/metrics":
+            return 200, self.metrics()
+        if method == "GET" and url.path == "/health":
+            return 200, {"ok": True}
+        return 404, {"error": f"no route {method} {url.path}"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._handlers[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (h := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                t0 = time.perf_counter()
+                self.counters["requests"] += 1
+                try:
+                    status, payload = await self._route(method, target, body)
+                except (KeyError, ValueError) as ex:
+                    self.counters["errors"] += 1
+                    status, payload = 400, {"error": str(ex)}
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'ERROR'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                self._lat.append(time.perf_counter() - t0)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, unix_path: str | None = None):
+        """Start listening; returns the asyncio server (call serve_forever() or close())."""
+        self._queue = asyncio.Queue()
+        self._batch_task = asyncio.create_task(self._batcher())
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self._handle, path=unix_path)
+        return await asyncio.start_server(self._handle, host=host, port=port)
+
+    async def stop(self, server) -> None:
+        """Close the listener, open connections and the batcher."""
+        server.close()
+        handlers = dict(self._handlers)
+        for writer in handlers.values():
+            writer.close()                  # handlers see EOF and return
+        if handlers:
+            await asyncio.wait(list(handlers), timeout=1.0)
+        self._batch_task.cancel()
+        await asyncio.gather(self._batch_task, return_exceptions=True)
+        await server.wait_closed()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, unix_path: str | None = None) -> None:
+        server = await self.start(host, port, unix_path)
+        print(f"[service] {len(self.state.pairs)} pairs on {unix_path or f'http://{host}:{port}'}")
+        async with server:
+            await server.serve_forever()
+
+
+class SignalClient:
+    """Keep-alive client for SignalService (TCP or Unix socket)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, unix_path: str | None = None):
+        self.host, self.port, self.unix_path = host, port, unix_path
+        self._rw = None
+
+    async def _conn(self):
+        if self._rw is None:
+            self._rw = (await asyncio.open_unix_connection(self.unix_path) if self.unix_path
+                        else await asyncio.open_connection(self.host, self.port))
+        return self._rw
+
+    async def request(self, method: str, path: str, payload: Any = None) -> Any:
+        reader, writer = await self._conn()
+        body = b"" if payload is None else json.dumps(payload).encode()
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: local\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (h := await reader.readline()) not in (b"\r\n", b""):
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        data = json.loads(await reader.readexactly(int(headers["content-length"])))
+        if status != 200:
+            raise RuntimeError(f"{status}: {data.get('error')}")
+        return data
+
+    async def signals(self, pairs: List[str]) -> List[Dict[str, Any]]:
+        return await self.request("POST", "/signals", {"pairs": list(pairs)})
+
+    async def ingest(self, date, prices: Dict[str, float]) -> Dict[str, Any]:
+        return await self.request("POST", "/ingest", {"date": str(date), "prices": prices})
+
+    async def metrics(self) -> Dict[str, Any]:
+        return await self.request("GET", "/metrics")
+
+    async def close(self) -> None:
+        if self._rw is not None:
+            self._rw[1].close()
+            self._rw = None
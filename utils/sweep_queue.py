@@ -0,0 +1,335 @@
+from __future__ import annotations
+import argparse
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List
+import pandas as pd
+
+# Resumable sweeps on a local work queue.
+#
+#   <root>/queue.sqlite                 sweeps + work units (status, claims, heartbeats)
+#   <root>/<sweep>/inputs/...           shared inputs (e.g. the price panel)
+#   <root>/<sweep>/results/unit-N.parquet  one file per finished unit
+#
+# Workers (processes, or machines sharing the directory) claim a pending unit in an
+# IMMEDIATE transaction, heartbeat while running it, write its result to parquet
+# (tmp + rename) and mark it done. Units whose heartbeat is older than stale_after are
+# handed out again, so a crashed worker only loses the unit it was on.
+# SQLite file locking needs a filesystem with working POSIX locks (local disk, or a
+# network share that supports them); the journal is kept in DELETE mode for that reason.
+
+QUEUE_ROOT = Path(".sweeps")
+
+
+def resolve(path: str) -> Callable:
+    """'package.module:attr' -> object (lets workers find the unit function by name)."""
+    module, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+class SweepQueue:
+    def __init__(self, root: str | Path = QUEUE_ROOT, timeout: float = 60.0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "queue.sqlite"
+        self.timeout = timeout
+        with self._connect() as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS sweeps (
+                    name TEXT PRIMARY KEY, func TEXT NOT NULL, spec TEXT, created REAL);
+                CREATE TABLE IF NOT EXISTS units (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sweep TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT, claimed_at REAL, heartbeat REAL, finished_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0, error TEXT,
+                    result TEXT, n_rows INTEGER,
+                    UNIQUE (sweep, key));
+                CREATE INDEX IF NOT EXISTS units_status ON units (sweep, status);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=DELETE")
+            yield con
+        finally:
+            con.close()
+
+    def sweep_dir(self, sweep: str) -> Path:
+        return self.root / sweep
+
+    # ---- producer side
+    def create_sweep(self, name: str, func: str, units: Iterable[tuple[str, Dict[str, Any]]],
+                     spec: Dict[str, Any] | None = None) -> int:
+        """
+        Register a sweep and its units [(key, payload)], idempotently: re-running with the
+        same keys adds only the new ones. func is 'module:function', called as func(payload)
+        and returning a DataFrame. Returns the number of units added.
+        """
+        rows = [(name, key, json.dumps(payload, sort_keys=True, default=str)) for key, payload in units]
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute("INSERT OR IGNORE INTO sweeps (name, func, spec, created) VALUES (?, ?, ?, ?)",
+                        (name, func, json.dumps(spec or {}, default=str), time.time()))
+            before = con.total_changes
+            con.executemany("INSERT OR IGNORE INTO units (sweep, key, payload) VALUES (?, ?, ?)", rows)
+            added = con.total_changes - before
+            con.execute("COMMIT")
+        (self.sweep_dir(name) / "results").mkdir(parents=True, exist_ok=True)
+        return added
+
+    # ---- worker side
+    def claim(self, sweep: str, worker: str, stale_after: float = 600.0) -> tuple[int, Dict[str, Any]] | None:
+        """Reset stale claims, then take the oldest pending unit. None when nothing is left to claim."""
+        now = time.time()
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute("UPDATE units SET status='pending', worker=NULL "
+                        "WHERE sweep=? AND status='running' AND heartbeat < ?", (sweep, now - stale_after))
+            row = con.execute("SELECT id, payload FROM units WHERE sweep=? AND status='pending' "
+                              "ORDER BY id LIMIT 1", (sweep,)).fetchone()
+            if row is not None:
+                con.execute("UPDATE units SET status='running', worker=?, claimed_at=?, heartbeat=?, "
+                            "attempts=attempts+1, error=NULL WHERE id=?", (worker, now, now, row[0]))
+            con.execute("COMMIT")
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def heartbeat(self, unit_id: int, worker: str) -> None:
+        with self._connect() as con:
+            con.execute("UPDATE units SET heartbeat=? WHERE id=? AND worker=?", (time.time(), unit_id, worker))
+
+    def complete(self, sweep: str, unit_id: int, worker: str, result: pd.DataFrame) -> Path | None:
+        """
+        Write the unit's result (atomic rename) and mark it done, if `worker` still holds
+        the claim. None when the claim went stale and the unit was handed to another
+        worker: its result is dropped instead of overwriting the new claim's.
+        """
+        out = self.sweep_dir(sweep) / "results" / f"unit-{unit_id}.parquet"
+        tmp = out.with_name(f".{out.name}.{worker.replace(':', '_')}.tmp")
+        result.to_parquet(tmp)
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            owned = con.execute("UPDATE units SET status='done', finished_at=?, result=?, n_rows=? "
+                                "WHERE id=? AND worker=? AND status='running'",
+                                (time.time(), str(out.relative_to(self.root)), int(len(result)),
+                                 unit_id, worker)).rowcount
+            if owned:
+                os.replace(tmp, out)   # under the write lock: no other worker can finish this unit now
+            con.execute("COMMIT")
+        if not owned:
+            tmp.unlink(missing_ok=True)
+            return None
+        return out
+
+    def fail(self, unit_id: int, error: str, max_attempts: int = 3, worker: str | None = None) -> None:
+        # with `worker`, only while that worker still holds the claim
+        with self._connect() as con:
+            con.execute("UPDATE units SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                        "worker=NULL, error=? WHERE id=? AND (? IS NULL OR worker=?)",
+                        (max_attempts, error[-2000:], unit_id, worker, worker))
+
+    def retry_failed(self, sweep: str) -> int:
+        with self._connect() as con:
+            return con.execute("UPDATE units SET status='pending', attempts=0 WHERE sweep=? AND status='failed'",
+                               (sweep,)).rowcount
+
+    # ---- reporting
+    def sweeps(self) -> List[str]:
+        with self._connect() as con:
+            return [r[0] for r in con.execute("SELECT name FROM sweeps ORDER BY created")]
+
+    def func_of(self, sweep: str) -> str:
+        with self._connect() as con:
+            row = con.execute("SELECT func FROM sweeps WHERE name=?", (sweep,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown sweep {sweep!r}")
+        return row[0]
+
+    def progress(self, sweep: str) -> Dict[str, Any]:
+        """Unit counts by status, throughput over the finished units and an ETA."""
+        with self._connect() as con:
+            counts = dict(con.execute("SELECT status, COUNT(*) FROM units WHERE sweep=? GROUP BY status", (sweep,)))
+            t0, t1, done = con.execute("SELECT MIN(claimed_at), MAX(finished_at), COUNT(*) FROM units "
+                                       "WHERE sweep=? AND status='done'", (sweep,)).fetchone()
+            workers = con.execute("SELECT COUNT(DISTINCT worker) FROM units WHERE sweep=? AND status='running'",
+                                  (sweep,)).fetchone()[0]
+        total = sum(counts.values())
+        left = counts.get("pending", 0) + counts.get("running", 0)
+        rate = done / (t1 - t0) if done and t1 and t1 > t0 else float("nan")
+        return {
+            "sweep": sweep, "total": total,
+            **{s: counts.get(s, 0) for s in ("pending", "running", "done", "failed")},
+            "done_%": 100.0 * counts.get("done", 0) / total if total else 0.0,
+            "active_workers": workers,
+            "units_per_min": rate * 60.0,
+            "eta_min": left / rate / 60.0 if rate == rate and rate > 0 else float("nan"),
+        }
+
+    def results(self, sweep: str, columns: List[str] | None = None) -> pd.DataFrame:
+        """All finished units' rows in one frame (unit id in column 'unit')."""
+        with self._connect() as con:
+            rows = con.execute("SELECT id, result FROM units WHERE sweep=? AND status='done' ORDER BY id",
+                               (sweep,)).fetchall()
+        frames = [pd.read_parquet(self.root / path, columns=columns).assign(unit=uid) for uid, path in rows]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def run_worker(root: str | Path, sweep: str, worker: str | None = None, max_units: int | None = None,
+               stale_after: float = 600.0, heartbeat_every: float = 30.0, max_attempts: int = 3,
+               verbose: bool = True) -> int:
+    """Claim and run units until the queue is drained (or max_units). Returns units completed."""
+    queue = SweepQueue(root)
+    func = resolve(queue.func_of(sweep))
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    while max_units is None or done < max_units:
+        claimed = queue.claim(sweep, worker, stale_after=stale_after)
+        if claimed is None:
+            break
+        unit_id, payload = claimed
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(heartbeat_every):
+                queue.heartbeat(unit_id, worker)
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        t0 = time.perf_counter()
+        try:
+            result = func(payload)
+            if queue.complete(sweep, unit_id, worker, result) is None:
+                print(f"[sweep warn] {worker} unit {unit_id}: claim went stale, result dropped")
+                continue
+            done += 1
+            if verbose:
+                print(f"[sweep] {worker} unit {unit_id} done in {time.perf_counter() - t0:.1f}s ({len(result)} rows)")
+        except Exception as ex:
+            queue.fail(unit_id, f"{type(ex).__name__}: {ex}", max_attempts=max_attempts, worker=worker)
+            print(f"[sweep warn] {worker} unit {unit_id} failed: {ex}")
+        finally:
+            stop.set()
+            beater.join()
+    return done
+
+
+def run_workers(root: str | Path, sweep: str, processes: int = 2, **kwargs) -> int:
+    """run_worker in `processes` local processes (each one claims independently)."""
+    if processes <= 1:
+        return run_worker(root, sweep, **kwargs)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futs = [pool.submit(run_worker, root, sweep, **kwargs) for _ in range(processes)]
+        return sum(f.result() for f in futs)
+
+
+# ---- pair grid sweeps (utils.report.grid_search_pairs_params, split into units)
+def _save_input(obj: pd.Series | pd.DataFrame, path: Path) -> Dict[str, Any]:
+    # pandas grid kwargs (costs, opens, fill_cap) go to parquet; the payload keeps a reference
+    if not path.exists():
+        (obj.to_frame("value") if isinstance(obj, pd.Series) else obj).to_parquet(path)
+    return {"parquet": str(path), "series": isinstance(obj, pd.Series)}
+
+
+def _load_input(ref: Dict[str, Any]) -> pd.Series | pd.DataFrame:
+    df = pd.read_parquet(ref["parquet"])
+    return df["value"] if ref["series"] else df
+
+
+def pair_grid_unit(payload: Dict[str, Any]) -> pd.DataFrame:
+    """One unit: grid_search_pairs_params for one pair and one chunk of the entry grid."""
+    from utils.report import grid_search_pairs_params
+    prices = pd.read_parquet(payload["prices"], columns=[payload["s1"], payload["s2"]])
+    kwargs = dict(payload["grid"])
+    for k, ref in payload.get("inputs", {}).items():
+        kwargs[k] = _load_input(ref)
+    kwargs["StrategyClass"] = resolve(kwargs.pop("strategy"))
+    df = grid_search_pairs_params(prices=prices, s1=payload["s1"], s2=payload["s2"], **kwargs)
+    ev = df.attrs.get("evaluations", {})
+    return df.assign(pair=f"{payload['s1']}/{payload['s2']}",
+                     unique_paths=ev.get("unique_paths"), combos=ev.get("combos"))
+
+
+def enqueue_pair_grid(
+    queue: SweepQueue,
+    name: str,
+    prices: pd.DataFrame,
+    pairs: Iterable[tuple[str, str]],
+    entry_chunk: int | None = None,
+    strategy: str = "strategies.zscore_only:PairsZScoreOnlyStrategy",
+    **grid: Any,
+) -> int:
+    """
+    Split a multi-pair grid search into units of (pair, entry-grid chunk). The price
+    panel (and any Series / DataFrame argument, e.g. costs or opens) is written once
+    under the sweep directory, by absolute path, and read by every unit.
+    grid: keyword arguments of grid_search_pairs_params (entry_grid, exit_grid, ...);
+    anything else must be JSON-serialisable.
+    """
+    try:
+        json.dumps({k: v for k, v in grid.items() if not isinstance(v, (pd.Series, pd.DataFrame))})
+    except TypeError as ex:
+        raise ValueError(f"grid arguments must be JSON-serialisable or pandas objects: {ex}") from None
+    inputs = (queue.sweep_dir(name) / "inputs").resolve()
+    inputs.mkdir(parents=True, exist_ok=True)
+    prices_path = inputs / "prices.parquet"
+    if not prices_path.exists():
+        prices.to_parquet(prices_path)
+    refs = {k: _save_input(grid.pop(k), inputs / f"{k}.parquet")
+            for k in [k for k, v in grid.items() if isinstance(v, (pd.Series, pd.DataFrame))]}
+
+    entry_grid = tuple(grid.pop("entry_grid", (1.5, 2.0, 2.5, 3.0)))
+    step = entry_chunk or len(entry_grid)
+    units = []
+    for s1, s2 in pairs:
+        for i in range(0, len(entry_grid), step):
+            chunk = entry_grid[i:i + step]
+            payload = {"prices": str(prices_path), "s1": s1, "s2": s2, "inputs": refs,
+                       "grid": {**grid, "entry_grid": list(chunk), "strategy": strategy}}
+            units.append((f"{s1}/{s2}#{i}", payload))
+    return queue.create_sweep(name, "utils.sweep_queue:pair_grid_unit", units,
+                              spec={"strategy": strategy, "entry_grid": list(entry_grid), **grid,
+                                    "inputs": sorted(refs)})
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Resumable sweeps on a local SQLite work queue.")
+    cli.add_argument("--root", default=str(QUEUE_ROOT))
+    sub = cli.add_subparsers(dest="cmd", required=True)
+    p_status = sub.add_parser("status", help="progress and ETA per sweep")
+    p_status.add_argument("sweep", nargs="?")
+    p_work = sub.add_parser("work", help="claim and run units until the sweep is drained")
+    p_work.add_argument("sweep")
+    p_work.add_argument("--processes", type=int, default=1)
+    p_work.add_argument("--max-units", type=int, default=None)
+    p_work.add_argument("--stale-after", type=float, default=600.0)
+    p_retry = sub.add_parser("retry", help="put failed units back in the queue")
+    p_retry.add_argument("sweep")
+    p_res = sub.add_parser("results", help="collect finished units into one file")
+    p_res.add_argument("sweep")
+    p_res.add_argument("--out", required=True, help=".parquet or .csv")
+    args = cli.parse_args()
+
+    q = SweepQueue(args.root)
+    if args.cmd == "status":
+        names = [args.sweep] if args.sweep else q.sweeps()
+        print(pd.DataFrame([q.progress(n) for n in names]).to_string(index=False) if names else "no sweeps")
+    elif args.cmd == "work":
+        n = run_workers(args.root, args.sweep, processes=args.processes,
+                        max_units=args.max_units, stale_after=args.stale_after)
+        print(f"[sweep] {n} units completed")
+    elif args.cmd == "retry":
+        print(f"[sweep] {q.retry_failed(args.sweep)} failed units re-queued")
+    else:
+        df = q.results(args.sweep)
+        df.to_csv(args.out, index=False) if args.out.endswith(".csv") else df.to_parquet(args.out)
+        print(f"[sweep] {len(df)} rows -> {args.out}")